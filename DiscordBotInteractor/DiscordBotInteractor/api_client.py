@@ -1,13 +1,26 @@
 import os
+import time
+import asyncio
 import logging
 import aiohttp
-from typing import Optional, Dict, Any
+from collections import Counter, deque
+from typing import Optional, Dict, Any, List, Tuple
+from circuit_breaker import CircuitBreaker
+from tracing import tracer
 
 logger = logging.getLogger('BotAutomation.APIClient')
 
+# Shown instead of running economy commands while the circuit is open
+ECONOMY_UNAVAILABLE = "🏦 The economy is temporarily unavailable. Please try again in a few minutes."
+
 class UnbelievaBoatAPI:
     BASE_URL = "https://unbelievaboat.com/api"
     API_VERSION = "v1"
+    CONNECT_TIMEOUT = 2.0  # Seconds to open a connection
+    READ_TIMEOUT = 3.0  # Default budget for balance reads
+    WRITE_TIMEOUT = 10.0  # Budget for a write once it has been sent
+    LEADERBOARD_TIMEOUT = 15.0  # Budget for one leaderboard page
+    HEDGE_MIN_SAMPLES = 20  # Balance reads seen before hedging kicks in
 
     def __init__(self):
         self.api_token = os.getenv('UNBELIEVABOAT_API_TOKEN')
@@ -19,54 +32,211 @@ class UnbelievaBoatAPI:
             "Accept": "application/json"
         }
 
-    async def remove_money(self, guild_id: str, user_id: str, amount: int) -> Optional[Dict[str, Any]]:
+        # Overridable so load tests can point the bot at a local stand-in (see fake_unbelievaboat.py)
+        self.base_url = os.getenv('UNBELIEVABOAT_API_URL', self.BASE_URL).rstrip('/')
+
+        # Fails fast while UnbelievaBoat is down instead of letting every command wait for timeouts
+        self.breaker = CircuitBreaker('UnbelievaBoat')
+
+        # One pooled session, reused by every call (created in the loop that first needs it)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop = None
+
+        self._latency: Dict[str, deque] = {}  # action -> seconds taken by recent successful calls
+        self.hedged = Counter()  # 'sent' / 'won': duplicate balance reads and how often they answered first
+        self.ambiguous_writes = 0
+
+    @property
+    def available(self) -> bool:
+        """False while the circuit is open; economy commands should tell users to retry later"""
+        return not self.breaker.is_open
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(headers=self.headers, connector=aiohttp.TCPConnector(ttl_dns_cache=300))
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed and self._session_loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+
+    def percentile(self, action: str, share: float) -> Optional[float]:
+        """Latency of recent successful calls at the given share (e.g. 0.95), None until there are enough"""
+        samples = self._latency.get(action)
+        if not samples or len(samples) < self.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+    async def _request(self, method: str, path: str, action: str, payload: Optional[Dict] = None,
+                       params: Optional[Dict] = None, timeout: Optional[float] = None) -> Tuple[Optional[Any], Optional[bool]]:
         """
-        Remove money from a user's balance using UnbelievaBoat API
+        Call an API endpoint through the circuit breaker
+
+        Reads give up after timeout seconds. Writes are sent once and never
+        retried here; timeout only decides whether there is still time to send
+        one, after which it gets the full WRITE_TIMEOUT. A write that fails
+        after it may have reached the API reports an unknown outcome (None)
+        so nobody repeats it blindly.
 
         Args:
-            guild_id (str): Discord guild ID
-            user_id (str): Discord user ID
-            amount (int): Amount to remove (positive integer)
+            method (str): HTTP method
+            path (str): Endpoint path below the API version, e.g. guilds/{guild_id}/users/{user_id}
+            action (str): Name of the calling operation, for logs
+            payload (Optional[Dict]): JSON body for PATCH requests
+            params (Optional[Dict]): Query string parameters
+            timeout (Optional[float]): Seconds the caller can wait (default READ_TIMEOUT for reads)
 
         Returns:
-            Optional[Dict[str, Any]]: API response data or None if failed
+            Tuple[Optional[Any], Optional[bool]]: API response data or None if failed, and
+            whether a failure was transient (outage, timeout, rate limit) and worth retrying;
+            None when a write's outcome is unknown
         """
-        try:
-            endpoint = f"{self.BASE_URL}/{self.API_VERSION}/guilds/{guild_id}/users/{user_id}"
+        write = method != 'GET'
+        if timeout is not None and timeout <= 0:
+            logger.warning(f"No time left in the caller's budget for {action} ({path})")
+            return None, True
+        if write:
+            timeout = self.WRITE_TIMEOUT
+        elif timeout is None:
+            timeout = self.READ_TIMEOUT
+
+        if not self.breaker.allow():
+            logger.warning(f"Economy API circuit is open, skipping {action} ({path})")
+            return None, True
 
-            logger.info(f"Making API request to endpoint: {endpoint}")
-            logger.info(f"Attempting to remove {amount} from user {user_id} in guild {guild_id}")
+        endpoint = f"{self.base_url}/{self.API_VERSION}/{path}"
+        logger.info(f"Making API request to endpoint: {endpoint}")
 
-            async with aiohttp.ClientSession(headers=self.headers) as session:
-                async with session.patch(endpoint, json={"cash": -abs(amount)}) as response:
+        failed = True  # Counted against the circuit: network errors, timeouts and 5xx
+        started = time.monotonic()
+        try:
+            client_timeout = aiohttp.ClientTimeout(total=timeout, connect=min(timeout, self.CONNECT_TIMEOUT))
+            with tracer.span(f"unbelievaboat {action}", 'unbelievaboat', method=method) as span:
+                async with self._get_session().request(method, endpoint, json=payload, params=params, timeout=client_timeout) as response:
+                    failed = response.status >= 500
+                    span['status'] = response.status
                     if response.status == 200:
                         data = await response.json()
-                        logger.info(f"Successfully removed {amount} from user {user_id}")
-                        logger.info(f"New balance: {data.get('cash', 'unknown')}")
-                        return data
+                        samples = self._latency.get(action)
+                        if samples is None:
+                            samples = self._latency[action] = deque(maxlen=200)
+                        samples.append(time.monotonic() - started)
+                        return data, False
                     elif response.status == 429:  # Rate limit
                         retry_after = response.headers.get('Retry-After', 60)
                         logger.warning(f"Rate limited. Retry after {retry_after} seconds")
-                        return None
+                        return None, True
                     elif response.status == 401:
                         logger.error("Unauthorized. Please check your API token")
-                        return None
+                        return None, False
                     elif response.status == 403:
                         logger.error("Forbidden. Bot lacks necessary permissions")
-                        return None
+                        return None, False
                     else:
                         error_data = await response.text()
                         logger.error(f"API request failed with status {response.status}: {error_data}")
-                        return None
+                        return None, failed
 
-        except aiohttp.ClientError as e:
-            logger.error(f"Network error in remove_money API call: {str(e)}")
-            return None
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            failed = None
+            raise
+        except (aiohttp.ConnectionTimeoutError, aiohttp.ClientConnectorError) as e:
+            # Never reached the API, so even a write is safe to retry
+            logger.error(f"Could not connect for {action} API call: {str(e) or 'timed out'}")
+            return None, True
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            reason = f"Timed out after {timeout:.1f}s" if isinstance(e, asyncio.TimeoutError) else f"Network error ({str(e)})"
+            if write:
+                self.ambiguous_writes += 1
+                logger.error(f"{reason} in {action} API call after sending it; it may or may not have been applied")
+                return None, None
+            logger.error(f"{reason} in {action} API call")
+            return None, True
         except Exception as e:
-            logger.error(f"Unexpected error in remove_money API call: {str(e)}")
-            return None
-            
-    async def add_money(self, guild_id: str, user_id: str, amount: int) -> Optional[Dict[str, Any]]:
+            logger.error(f"Unexpected error in {action} API call: {str(e)}")
+            return None, False
+        finally:
+            if failed is not None:
+                self.breaker.record(failed)
+
+    async def _hedged_read(self, path: str, action: str, timeout: Optional[float] = None) -> Tuple[Optional[Any], Optional[bool]]:
+        """
+        GET that sends a duplicate once the first is slower than the action's p95;
+        the first successful answer wins and the other request is cancelled
+        """
+        timeout = self.READ_TIMEOUT if timeout is None else timeout
+        hedge_after = self.percentile(action, 0.95)
+        first = asyncio.ensure_future(self._request('GET', path, action, timeout=timeout))
+        if hedge_after is None or hedge_after >= timeout or self.breaker.state != self.breaker.CLOSED:
+            return await first
+
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if done:
+                return first.result()
+
+            self.hedged['sent'] += 1
+            second = asyncio.ensure_future(self._request('GET', path, action, timeout=timeout - hedge_after))
+            pending.add(second)
+            result = None, True
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result[0] is not None:
+                        if task is second:
+                            self.hedged['won'] += 1
+                        return result
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def remove_money(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Remove money from a user's balance using UnbelievaBoat API
+
+        Args:
+            guild_id (str): Discord guild ID
+            user_id (str): Discord user ID
+            amount (int): Amount to remove (positive integer)
+            timeout (Optional[float]): Seconds left in the caller's budget; the debit isn't sent without enough
+
+        Returns:
+            Optional[Dict[str, Any]]: API response data or None if failed
+        """
+        data, _ = await self.debit(guild_id, user_id, amount, timeout)
+        return data
+
+    async def debit(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], Optional[bool]]:
+        """
+        Remove money from a user's balance, also reporting whether a failure is worth retrying
+        (used by bet admission, which must not treat a debit that may have landed as a clean failure)
+
+        Args:
+            guild_id (str): Discord guild ID
+            user_id (str): Discord user ID
+            amount (int): Amount to remove (positive integer)
+            timeout (Optional[float]): Seconds left in the caller's budget; the debit isn't sent without enough
+
+        Returns:
+            Tuple[Optional[Dict[str, Any]], Optional[bool]]: API response data or None if failed, and whether
+            the failure was transient (None if the debit may have been applied)
+        """
+        logger.info(f"Attempting to remove {amount} from user {user_id} in guild {guild_id}")
+        data, transient = await self._request('PATCH', f"guilds/{guild_id}/users/{user_id}", 'remove_money', {"cash": -abs(amount)}, timeout=timeout)
+        if data is not None:
+            logger.info(f"Successfully removed {amount} from user {user_id}")
+            logger.info(f"New balance: {data.get('cash', 'unknown')}")
+        return data, transient
+
+    async def add_money(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
         """
         Add money to a user's balance using UnbelievaBoat API
 
@@ -74,87 +244,86 @@ class UnbelievaBoatAPI:
             guild_id (str): Discord guild ID
             user_id (str): Discord user ID
             amount (int): Amount to add (positive integer)
+            timeout (Optional[float]): Seconds left in the caller's budget; the credit isn't sent without enough
 
         Returns:
             Optional[Dict[str, Any]]: API response data or None if failed
         """
-        try:
-            endpoint = f"{self.BASE_URL}/{self.API_VERSION}/guilds/{guild_id}/users/{user_id}"
+        data, _ = await self.credit(guild_id, user_id, amount, timeout)
+        return data
 
-            logger.info(f"Making API request to endpoint: {endpoint}")
-            logger.info(f"Attempting to add {amount} to user {user_id} in guild {guild_id}")
+    async def credit(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], Optional[bool]]:
+        """
+        Add money to a user's balance, also reporting whether a failure is worth retrying
+        (used by the credit outbox)
 
-            async with aiohttp.ClientSession(headers=self.headers) as session:
-                async with session.patch(endpoint, json={"cash": abs(amount)}) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        logger.info(f"Successfully added {amount} to user {user_id}")
-                        logger.info(f"New balance: {data.get('cash', 'unknown')}")
-                        return data
-                    elif response.status == 429:  # Rate limit
-                        retry_after = response.headers.get('Retry-After', 60)
-                        logger.warning(f"Rate limited. Retry after {retry_after} seconds")
-                        return None
-                    elif response.status == 401:
-                        logger.error("Unauthorized. Please check your API token")
-                        return None
-                    elif response.status == 403:
-                        logger.error("Forbidden. Bot lacks necessary permissions")
-                        return None
-                    else:
-                        error_data = await response.text()
-                        logger.error(f"API request failed with status {response.status}: {error_data}")
-                        return None
+        Args:
+            guild_id (str): Discord guild ID
+            user_id (str): Discord user ID
+            amount (int): Amount to add (positive integer)
+            timeout (Optional[float]): Seconds left in the caller's budget
 
-        except aiohttp.ClientError as e:
-            logger.error(f"Network error in add_money API call: {str(e)}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error in add_money API call: {str(e)}")
-            return None
-            
-    async def get_balance(self, guild_id: str, user_id: str) -> Optional[int]:
+        Returns:
+            Tuple[Optional[Dict[str, Any]], Optional[bool]]: API response data or None if failed, and whether
+            the failure was transient (None if the credit may have been applied)
+        """
+        logger.info(f"Attempting to add {amount} to user {user_id} in guild {guild_id}")
+        data, transient = await self._request('PATCH', f"guilds/{guild_id}/users/{user_id}", 'add_money', {"cash": abs(amount)}, timeout=timeout)
+        if data is not None:
+            logger.info(f"Successfully added {amount} to user {user_id}")
+            logger.info(f"New balance: {data.get('cash', 'unknown')}")
+        return data, transient
+
+    async def get_balance(self, guild_id: str, user_id: str, timeout: Optional[float] = None) -> Optional[int]:
         """
         Get a user's balance using UnbelievaBoat API
 
         Args:
             guild_id (str): Discord guild ID
             user_id (str): Discord user ID
+            timeout (Optional[float]): Seconds the caller can wait (default READ_TIMEOUT)
 
         Returns:
             Optional[int]: User's cash balance or None if failed
         """
-        try:
-            endpoint = f"{self.BASE_URL}/{self.API_VERSION}/guilds/{guild_id}/users/{user_id}"
+        logger.info(f"Getting balance for user {user_id} in guild {guild_id}")
+        data, _ = await self._hedged_read(f"guilds/{guild_id}/users/{user_id}", 'get_balance', timeout)
+        if data is None:
+            return None
+        balance = data.get('cash', 0)
+        logger.info(f"Successfully got balance for user {user_id}: {balance}")
+        return balance
 
-            logger.info(f"Making API request to endpoint: {endpoint}")
-            logger.info(f"Getting balance for user {user_id} in guild {guild_id}")
+    async def get_leaderboard_page(self, guild_id: str, page: int, limit: int = 1000) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """
+        Get one page of a guild's leaderboard (every user's balance, sorted by cash)
 
-            async with aiohttp.ClientSession(headers=self.headers) as session:
-                async with session.get(endpoint) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        balance = data.get('cash', 0)
-                        logger.info(f"Successfully got balance for user {user_id}: {balance}")
-                        return balance
-                    elif response.status == 429:  # Rate limit
-                        retry_after = response.headers.get('Retry-After', 60)
-                        logger.warning(f"Rate limited. Retry after {retry_after} seconds")
-                        return None
-                    elif response.status == 401:
-                        logger.error("Unauthorized. Please check your API token")
-                        return None
-                    elif response.status == 403:
-                        logger.error("Forbidden. Bot lacks necessary permissions")
-                        return None
-                    else:
-                        error_data = await response.text()
-                        logger.error(f"API request failed with status {response.status}: {error_data}")
-                        return None
+        Args:
+            guild_id (str): Discord guild ID
+            page (int): Page number, starting at 1
+            limit (int): Users per page (the API allows up to 1000)
 
-        except aiohttp.ClientError as e:
-            logger.error(f"Network error in get_balance API call: {str(e)}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error in get_balance API call: {str(e)}")
+        Returns:
+            Optional[Tuple[List[Dict[str, Any]], int]]: The page's users and the total number of pages, or None if failed
+        """
+        logger.info(f"Getting leaderboard page {page} for guild {guild_id}")
+        data, _ = await self._request('GET', f"guilds/{guild_id}/users", 'get_leaderboard',
+                                      params={'sort': 'cash', 'limit': limit, 'page': page}, timeout=self.LEADERBOARD_TIMEOUT)
+        if data is None:
             return None
+        if isinstance(data, list):  # Unpaginated form: everything in one list
+            return data, 1
+        return data.get('users', []), data.get('total_pages', 1)
+
+    def snapshot(self):
+        latency = {}
+        for action in self._latency:
+            p50, p95 = self.percentile(action, 0.5), self.percentile(action, 0.95)
+            if p50 is not None:
+                latency[action] = {'p50': round(p50, 4), 'p95': round(p95, 4)}
+        return {
+            'circuit': self.breaker.snapshot(),
+            'latency': latency,
+            'hedged': dict(self.hedged),
+            'ambiguous_writes': self.ambiguous_writes,
+        }
@@ -0,0 +1,124 @@
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger('BotAutomation.Balances')
+
+class BalanceTable:
+    """
+    Last known cash of every user the bot has seen, per guild.
+
+    Filled from the API's own responses (balance lookups, debits, credits)
+    and in bulk from the guild leaderboard, so robbery and bet code can read
+    a balance without a GET per user.
+    """
+
+    def __init__(self):
+        self._cash: Dict[Tuple[str, str], Tuple[int, float]] = {}  # (guild, user) -> (cash, seen at)
+        self.prefetched: Dict[str, float] = {}  # guild -> monotonic time of its last full scan
+
+    def __len__(self):
+        return len(self._cash)
+
+    def observe(self, guild_id: str, user_id: str, cash: Optional[int], seen_at: Optional[float] = None):
+        """Record a balance returned by the API, unless a newer one is already known"""
+        if cash is None:
+            return
+        seen_at = seen_at or time.monotonic()
+        key = (guild_id, user_id)
+        cached = self._cash.get(key)
+        if cached is None or cached[1] <= seen_at:
+            self._cash[key] = (cash, seen_at)
+
+    def get(self, guild_id: str, user_id: str, max_age: float) -> Optional[int]:
+        """A user's cash if it was seen within max_age seconds, else None"""
+        cached = self._cash.get((guild_id, user_id))
+        if cached is None or time.monotonic() - cached[1] > max_age:
+            return None
+        return cached[0]
+
+    def expire(self, max_age: float) -> int:
+        """Forget balances last seen more than max_age seconds ago; returns how many"""
+        cutoff = time.monotonic() - max_age
+        stale = [key for key, (_, seen_at) in self._cash.items() if seen_at < cutoff]
+        for key in stale:
+            del self._cash[key]
+        return len(stale)
+
+    def snapshot(self):
+        return {'entries': len(self._cash), 'prefetched_guilds': len(self.prefetched)}
+
+class BalancePrefetcher:
+    """
+    Warms a BalanceTable for whole guilds by walking the paginated leaderboard,
+    one GET per page instead of one per user. Runs on demand (prefetch) and,
+    with an interval, for every guild the bot is in on a schedule starting at
+    startup.
+    """
+
+    def __init__(self, api, table: BalanceTable, interval: float = 0.0, page_size: int = 1000):
+        """
+        Args:
+            api: UnbelievaBoatAPI to read the leaderboard from
+            table (BalanceTable): Table to fill
+            interval (float): Seconds between scheduled scans of every guild (0 = on demand only)
+            page_size (int): Users per leaderboard page
+        """
+        self.api = api
+        self.table = table
+        self.interval = interval
+        self.page_size = page_size
+        self._running: Dict[str, asyncio.Task] = {}  # guild -> scan in progress
+        self._task: Optional[asyncio.Task] = None
+
+    async def prefetch(self, guild_id: str) -> Optional[int]:
+        """Scan a guild's leaderboard into the table; returns users loaded, None if the first page failed"""
+        scan = self._running.get(guild_id)
+        if scan is None:  # Callers asking for a guild already being scanned share that scan
+            scan = self._running[guild_id] = asyncio.ensure_future(self._scan(guild_id))
+            scan.add_done_callback(lambda _: self._running.pop(guild_id, None))
+        return await asyncio.shield(scan)
+
+    async def _scan(self, guild_id: str) -> Optional[int]:
+        started = time.monotonic()
+        loaded = 0
+        page = 1
+        while True:
+            result = await self.api.get_leaderboard_page(guild_id, page, self.page_size)
+            if result is None:
+                logger.warning(f"Balance prefetch for guild {guild_id} stopped at page {page}")
+                if page == 1:
+                    return None
+                break
+            users, total_pages = result
+            # Stamped with the scan's start so a balance that changed mid-scan is never treated as newer
+            for entry in users:
+                self.table.observe(guild_id, str(entry['user_id']), entry.get('cash'), started)
+            loaded += len(users)
+            if not users or page >= total_pages:
+                self.table.prefetched[guild_id] = started
+                break
+            page += 1
+
+        logger.info(f"Prefetched {loaded} balances for guild {guild_id} in {page} page(s), {time.monotonic() - started:.2f}s")
+        return loaded
+
+    def start(self, guild_ids: Callable[[], Iterable[str]]):
+        """Scan every guild now and then every interval seconds (no-op without an interval or if running)"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run(guild_ids))
+
+    async def _run(self, guild_ids: Callable[[], Iterable[str]]):
+        while True:
+            for guild_id in list(guild_ids()):
+                try:
+                    await self.prefetch(guild_id)
+                except Exception as e:
+                    logger.error(f"Error prefetching balances for guild {guild_id}: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,187 @@
+"""
+Microbenchmarks for the bot's hot paths.
+
+Each benchmark is timed over several rounds and the results are written as
+JSON. Pass --compare with an earlier results file to fail when a benchmark's
+median got slower than the tolerance allows.
+
+    python benchmarks.py --json benchmarks.json
+    python benchmarks.py --compare benchmarks.json --tolerance 0.25
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+from typing import Awaitable, Callable, Dict
+
+import discord
+from fake_unbelievaboat import FakeUnbelievaBoat
+from loadtest import Driver, FakeGuild, FakeMember, FakeRole, _ScaledAsyncio
+
+logger = logging.getLogger('BotAutomation.Benchmarks')
+
+GUILD_MEMBERS = 10_000
+GUILD_ROLES = 250
+
+def summarize(samples, iterations: int) -> Dict:
+    """Per-operation timings in microseconds from per-round totals"""
+    per_op = [sample / iterations * 1e6 for sample in samples]
+    return {
+        'rounds': len(samples),
+        'iterations': iterations,
+        'min_us': round(min(per_op), 3),
+        'median_us': round(statistics.median(per_op), 3),
+        'mean_us': round(statistics.mean(per_op), 3),
+        'stddev_us': round(statistics.stdev(per_op), 3) if len(per_op) > 1 else 0.0,
+    }
+
+def bench(func: Callable[[], object], rounds: int, iterations: int) -> Dict:
+    func()  # Warm up
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, iterations)
+
+async def bench_async(func: Callable[[], Awaitable[object]], rounds: int, iterations: int) -> Dict:
+    await func()  # Warm up
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, iterations)
+
+def large_guild():
+    roles = [FakeRole(index, f"role{index}") for index in range(GUILD_ROLES)]
+    roles += [FakeRole(GUILD_ROLES + index, name) for index, name in enumerate(("Woozie", "Glock", "Shotgun", "Uzi"))]
+    members = [FakeMember(index, f"user{index}", random.sample(roles, 3)) for index in range(GUILD_MEMBERS)]
+    for member in members[::50]:
+        member.bot = True
+    return FakeGuild(1, members, roles)
+
+async def run(args) -> Dict:
+    fake = FakeUnbelievaBoat(latency=0.0, jitter=0.0)
+    runner, base_url = await fake.start()
+
+    # The bot modules read these at import time
+    os.environ['UNBELIEVABOAT_API_URL'] = base_url
+    os.environ['UNBELIEVABOAT_API_TOKEN'] = 'benchmark'
+    os.environ['DISCORD_TOKEN'] = 'benchmark'
+    os.environ['FIGHT_DB_PATH'] = os.path.join(args.workdir, 'benchmark_fights.db')
+
+    import fist_fight
+    import bot_automation
+    import tracing
+    from config import load_config
+    logging.getLogger('BotAutomation').setLevel(logging.WARNING)
+    tracing.asyncio = _ScaledAsyncio(0.0)  # Rounds run back to back (scripted pauses go through tracer.sleep)
+
+    results = {}
+    try:
+        random.seed(args.seed)
+        results['get_hearts_display'] = bench(
+            lambda: [fist_fight.get_hearts_display(hp) for hp in range(0, 101, 10)], args.rounds, 1000
+        )
+
+        guild = large_guild()
+        robber = guild.members[1]
+        results['woozie_target_selection'] = bench(
+            lambda: bot_automation.pick_random_target(guild.members, robber), args.rounds, 20
+        )
+        results['plock_role_resolution'] = bench(
+            lambda: bot_automation.resolve_plock_roles(guild), args.rounds, 1000
+        )
+
+        bot = bot_automation.AutomationBot(load_config())
+        driver = Driver(bot, fist_fight.FightView, users=2, channels=1)
+        challenger, target = driver.guild.members
+
+        async def simulate_fight():
+            message_id = driver.next_id()
+            fight_info = {
+                'guild_id': driver.guild.id,
+                'channel_id': driver.channels[0],
+                'challenger_id': challenger.id,
+                'challenger_name': challenger.display_name,
+                'target_id': target.id,
+                'target_name': target.display_name,
+                'accepted': True,
+                'expires_at': time.time(),
+                'payout_mode': 'multiplier',
+                'rake': 0.0,
+            }
+            fist_fight.active_fights[message_id] = fight_info
+            interaction = driver.interaction(discord.InteractionType.component, target, driver.channels[0])
+            await fist_fight.play_fight(interaction, message_id, fight_info, fist_fight.fight_poster(interaction, message_id, False))
+
+        results['fight_simulation'] = await bench_async(simulate_fight, args.rounds, 20)
+
+        api = fist_fight.api_client
+        results['api_get_balance'] = await bench_async(lambda: api.get_balance('1', '2'), args.rounds, 20)
+        results['api_add_money'] = await bench_async(lambda: api.add_money('1', '2', 100), args.rounds, 20)
+    finally:
+        await fist_fight.api_client.close()
+        await runner.cleanup()
+
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'discord_py': discord.__version__,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'benchmarks': results,
+    }
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> int:
+    """Print median changes against a baseline; returns the number of regressions"""
+    regressions = 0
+    for name, current in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous:
+            print(f"{name:28} {current['median_us']:>12.3f}us  (new)")
+            continue
+        change = current['median_us'] / previous['median_us'] - 1
+        regressed = change > tolerance
+        regressions += regressed
+        print(f"{name:28} {current['median_us']:>12.3f}us  {change:+.1%}" + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the bot's hot paths")
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path', help="Write the results to this file")
+    parser.add_argument('--compare', help="Results file to compare medians against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed median slowdown before failing, e.g. 0.25 for 25%%")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as previous:
+            baseline = json.load(previous)  # Read first, --json may overwrite the same file
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        results = asyncio.run(run(args))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if baseline is not None:
+        sys.exit(1 if compare(results, baseline, args.tolerance) else 0)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
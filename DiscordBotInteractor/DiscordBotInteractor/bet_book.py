@@ -0,0 +1,90 @@
+from typing import Dict, Iterator, Optional, Tuple
+
+class BetBook:
+    """
+    Bets on a single fight, aggregated as they are placed.
+
+    Stakes are kept per fighter as user_id -> amount, alongside running
+    per-fighter totals and per-user totals, so pot sizes and odds are O(1)
+    and settlement only touches the winning side's bettors. Only user IDs
+    are stored, never discord.Member objects.
+    """
+    __slots__ = ('challenger_id', 'target_id', '_stakes', '_totals', '_by_user', '_count')
+
+    def __init__(self, challenger_id: int, target_id: int):
+        self.challenger_id = challenger_id
+        self.target_id = target_id
+        self._stakes: Dict[int, Dict[int, int]] = {challenger_id: {}, target_id: {}}  # fighter -> user -> stake
+        self._totals: Dict[int, int] = {challenger_id: 0, target_id: 0}
+        self._by_user: Dict[int, int] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        """Number of individual bets placed"""
+        return self._count
+
+    def add(self, user_id: int, fighter_id: int, amount: int):
+        stakes = self._stakes[fighter_id]
+        stakes[user_id] = stakes.get(user_id, 0) + amount
+        self._totals[fighter_id] += amount
+        self._by_user[user_id] = self._by_user.get(user_id, 0) + amount
+        self._count += 1
+
+    @property
+    def pot(self) -> int:
+        return self._totals[self.challenger_id] + self._totals[self.target_id]
+
+    def total_on(self, fighter_id: int) -> int:
+        return self._totals[fighter_id]
+
+    def stakes_on(self, fighter_id: int) -> Dict[int, int]:
+        """user_id -> total stake on this fighter"""
+        return self._stakes[fighter_id]
+
+    def user_total(self, user_id: int) -> int:
+        """Everything a user has staked on this fight, across both fighters"""
+        return self._by_user.get(user_id, 0)
+
+    def users(self) -> Iterator[Tuple[int, int]]:
+        """(user_id, total stake) for every bettor, e.g. for refunds"""
+        return iter(self._by_user.items())
+
+    def other(self, fighter_id: int) -> int:
+        return self.target_id if fighter_id == self.challenger_id else self.challenger_id
+
+    def odds(self, fighter_id: int, rake: float = 0.0) -> Optional[float]:
+        """Implied pari-mutuel decimal odds after the rake, None if nobody backed them"""
+        total = self._totals[fighter_id]
+        if not total:
+            return None
+        return 1 + self._totals[self.other(fighter_id)] * (1 - rake) / total
+
+    def parimutuel_payouts(self, winner_id: int, rake: float) -> Tuple[Dict[int, int], int]:
+        """
+        Split the losing stakes between the winner's backers in one pass
+
+        Each winning bettor gets their stake back plus a pro-rata share of the
+        losing pool after the rake. If nobody backed the winner the losing
+        stakes are returned instead, since there is no one to pay.
+
+        Args:
+            winner_id (int): Fighter who won
+            rake (float): Share of the losing pool kept by the house
+
+        Returns:
+            Tuple[Dict[int, int], int]: user_id -> payout, and the house's take (rake plus rounding)
+        """
+        winning_total = self._totals[winner_id]
+        losing_id = self.other(winner_id)
+        if not winning_total:
+            return dict(self._stakes[losing_id]), 0
+
+        losing_pool = self._totals[losing_id]
+        distributable = losing_pool - int(losing_pool * rake)
+        payouts = {}
+        paid_share = 0
+        for user_id, stake in self._stakes[winner_id].items():
+            share = stake * distributable // winning_total
+            payouts[user_id] = stake + share
+            paid_share += share
+        return payouts, losing_pool - paid_share
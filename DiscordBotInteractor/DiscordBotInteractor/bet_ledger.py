@@ -0,0 +1,98 @@
+import logging
+from typing import Dict, Optional, Tuple
+from balances import BalanceTable
+
+logger = logging.getLogger('BotAutomation.BetLedger')
+
+class BetLedger:
+    """
+    Admits bets against a locally cached balance and debits them with one API call.
+
+    Each user's cached cash (from the shared BalanceTable, or the local
+    economy's own balance for guilds that use it) minus their in-flight
+    reservations gives the amount they can still stake, so a bet that can't
+    be covered is refused without calling the API, and concurrent
+    bets from one user can't both spend the same money. The PATCH response
+    is the final word: if it shows the balance went negative the debit is
+    rolled back.
+    """
+
+    def __init__(self, api, outbox, balances: BalanceTable, ttl: float = 30.0):
+        """
+        Args:
+            api: EconomyRouter used for debits
+            outbox: CreditOutbox that delivers rollbacks
+            balances (BalanceTable): Known balances, also warmed by leaderboard prefetches
+            ttl (float): Seconds a cached balance is trusted for admission
+        """
+        self.api = api
+        self.outbox = outbox
+        self.balances = balances
+        self.ttl = ttl
+        self._reserved: Dict[Tuple[str, str], int] = {}  # (guild, user) -> stake being debited
+
+    def __len__(self):
+        """Number of users with a debit in flight"""
+        return len(self._reserved)
+
+    def available(self, guild_id: str, user_id: str) -> Optional[int]:
+        """Cash minus in-flight reservations, None if there is no fresh balance"""
+        if self.api.is_local(guild_id):
+            # Local payouts and transfers never pass through the table; the local economy is always current
+            cash = self.api.local.cash(guild_id, user_id)
+        else:
+            cash = self.balances.get(guild_id, user_id, self.ttl)
+        if cash is None:
+            return None
+        return cash - self._reserved.get((guild_id, user_id), 0)
+
+    async def withdraw(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Tuple[bool, Optional[int]]:
+        """
+        Reserve and debit a stake
+
+        Args:
+            guild_id (str): Discord guild ID
+            user_id (str): Discord user ID
+            amount (int): Stake to take (positive integer)
+            timeout (Optional[float]): Seconds left in the caller's budget; the debit isn't sent without enough
+
+        Returns:
+            Tuple[Optional[bool], Optional[int]]: Whether the stake was taken (None if the debit may or may
+            not have landed; a refund is then held in the outbox for review), and the user's balance
+            (None if the API call failed)
+        """
+        key = (guild_id, user_id)
+        available = self.available(guild_id, user_id)
+        if available is not None and available < amount:
+            return False, available
+
+        self._reserved[key] = self._reserved.get(key, 0) + amount
+        try:
+            data, transient = await self.api.debit(guild_id, user_id, amount, timeout)
+            if data is None:
+                if transient is None:
+                    # The debit was sent but its answer was lost; the bet isn't placed, and the refund
+                    # it would be owed waits for someone to check the user's balance history
+                    self.outbox.hold(guild_id, user_id, amount, 'bet debit outcome unknown', 'outcome unknown')
+                    return None, None
+                return False, None
+
+            cash = data.get('cash')
+            if cash is None:
+                logger.warning(f"Debit response for user {user_id} has no cash field, accepting bet")
+                return True, None
+
+            if cash < 0:
+                # Another spend landed first; undo ours
+                logger.info(f"Rolling back ${amount:,} bet by user {user_id}, balance went to {cash}")
+                self.outbox.enqueue(guild_id, user_id, amount, 'bet rollback')
+                cash += amount  # Balance once the rollback is delivered
+                self.balances.observe(guild_id, user_id, cash)
+                return False, cash
+
+            self.balances.observe(guild_id, user_id, cash)
+            return True, cash
+        finally:
+            self._reserved[key] -= amount
+            if not self._reserved[key]:
+                del self._reserved[key]
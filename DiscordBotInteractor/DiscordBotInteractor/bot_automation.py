@@ -1,5 +1,10 @@
+import io
 import os
 import sys
+import hmac
+import math
+import time
+import errno
 import asyncio
 import logging
 import random
@@ -7,121 +12,149 @@ import discord
 from discord import app_commands
 import aiohttp
 import signal
+import threading
+import contextlib
+from collections import Counter
 from datetime import datetime
-import subprocess
 
 logger = logging.getLogger('BotAutomation')
 
-def find_process_using_port(port):
-    """Find if another instance of our bot is using this port"""
-    if os.name == 'nt':  # Windows
-        try:
-            # Use netstat to find process using the port
-            cmd = f'netstat -ano | findstr :{port}'
-            output = subprocess.check_output(cmd, shell=True).decode()
-            if output:
-                pid = output.strip().split()[-1]
-                return int(pid)
-        except:
-            pass
-    else:  # Linux/Unix
-        try:
-            cmd = f'lsof -i :{port} -t'
-            pid = subprocess.check_output(cmd, shell=True).decode().strip()
-            return int(pid)
-        except:
-            pass
-    return None
-
-async def cleanup_old_instance(pid):
-    """Cleanup an old instance of the bot"""
-    try:
-        logger.info(f"Attempting to terminate old bot instance (PID: {pid})")
-        if os.name == 'nt':  # Windows
-            subprocess.run(['taskkill', '/PID', str(pid), '/F'], check=True)
-        else:  # Linux/Unix
-            os.kill(pid, signal.SIGTERM)
-            
-        # Small delay to ensure port is released
-        await asyncio.sleep(2)
-        return True
-    except Exception as e:
-        logger.error(f"Failed to cleanup old bot instance: {str(e)}")
-        return False
-
-import discord
-from discord import app_commands
-import asyncio
-import logging
-import random
-import os
 from discord.ext import commands
 from config import load_config
-from utils import setup_logging
+from utils import setup_logging, estimate_guild_memory, get_rss_bytes, inflight, latency_budget, defer_interaction, respond
 from keep_alive import start_server
-import requests
-from fist_fight import setup_fight_commands
-import aiohttp
+from fist_fight import (setup_fight_commands, active_fights, active_bets, api_client, economy, balance_table,
+                        balance_prefetcher, credit_outbox, get_user_balance)
+from api_client import ECONOMY_UNAVAILABLE
+from instance_lock import InstanceLock, instance_lock_path, EXIT_DUPLICATE
+from outbound import OutboundScheduler, followup, NARRATION
+from tracing import tracer
+from profiler import Profiler, profiler
+from watchdog import StateWatchdog
+from settings import settings
 import aiohttp.web
 
 # Setup logging
 logger = setup_logging()
 
-# Define your functions here
-async def get_user_balance(guild_id, user_id, api_key):
-    url = f"https://unbelievaboat.com/api/v1/guilds/{guild_id}/users/{user_id}"
-    headers = {
-        "accept": "application/json",
-        "Authorization": api_key
-    }
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json().get('cash', None)
-    else:
-        logger.error(f"Error getting user balance: {response.text}")
-        return None
-async def remove_money(guild_id, user_id, amount, api_key):
-    url = f"https://unbelievaboat.com/api/v1/guilds/{guild_id}/users/{user_id}"
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "Authorization": api_key
-    }
-    data = {
-        "cash": -amount
-    }
-    response = requests.patch(url, headers=headers, json=data)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        logger.error(f"Error removing money: {response.text}")
-        return None
-
-async def add_money(guild_id, user_id, amount, api_key):
-    url = f"https://unbelievaboat.com/api/v1/guilds/{guild_id}/users/{user_id}"
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "Authorization": api_key
-    }
-    data = {
-        "cash": amount
+# Economy helpers used by the robbery commands; they share fist_fight's economy router and
+# balance table (get_user_balance reads a fresh table entry before asking UnbelievaBoat)
+async def remove_money(guild_id, user_id, amount, timeout=None):
+    result = await economy.remove_money(guild_id, user_id, amount, timeout)
+    if result:
+        balance_table.observe(guild_id, user_id, result.get('cash'))
+    return result
+
+async def add_money(guild_id, user_id, amount):
+    result = await economy.add_money(guild_id, user_id, amount)
+    if result:
+        balance_table.observe(guild_id, user_id, result.get('cash'))
+    return result
+
+async def rob(guild_id, target_user_id, robber_user_id, amount, timeout=None):
+    """
+    Move a robbery amount from the target to the robber. Returns the target's
+    and the robber's new balances (None where a call failed) and the amount
+    actually taken.
+
+    Local economy guilds do this in one transaction capped at the target's
+    cash. On UnbelievaBoat the amount was capped by a possibly cached balance,
+    so anything the debit took below zero is given back before the robber is
+    credited.
+    """
+    if economy.is_local(guild_id):
+        amount, result, add_result = await economy.local.transfer(guild_id, target_user_id, robber_user_id, amount)
+        return result, add_result, amount
+
+    result = await remove_money(guild_id, target_user_id, amount, timeout)
+    if not result:
+        return None, None, amount
+    cash = result.get('cash')
+    if isinstance(cash, int) and cash < 0:
+        logger.info(f"Robbery overdrew user {target_user_id} to {cash}, returning the difference")
+        credit_outbox.enqueue(guild_id, target_user_id, -cash, 'robbery overdraw')
+        balance_table.observe(guild_id, target_user_id, 0)
+        amount += cash
+        result['cash'] = 0
+    if amount <= 0:
+        return result, None, amount
+
+    logger.info(f"Attempting to add {amount} to user {robber_user_id} in guild {guild_id}")
+    return result, await add_money(guild_id, robber_user_id, amount), amount
+
+def trace_path(config):
+    """Trace file for this process; cluster processes each write their own"""
+    if config['CLUSTER_PROCESSES'] <= 1:
+        return config['TRACE_PATH']
+    root, ext = os.path.splitext(config['TRACE_PATH'])
+    return f"{root}.{config['CLUSTER_ID']}{ext}"
+
+def build_cache_options(config):
+    """Return the intents and cache options for the configured CACHE_PROFILE"""
+    if config['CACHE_PROFILE'] == 'minimal':
+        # Only guilds (roles/channels), members (random robbery targets) and guild messages with
+        # their content (CommandExecutor reads the target bot's replies) are needed. Messages are
+        # still not cached, and members are chunked on demand the first time a guild needs a random target.
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.members = True
+        intents.guild_messages = True
+        intents.message_content = True
+        member_cache_flags = discord.MemberCacheFlags.none()
+        member_cache_flags.joined = True
+        return {
+            'intents': intents,
+            'member_cache_flags': member_cache_flags,
+            'chunk_guilds_at_startup': False,
+            'max_messages': None,
+        }
+
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    intents.guilds = True
+    return {
+        'intents': intents,
+        'max_messages': config['MESSAGE_CACHE_SIZE'] or None,
     }
-    response = requests.patch(url, headers=headers, json=data)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        logger.error(f"Error adding money: {response.text}")
-        return None
+
+# Commands that still run while the bot (or a guild) is asleep: sleep control and the admin diagnostics
+GATE_EXEMPT_COMMANDS = frozenset(('shutdown', 'active', 'sleep', 'settings', 'profile', 'memory'))
+
 class AutomationBot(commands.Bot):
-    def __init__(self):
-        intents = discord.Intents.default()
-        intents.message_content = True
-        intents.members = True
-        intents.guilds = True
-        super().__init__(command_prefix="!", intents=intents)
-        self.config = load_config()
+    def __init__(self, config=None, **options):
+        config = config or load_config()
+        options.update(build_cache_options(config))
+        super().__init__(command_prefix="!", **options)
+        self.config = config
+        self.draining = False  # Set once a graceful shutdown starts; new interactions are refused
+        self.sleeping_guilds = set()  # Guild IDs (as sent in gateway payloads) put to sleep with /shutdown server_only
+        self._gate_closed = False  # True while anything (sleep or drain) may refuse interactions
+        self._gate_rejected = 0
+        self._gate_tasks = set()
+        # Every interaction (commands, buttons, modals) passes the gate before discord.py builds any objects for it
+        self._parse_interaction_create = self._connection.parsers['INTERACTION_CREATE']
+        self._connection.parsers['INTERACTION_CREATE'] = self._gate_interaction_create
+        self._inflight = Counter()  # work name -> running count
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._chunk_locks = {}  # guild_id -> asyncio.Lock, so a guild is only chunked once at a time
         self.is_active = True  # Bot state flag
+        self.expiry_scheduler = None  # Challenge deadlines, set up by setup_fight_commands
+        self.fight_scheduler = None  # Concurrent fight limits, set up by setup_fight_commands
+        self.credit_outbox = None  # Payout/refund delivery, set up by setup_fight_commands
+        # Outbound messages per channel, settlement before confirmations before narration
+        self.outbound = OutboundScheduler(settings['OUTBOUND_MAX_DEPTH'], settings['NARRATION_TTL'])
+        settings.on_change(self.apply_settings)
+        tracer.configure(trace_path(config), config['TRACE_SAMPLE_RATE'], config['TRACE_SLOW_THRESHOLD'])
+        # Sizes of long-lived state next to RSS, and sweeps of entries that outlived their purpose
+        self.watchdog = StateWatchdog(config['WATCHDOG_INTERVAL'])
+        self.watchdog.track('outbound_queued', lambda: len(self.outbound))
+        self.watchdog.track('sleeping_guilds', lambda: len(self.sleeping_guilds))
+        self.watchdog.track('gate_tasks', lambda: len(self._gate_tasks))
+        self.watchdog.track('pending_expirations', lambda: len(self.expiry_scheduler) if self.expiry_scheduler else 0)
+        self.watchdog.track('cached_members', lambda: sum(len(guild._members) for guild in self.guilds))
+        self.watchdog.track('cached_messages', lambda: len(self.cached_messages))
 
     async def setup_hook(self):
         logger.info("Bot is setting up...")
@@ -129,14 +162,20 @@ class AutomationBot(commands.Bot):
         
         # Add admin commands
         @self.tree.command(name="shutdown", description="[ADMIN] Put the bot in sleep mode")
+        @app_commands.describe(server_only="Only put the bot to sleep in this server")
         @app_commands.default_permissions(administrator=True)  # Only visible to admins
         @app_commands.checks.has_permissions(administrator=True)  # Double-check permissions
-        async def shutdown(interaction: discord.Interaction):
+        async def shutdown(interaction: discord.Interaction, server_only: bool = False):
             if not interaction.user.guild_permissions.administrator:
                 await interaction.response.send_message("❌ This command requires administrator permissions!", ephemeral=True)
                 return
-                
-            self.is_active = False
+
+            if server_only:
+                self.set_sleep(True, interaction.guild_id)
+                await interaction.response.send_message("💤 Bot is now in sleep mode in this server. Use `/active` to wake it up.", ephemeral=True)
+                return
+
+            self.set_sleep(True)
             await interaction.response.send_message("💤 Bot is now in sleep mode. Use `/active` to wake it up.", ephemeral=True)
             await self.change_presence(status=discord.Status.idle, activity=discord.Game(name="Sleeping..."))
             
@@ -148,37 +187,293 @@ class AutomationBot(commands.Bot):
                 await interaction.response.send_message("❌ This command requires administrator permissions!", ephemeral=True)
                 return
                 
-            self.is_active = True
+            was_sleeping = not self.is_active
+            self.set_sleep(False, interaction.guild_id)
+            self.set_sleep(False)
             await interaction.response.send_message("✅ Bot is now active!", ephemeral=True)
-            await self.change_presence(status=discord.Status.online, activity=discord.Game(name="Ready to serve!"))
+            if was_sleeping:
+                await self.change_presence(status=discord.Status.online, activity=discord.Game(name="Ready to serve!"))
             
-        # Add check for bot state to all commands
+        @self.tree.command(name="profile", description="[ADMIN] Profile the bot for a while and send the report")
+        @app_commands.describe(seconds="How long to profile (1-120)", mode="'sample' is cheap, 'cprofile' counts every call")
+        @app_commands.choices(mode=[
+            app_commands.Choice(name="sample", value="sample"),
+            app_commands.Choice(name="cprofile", value="cprofile"),
+        ])
+        @app_commands.default_permissions(administrator=True)  # Only visible to admins
+        @app_commands.checks.has_permissions(administrator=True)  # Double-check permissions
+        async def profile(interaction: discord.Interaction, seconds: app_commands.Range[int, 1, Profiler.MAX_SECONDS] = 10, mode: str = 'sample'):
+            if not interaction.user.guild_permissions.administrator:
+                await interaction.response.send_message("❌ This command requires administrator permissions!", ephemeral=True)
+                return
+
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            logger.warning(f"Profile requested by {interaction.user.name} ({interaction.user.id})")
+            report = await profiler.profile(seconds, mode)
+            if report is None:
+                await interaction.followup.send("⏳ A profile is already running, try again when it finishes.", ephemeral=True)
+                return
+            await interaction.followup.send(
+                f"📊 {mode} profile over {seconds}s, top functions by cumulative time:",
+                file=discord.File(io.BytesIO(report.encode('utf-8')), filename=f"profile_{time.strftime('%Y%m%d_%H%M%S')}.txt"),
+                ephemeral=True
+            )
+
+        @self.tree.command(name="memory", description="[ADMIN] Report memory use, sweep stale state or diff allocations")
+        @app_commands.describe(action="report: sizes and sweeps, start/diff/stop: tracemalloc allocation snapshots")
+        @app_commands.choices(action=[app_commands.Choice(name=action, value=action) for action in ('report', 'start', 'diff', 'stop')])
+        @app_commands.default_permissions(administrator=True)  # Only visible to admins
+        @app_commands.checks.has_permissions(administrator=True)  # Double-check permissions
+        async def memory(interaction: discord.Interaction, action: str = 'report'):
+            if not interaction.user.guild_permissions.administrator:
+                await interaction.response.send_message("❌ This command requires administrator permissions!", ephemeral=True)
+                return
+
+            if action == 'start':
+                started = self.watchdog.start_tracemalloc()
+                await interaction.response.send_message(
+                    "🔍 Tracing allocations. Use `/memory diff` to see what grew since now." if started else "🔍 Already tracing allocations.",
+                    ephemeral=True
+                )
+            elif action == 'stop':
+                stopped = self.watchdog.stop_tracemalloc()
+                await interaction.response.send_message("✅ Stopped tracing allocations." if stopped else "Allocations weren't being traced.", ephemeral=True)
+            elif action == 'diff':
+                await interaction.response.defer(ephemeral=True, thinking=True)
+                diff = await asyncio.to_thread(self.watchdog.tracemalloc_diff)
+                if diff is None:
+                    await interaction.followup.send("Allocations aren't being traced, use `/memory start` first.", ephemeral=True)
+                    return
+                await interaction.followup.send(
+                    "📊 Allocation changes since the last snapshot:",
+                    file=discord.File(io.BytesIO(diff.encode('utf-8')), filename=f"memory_diff_{time.strftime('%Y%m%d_%H%M%S')}.txt"),
+                    ephemeral=True
+                )
+            else:
+                await interaction.response.defer(ephemeral=True, thinking=True)
+                swept = await self.watchdog.check()
+                _, rss, sizes = self.watchdog.history[-1]
+                lines = [f"🧠 RSS {rss / 2**20:.1f} MiB"]
+                lines.extend(f"{name}: {size:,}" for name, size in sizes.items())
+                lines.append("Swept: " + ", ".join(f"{name} {count:,}" for name, count in swept.items()))
+                await interaction.followup.send("\n".join(lines), ephemeral=True)
+
+        @self.tree.command(name="settings", description="[ADMIN] Show or reload the bot's runtime settings")
+        @app_commands.describe(reload="Re-read the settings file and environment and apply them now")
+        @app_commands.default_permissions(administrator=True)  # Only visible to admins
+        @app_commands.checks.has_permissions(administrator=True)  # Double-check permissions
+        async def settings_command(interaction: discord.Interaction, reload: bool = False):
+            if not interaction.user.guild_permissions.administrator:
+                await interaction.response.send_message("❌ This command requires administrator permissions!", ephemeral=True)
+                return
+
+            if not reload:
+                lines = [f"⚙️ Runtime settings (from {settings.path} and the environment):"]
+                lines.extend(f"{name}: {value}" for name, value in settings.snapshot()['values'].items())
+                await interaction.response.send_message("\n".join(lines), ephemeral=True)
+                return
+
+            changed, error = self.reload_settings()
+            logger.warning(f"Settings reload requested by {interaction.user.name} ({interaction.user.id})")
+            if error:
+                await interaction.response.send_message(f"❌ Settings not reloaded, nothing changed: {error}", ephemeral=True)
+            elif changed:
+                await interaction.response.send_message(
+                    "✅ Applied:\n" + "\n".join(f"{name}: {value}" for name, value in changed.items()), ephemeral=True
+                )
+            else:
+                await interaction.response.send_message("✅ Reloaded, nothing changed.", ephemeral=True)
+
         @self.tree.error
         async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
             if isinstance(error, app_commands.errors.CheckFailure):
-                if not self.is_active and interaction.command and interaction.command.name not in ['shutdown', 'active']:
-                    await interaction.response.send_message("💤 Bot is currently in sleep mode. An administrator must use `/active` to wake it up.", ephemeral=True)
-                else:
-                    await interaction.response.send_message("❌ You don't have permission to use this command!", ephemeral=True)
+                await interaction.response.send_message("❌ You don't have permission to use this command!", ephemeral=True)
             else:
                 await interaction.response.send_message("❌ An error occurred while processing the command.", ephemeral=True)
                 logger.error(f"Command error: {str(error)}")
                 
-        # Add the sleep mode check to all non-admin commands
-        async def is_bot_active(interaction: discord.Interaction) -> bool:
-            command = interaction.command
-            if command and command.name in ['shutdown', 'active']:
-                return True
-            return self.is_active
-            
-        for cmd in self.tree.get_commands():
-            if cmd.name not in ['shutdown', 'active']:
-                cmd.add_check(is_bot_active)
-                
         await self.tree.sync()  # Sync commands with Discord
 
     async def on_ready(self):
         logger.info(f"Logged in as {self.user}")
+        # Scheduled leaderboard scans (BALANCE_PREFETCH_INTERVAL); the first runs now
+        balance_prefetcher.start(lambda: [str(guild.id) for guild in self.guilds])
+        self.watchdog.start()
+
+    def set_sleep(self, sleeping, guild_id=None):
+        """Put the bot to sleep (or wake it) everywhere, or only in one guild"""
+        if guild_id is None:
+            self.is_active = not sleeping
+        elif sleeping:
+            self.sleeping_guilds.add(str(guild_id))
+        else:
+            self.sleeping_guilds.discard(str(guild_id))
+        self._update_gate()
+
+    def _update_gate(self):
+        self._gate_closed = self.draining or not self.is_active or bool(self.sleeping_guilds)
+
+    def _gate_interaction_create(self, data):
+        """
+        INTERACTION_CREATE parser wrapper. While the bot is awake this is a single
+        attribute check; otherwise refused interactions are answered here and never
+        reach the command tree, views or modals.
+        """
+        if not self._gate_closed:
+            return self._parse_interaction_create(data)
+
+        if self.draining:
+            notice = "🔄 Bot is restarting, please try again in a moment."
+        elif data['type'] == 2 and data['data']['name'] in GATE_EXEMPT_COMMANDS:
+            return self._parse_interaction_create(data)
+        elif not self.is_active or data.get('guild_id') in self.sleeping_guilds:
+            notice = "💤 Bot is currently in sleep mode. An administrator must use `/active` to wake it up."
+        else:
+            return self._parse_interaction_create(data)
+
+        self._gate_rejected += 1
+        if data['type'] == 4:  # Autocomplete can't carry a message, just drop it
+            return
+        interaction = discord.Interaction(data=data, state=self._connection)
+        task = asyncio.ensure_future(interaction.response.send_message(notice, ephemeral=True))
+        self._gate_tasks.add(task)
+        task.add_done_callback(self._gate_tasks.discard)
+
+    async def ensure_members(self, guild):
+        """Chunk a guild's member list on first use when it wasn't chunked at startup"""
+        if guild.chunked:
+            return guild.members
+
+        lock = self._chunk_locks.setdefault(guild.id, asyncio.Lock())
+        async with lock:
+            if not guild.chunked:
+                logger.info(f"Chunking members for guild {guild.name} ({guild.id}) on demand")
+                await guild.chunk()
+        self._chunk_locks.pop(guild.id, None)
+        return guild.members
+
+    def guild_memory(self):
+        """Approximate cache footprint of every guild, largest first"""
+        report = [estimate_guild_memory(guild) for guild in self.guilds]
+        report.sort(key=lambda entry: entry['approx_bytes'], reverse=True)
+        return report
+
+    def apply_settings(self, changed):
+        """Push reloaded runtime settings into subsystems that keep their own copy"""
+        self.outbound.max_depth = settings['OUTBOUND_MAX_DEPTH']
+        self.outbound.narration_ttl = settings['NARRATION_TTL']
+
+    def reload_settings(self):
+        """Reload runtime settings (SIGHUP, /settings); returns the changes, or the error that kept them out"""
+        try:
+            return settings.reload(), None
+        except ValueError as e:
+            logger.error(f"Settings not reloaded: {str(e)}")
+            return {}, str(e)
+
+    def metrics(self):
+        """Per-process metrics served on the health server's /metrics endpoint"""
+        if isinstance(self, discord.AutoShardedClient):
+            shards = {shard_id: shard.latency for shard_id, shard in self.shards.items()}
+        else:
+            shards = {self.shard_id or 0: self.latency}
+
+        return {
+            'cluster_id': self.config['CLUSTER_ID'],
+            'pid': os.getpid(),
+            'ready': self.is_ready(),
+            'shard_count': self.shard_count or 1,
+            'shard_latency': {str(shard_id): (None if math.isnan(latency) else round(latency, 4)) for shard_id, latency in shards.items()},
+            'guilds': len(self.guilds),
+            'cache_profile': self.config['CACHE_PROFILE'],
+            'cached_members': sum(len(guild._members) for guild in self.guilds),
+            'rss_bytes': get_rss_bytes(),
+            'draining': self.draining,
+            'sleeping': not self.is_active,
+            'sleeping_guilds': len(self.sleeping_guilds),
+            'gate_rejected': self._gate_rejected,
+            'inflight': dict(self._inflight),
+            'active_fights': len(active_fights),
+            'pending_expirations': len(self.expiry_scheduler) if self.expiry_scheduler else 0,
+            'fight_scheduler': self.fight_scheduler.snapshot() if self.fight_scheduler else None,
+            'active_bets': sum(len(book) for book in active_bets.values()),
+            'economy_api': api_client.snapshot(),
+            'local_economy': economy.local.snapshot(),
+            'balance_table': balance_table.snapshot(),
+            'credit_outbox': self.credit_outbox.snapshot() if self.credit_outbox else None,
+            'outbound': self.outbound.snapshot(),
+            'latency_budget': latency_budget.snapshot(),
+            'tracing': tracer.snapshot(),
+            'profiler': profiler.snapshot(),
+            'watchdog': self.watchdog.snapshot(),
+            'settings': settings.snapshot(),
+        }
+
+    @contextlib.asynccontextmanager
+    async def track_inflight(self, name):
+        """Register running work (fights, bets, payouts) so a drain waits for it"""
+        self._inflight[name] += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._inflight[name] -= 1
+            if self._inflight[name] <= 0:
+                del self._inflight[name]
+            if not self._inflight:
+                self._idle.set()
+
+    async def drain_and_shutdown(self, timeout=None):
+        """
+        Gracefully stop the bot: refuse new interactions, wait for running fights
+        and payouts, flush logs, then close. Open challenges are stored in the
+        fight store and resume after the restart.
+
+        Falls back to emergency_shutdown's hard exit if the drain itself hangs.
+        """
+        if self.draining:
+            return
+        self.draining = True
+        self._update_gate()
+        timeout = self.config['DRAIN_TIMEOUT'] if timeout is None else timeout
+        logger.warning(f"Draining: waiting up to {timeout:.0f}s for in-flight work {dict(self._inflight)}")
+
+        # Leave challenge deadlines to the next process, which rebuilds them from the fight store
+        if self.expiry_scheduler:
+            await self.expiry_scheduler.stop()
+
+        # Hard kill if closing takes far longer than the deadline (e.g. a wedged event loop)
+        watchdog = threading.Timer(timeout + 30, os._exit, args=(1,))
+        watchdog.daemon = True
+        watchdog.start()
+
+        try:
+            await self.change_presence(status=discord.Status.dnd, activity=discord.Game(name="Restarting..."))
+        except Exception as e:
+            logger.warning(f"Failed to update presence while draining: {e}")
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            logger.info("Drain complete, all in-flight work finished")
+        except asyncio.TimeoutError:
+            logger.error(f"Drain deadline reached with work still running: {dict(self._inflight)}")
+
+        balance_prefetcher.stop()
+        self.watchdog.stop()
+
+        # Undelivered payouts and refunds stay in the outbox for the next process
+        if self.credit_outbox:
+            try:
+                await asyncio.wait_for(self.credit_outbox.stop(), 15)
+            except asyncio.TimeoutError:
+                logger.warning("Outbox batch still in flight at shutdown, it will be retried after the restart")
+        await api_client.close()
+        tracer.close()
+
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+
+        await self.close()
 
     async def emergency_shutdown(self):
         """Emergency shutdown of the bot"""
@@ -192,11 +487,41 @@ class AutomationBot(commands.Bot):
             # If normal shutdown fails, force quit
             os._exit(1)
 
-async def main():
-    bot = AutomationBot()
+class ShardedAutomationBot(AutomationBot, commands.AutoShardedBot):
+    """AutomationBot running on AutoShardedBot: one process, many gateway shards"""
+
+def create_bot(config=None):
+    """Create the bot for the configured sharding mode"""
+    config = config or load_config()
+    if config['SHARDING'] == 'off':
+        return AutomationBot(config)
+
+    options = {}
+    if config['SHARD_COUNT'] is not None:
+        options['shard_count'] = config['SHARD_COUNT']
+    if config['SHARD_IDS'] is not None:
+        options['shard_ids'] = config['SHARD_IDS']
+    logger.info(f"Starting in sharded mode (shard_count={options.get('shard_count', 'auto')}, shard_ids={options.get('shard_ids', 'all')})")
+    return ShardedAutomationBot(config, **options)
+
+def pick_random_target(members, robber):
+    """Random robbery target among a guild's members, excluding bots and the robber; None if there is nobody"""
+    valid_targets = [member for member in members if not member.bot and member != robber]
+    return random.choice(valid_targets) if valid_targets else None
+
+def resolve_plock_roles(guild):
+    """The roles /plock checks its target for: (shotgun, woozie, uzi)"""
+    shotgun_role = discord.utils.find(lambda r: r.name.lower() == "shotgun", guild.roles)
+    woozie_role = discord.utils.get(guild.roles, name="Woozie")
+    uzi_role = discord.utils.find(lambda r: r.name.lower() == "uzi", guild.roles)
+    return shotgun_role, woozie_role, uzi_role
+
+def register_commands(bot):
+    """Add the robbery and shutdown commands to the bot's command tree"""
 
     @bot.tree.command(name="woozie", description="Rob someone at gunpoint (requires Woozie role)")
     @app_commands.describe(target="The user to rob (optional, random if not specified)")
+    @inflight('woozie')
     async def woozie(interaction: discord.Interaction, target: discord.Member = None):
         try:
             # Check if user has the Woozie role
@@ -205,21 +530,26 @@ async def main():
                 await interaction.response.send_message("❌ You need the Woozie role to use this command!", ephemeral=True)
                 return
 
+            if not economy.available_for(interaction.guild_id):
+                await interaction.response.send_message(ECONOMY_UNAVAILABLE, ephemeral=True)
+                return
+
             # If no target specified, randomly select one
             if not target:
-                members = interaction.guild.members
-                valid_targets = [member for member in members if not member.bot and member != interaction.user]
-
-                if not valid_targets:
-                    await interaction.response.send_message("❌ No valid targets found!", ephemeral=True)
+                if not interaction.guild.chunked:
+                    # Chunking a large guild can take longer than Discord's response window
+                    await defer_interaction(interaction, interaction.command.name)
+                members = await bot.ensure_members(interaction.guild)
+                target = pick_random_target(members, interaction.user)
+
+                if not target:
+                    await respond(interaction, "❌ No valid targets found!", ephemeral=True)
                     return
-
-                target = random.choice(valid_targets)
             elif target == interaction.user:
-                await interaction.response.send_message("❌ You can't rob yourself!", ephemeral=True)
+                await respond(interaction, "❌ You can't rob yourself!", ephemeral=True)
                 return
             elif target.bot:
-                await interaction.response.send_message("❌ You can't rob a bot!", ephemeral=True)
+                await respond(interaction, "❌ You can't rob a bot!", ephemeral=True)
                 return
 
             # Check for roles
@@ -239,10 +569,11 @@ async def main():
 
             if woozie_role in target.roles:
                 logger.info(f"Gunfight scenario: both {interaction.user.display_name} and {target.display_name} have Woozie role")
-                penalty1 = random.randint(5000, 15000)
-                penalty2 = random.randint(5000, 15000)
+                penalty1 = random.randint(*settings['WOOZIE_GUNFIGHT_PENALTY'])
+                penalty2 = random.randint(*settings['WOOZIE_GUNFIGHT_PENALTY'])
 
-                await interaction.response.send_message(
+                await respond(
+                    interaction,
                     f"🔫 You try to rob {target.mention}, but they pull out their piece too!"
                 )
 
@@ -270,10 +601,10 @@ async def main():
 
                 for i, message in enumerate(gunfight_messages):
                     if i == 0:
-                        await asyncio.sleep(1.5)
+                        await tracer.sleep(settings['NARRATION_DELAY'])
                     else:
-                        await asyncio.sleep(1.5)
-                        await interaction.followup.send(message)
+                        await tracer.sleep(settings['NARRATION_DELAY'])
+                        await followup(interaction, message, NARRATION)
 
                 positive_gain_chance = random.randint(1, 100)
                 gain_amount = 0
@@ -290,26 +621,28 @@ async def main():
                 guild_id = str(interaction.guild_id)
                 robber_user_id = str(interaction.user.id)
                 target_user_id = str(target.id)
-                api_key = os.getenv('UNBELIEVABOAT_API_TOKEN')
 
-                await remove_money(guild_id, robber_user_id, penalty1, api_key)
-                await remove_money(guild_id, target_user_id, penalty2, api_key)
+                await remove_money(guild_id, robber_user_id, penalty1)
+                await remove_money(guild_id, target_user_id, penalty2)
 
                 if gain_amount > 0:
                     if gain_participant == interaction.user:
-                        await interaction.followup.send(
+                        await followup(
+                            interaction,
                             f"💸 **Gunfight Aftermath:**\n"
                             f"{interaction.user.mention}: +${gain_amount:,}\n"
                             f"{target.mention}: -${penalty2:,}"
                         )
                     else:
-                        await interaction.followup.send(
+                        await followup(
+                            interaction,
                             f"💸 **Gunfight Aftermath:**\n"
                             f"{interaction.user.mention}: -${penalty1:,}\n"
                             f"{target.mention}: +${gain_amount:,}"
                         )
                 else:
-                    await interaction.followup.send(
+                    await followup(
+                        interaction,
                         f"💸 **Gunfight Aftermath:**\n"
                         f"{interaction.user.mention}: -${penalty1:,}\n"
                         f"{target.mention}: -${penalty2:,}"
@@ -317,10 +650,11 @@ async def main():
 
                 return
             elif shotgun_role and shotgun_role in target.roles:
-                penalty = random.randint(10000, 15000)
+                penalty = random.randint(*settings['WOOZIE_SHOTGUN_PENALTY'])
                 logger.info(f"{target.display_name} has shotgun role, preventing robbery and penalizing robber {penalty}")
 
-                await interaction.response.send_message(
+                await respond(
+                    interaction,
                     f"🔫 You try to rob {target.mention}, but wait... what's that they're reaching for?"
                 )
 
@@ -347,58 +681,59 @@ async def main():
                 shotgun_messages = random.choice(shotgun_options)
 
                 for message in shotgun_messages:
-                    await asyncio.sleep(1.5)
-                    await interaction.followup.send(message)
+                    await tracer.sleep(settings['NARRATION_DELAY'])
+                    await followup(interaction, message, NARRATION)
 
                 guild_id = str(interaction.guild_id)
                 robber_user_id = str(interaction.user.id)
-                api_key = os.getenv('UNBELIEVABOAT_API_TOKEN')
 
-                await remove_money(guild_id, robber_user_id, penalty, api_key)
+                await remove_money(guild_id, robber_user_id, penalty)
                 return
 
             guild_id = str(interaction.guild_id)
             target_user_id = str(target.id)
             robber_user_id = str(interaction.user.id)
-            api_key = os.getenv('UNBELIEVABOAT_API_TOKEN')
 
-            target_balance = await get_user_balance(guild_id, target_user_id, api_key)
+            # The balance lookup is a remote call; acknowledge first so a slow API can't fail the interaction
+            await defer_interaction(interaction, interaction.command.name)
+            target_balance = await get_user_balance(guild_id, target_user_id, latency_budget.remaining(interaction))
             if not target_balance or target_balance <= 0:
-                await interaction.response.send_message(
+                await respond(
+                    interaction,
                     f"❌ {target.mention} is broke! No money to rob.",
                     ephemeral=True
                 )
                 return
 
-            amount = random.randint(25000, 50000)
+            amount = random.randint(*settings['WOOZIE_AMOUNT'])
             if target_balance < amount:
                 amount = target_balance
                 logger.info(f"Limiting robbery amount to {amount} to prevent negative balance")
 
-            await interaction.response.send_message(f"🔫 You're robbing {target.mention}!")
+            await respond(interaction, f"🔫 You're robbing {target.mention}!")
 
-            result = await remove_money(guild_id, target_user_id, amount, api_key)
+            result, add_result, amount = await rob(guild_id, target_user_id, robber_user_id, amount, latency_budget.remaining(interaction))
 
-            if result:
+            if result and amount > 0:
                 target_new_balance = result.get('cash', 'unknown')
 
-                logger.info(f"Attempting to add {amount} to user {robber_user_id} in guild {guild_id}")
-                add_result = await add_money(guild_id, robber_user_id, amount, api_key)
-
                 if add_result:
                     robber_new_balance = add_result.get('cash', 'unknown')
-                    await interaction.followup.send(
+                    await followup(
+                        interaction,
                         f"💰 Successfully robbed ${amount:,} from {target.mention}!\n"
                         f"Their new balance is ${target_new_balance:,}\n"
                         f"Your new balance is ${robber_new_balance:,}"
                     )
                 else:
-                    await interaction.followup.send(
+                    await followup(
+                        interaction,
                         f"💰 Successfully robbed ${amount:,} from {target.mention}, but failed to add it to your account.\n"
                         f"Their new balance is ${target_new_balance:,}"
                     )
             else:
-                await interaction.followup.send(
+                await followup(
+                    interaction,
                     "❌ Failed to rob the target. They might be broke or protected!\n"
                     "Make sure you have permissions to use economy commands."
                 )
@@ -408,6 +743,7 @@ async def main():
 
     @bot.tree.command(name="plock", description="Rob someone with a pistol (requires Glock role)")
     @app_commands.describe(target="The user to rob (optional, random if not specified)")
+    @inflight('plock')
     async def plock(interaction: discord.Interaction, target: discord.Member = None):
         try:
             glock_role = discord.utils.get(interaction.guild.roles, name="Glock")
@@ -415,37 +751,33 @@ async def main():
                 await interaction.response.send_message("❌ You need the Glock role to use this command!", ephemeral=True)
                 return
 
-            if not target:
-                members = interaction.guild.members
-                valid_targets = [member for member in members if not member.bot and member != interaction.user]
+            if not economy.available_for(interaction.guild_id):
+                await interaction.response.send_message(ECONOMY_UNAVAILABLE, ephemeral=True)
+                return
 
-                if not valid_targets:
-                    await interaction.response.send_message("❌ No valid targets found!", ephemeral=True)
+            if not target:
+                if not interaction.guild.chunked:
+                    # Chunking a large guild can take longer than Discord's response window
+                    await defer_interaction(interaction, interaction.command.name)
+                members = await bot.ensure_members(interaction.guild)
+                target = pick_random_target(members, interaction.user)
+
+                if not target:
+                    await respond(interaction, "❌ No valid targets found!", ephemeral=True)
                     return
-
-                target = random.choice(valid_targets)
             elif target == interaction.user:
-                await interaction.response.send_message("❌ You can't rob yourself!", ephemeral=True)
+                await respond(interaction, "❌ You can't rob yourself!", ephemeral=True)
                 return
             elif target.bot:
-                await interaction.response.send_message("❌ You can't rob a bot!", ephemeral=True)
+                await respond(interaction, "❌ You can't rob a bot!", ephemeral=True)
                 return
 
-            shotgun_role = discord.utils.find(
-                lambda r: r.name.lower() == "shotgun",
-                interaction.guild.roles
-            )
-
-            woozie_role = discord.utils.get(interaction.guild.roles, name="Woozie")
-            uzi_role = discord.utils.find(
-                lambda r: r.name.lower() == "uzi",
-                interaction.guild.roles
-            )
+            shotgun_role, woozie_role, uzi_role = resolve_plock_roles(interaction.guild)
 
             logger.info(f"Plock command: Checking if {target.display_name} has shotgun/woozie/uzi/plock roles")
 
             if uzi_role and uzi_role in target.roles:
-                penalty = random.randint(5000, 10000)
+                penalty = random.randint(*settings['PLOCK_UZI_PENALTY'])
                 logger.info(f"{target.display_name} has Uzi role, overpowering plock user with penalty {penalty}")
 
                 uzi_intros = [
@@ -453,7 +785,7 @@ async def main():
                     f"🔫 {target.mention} pulls out an UZI when you show your plock!",
                     f"🔫 You brought a plock to an UZI fight with {target.mention}!"
                 ]
-                await interaction.response.send_message(random.choice(uzi_intros))
+                await respond(interaction, random.choice(uzi_intros))
 
                 uzi_options = [
                     [f"💥 UZI fires!", f"💢 You're hit! (-${penalty:,})"],
@@ -463,21 +795,21 @@ async def main():
                 uzi_messages = random.choice(uzi_options)
 
                 for message in uzi_messages:
-                    await asyncio.sleep(1.5)
-                    await interaction.followup.send(message)
+                    await tracer.sleep(settings['NARRATION_DELAY'])
+                    await followup(interaction, message, NARRATION)
 
                 guild_id = str(interaction.guild_id)
                 robber_user_id = str(interaction.user.id)
-                api_key = os.getenv('UNBELIEVABOAT_API_TOKEN')
 
-                await remove_money(guild_id, robber_user_id, penalty, api_key)
+                await remove_money(guild_id, robber_user_id, penalty)
 
                 return
 
             elif shotgun_role and shotgun_role in target.roles:
                 logger.info(f"{target.display_name} has shotgun role, scaring away plock user")
 
-                await interaction.response.send_message(
+                await respond(
+                    interaction,
                     f"🔫 You pull out your pistol to rob {target.mention}, but freeze when you see their shotgun!"
                 )
 
@@ -504,10 +836,11 @@ async def main():
                 shotgun_messages = random.choice(shotgun_options)
 
                 for message in shotgun_messages:
-                    await asyncio.sleep(1.5)
-                    await interaction.followup.send(message)
+                    await tracer.sleep(settings['NARRATION_DELAY'])
+                    await followup(interaction, message, NARRATION)
 
-                await interaction.followup.send(
+                await followup(
+                    interaction,
                     f"😅 You escaped without losing any money, but your pride is severely wounded!"
                 )
 
@@ -515,10 +848,11 @@ async def main():
             elif glock_role in target.roles:
                 logger.info(f"Pistol standoff: both {interaction.user.display_name} and {target.display_name} have Glock role")
 
-                penalty1 = random.randint(1000, 5000)
-                penalty2 = random.randint(1000, 5000)
+                penalty1 = random.randint(*settings['PLOCK_STANDOFF_PENALTY'])
+                penalty2 = random.randint(*settings['PLOCK_STANDOFF_PENALTY'])
 
-                await interaction.response.send_message(
+                await respond(
+                    interaction,
                     f"🔫 You pull your pistol on {target.mention}, but they draw their pistol too!"
                 )
 
@@ -546,23 +880,23 @@ async def main():
 
                 for i, message in enumerate(standoff_messages):
                     if i == 0:
-                        await asyncio.sleep(1.5)
+                        await tracer.sleep(settings['NARRATION_DELAY'])
                     else:
-                        await asyncio.sleep(1.5)
-                        await interaction.followup.send(message)
+                        await tracer.sleep(settings['NARRATION_DELAY'])
+                        await followup(interaction, message, NARRATION)
 
                 guild_id = str(interaction.guild_id)
                 robber_user_id = str(interaction.user.id)
                 target_user_id = str(target.id)
-                api_key = os.getenv('UNBELIEVABOAT_API_TOKEN')
 
-                await remove_money(guild_id, robber_user_id, penalty1, api_key)
-                await remove_money(guild_id, target_user_id, penalty2, api_key)
+                result1 = await remove_money(guild_id, robber_user_id, penalty1)
+                result2 = await remove_money(guild_id, target_user_id, penalty2)
 
                 if result1 and result2:
                     robber_new_balance = result1.get('cash', 'unknown')
                     target_new_balance = result2.get('cash', 'unknown')
-                    await interaction.followup.send(
+                    await followup(
+                        interaction,
                         f"💸 **Pistol Fight Aftermath:**\n"
                         f"{interaction.user.mention}: ${robber_new_balance:,} (-${penalty1:,})\n"
                         f"{target.mention}: ${target_new_balance:,} (-${penalty2:,})"
@@ -573,45 +907,47 @@ async def main():
             guild_id = str(interaction.guild_id)
             target_user_id = str(target.id)
             robber_user_id = str(interaction.user.id)
-            api_key = os.getenv('UNBELIEVABOAT_API_TOKEN')
 
-            target_balance = await get_user_balance(guild_id, target_user_id, api_key)
+            # The balance lookup is a remote call; acknowledge first so a slow API can't fail the interaction
+            await defer_interaction(interaction, interaction.command.name)
+            target_balance = await get_user_balance(guild_id, target_user_id, latency_budget.remaining(interaction))
             if not target_balance or target_balance <= 0:
-                await interaction.response.send_message(
+                await respond(
+                    interaction,
                     f"❌ {target.mention} is broke! No money to rob.",
                     ephemeral=True
                 )
                 return
 
-            amount = random.randint(500, 10000)
+            amount = random.randint(*settings['PLOCK_AMOUNT'])
             if target_balance < amount:
                 amount = target_balance
                 logger.info(f"Limiting robbery amount to {amount} to prevent negative balance")
 
-            await interaction.response.send_message(f"🔫 You're robbing {target.mention} with your plock!")
+            await respond(interaction, f"🔫 You're robbing {target.mention} with your plock!")
 
-            result = await remove_money(guild_id, target_user_id, amount, api_key)
+            result, add_result, amount = await rob(guild_id, target_user_id, robber_user_id, amount, latency_budget.remaining(interaction))
 
-            if result:
+            if result and amount > 0:
                 target_new_balance = result.get('cash', 'unknown')
 
-                logger.info(f"Plock robbery: Attempting to add {amount} to user {robber_user_id} in guild {guild_id}")
-                add_result = await add_money(guild_id, robber_user_id, amount, api_key)
-
                 if add_result:
                     robber_new_balance = add_result.get('cash', 'unknown')
-                    await interaction.followup.send(
+                    await followup(
+                        interaction,
                         f"💰 Successfully robbed ${amount:,} from {target.mention}!\n"
                         f"Their new balance is ${target_new_balance:,}\n"
                         f"Your new balance is ${robber_new_balance:,}"
                     )
                 else:
-                    await interaction.followup.send(
+                    await followup(
+                        interaction,
                         f"💰 Successfully robbed ${amount:,} from {target.mention}, but failed to add it to your account.\n"
                         f"Their new balance is ${target_new_balance:,}"
                     )
             else:
-                await interaction.followup.send(
+                await followup(
+                    interaction,
                     "❌ Failed to rob the target. They might be broke or protected!\n"
                     "Make sure you have permissions to use economy commands."
                 )
@@ -619,42 +955,139 @@ async def main():
         except Exception as e:
             logger.error(f"Error in plock command: {str(e)}")
 
-    @bot.tree.command(name="sleep", description="⚠️ Emergency shutdown of the entire bot (Admin only)")
+    @bot.tree.command(name="prefetch", description="[ADMIN] Load every balance in this server from the leaderboard")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.checks.has_permissions(administrator=True)
+    async def prefetch(interaction: discord.Interaction):
+        """Warm the balance table before an event so robberies and bets skip per-user lookups"""
+        if economy.is_local(interaction.guild_id):
+            await interaction.response.send_message("This server uses the local economy; its balances are already local.", ephemeral=True)
+            return
+        if not api_client.available:
+            await interaction.response.send_message(ECONOMY_UNAVAILABLE, ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        loaded = await balance_prefetcher.prefetch(str(interaction.guild_id))
+        if loaded is None:
+            await interaction.followup.send("❌ Couldn't read the leaderboard. Please try again later.", ephemeral=True)
+        else:
+            await interaction.followup.send(f"✅ Loaded {loaded:,} balances.", ephemeral=True)
+
+    @bot.tree.command(name="economy", description="[ADMIN] Choose where this server's balances are kept")
+    @app_commands.describe(backend="'local' keeps balances in the bot, 'unbelievaboat' uses UnbelievaBoat")
+    @app_commands.choices(backend=[
+        app_commands.Choice(name="local", value="local"),
+        app_commands.Choice(name="unbelievaboat", value="unbelievaboat"),
+    ])
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.checks.has_permissions(administrator=True)
+    async def economy_backend(interaction: discord.Interaction, backend: str = None):
+        """Show or switch the economy backend; balances are not carried over between backends"""
+        guild_id = str(interaction.guild_id)
+        current = 'local' if economy.is_local(guild_id) else 'unbelievaboat'
+        if backend is None or backend == current:
+            await interaction.response.send_message(f"This server uses the **{current}** economy.", ephemeral=True)
+            return
+        if any(fight['guild_id'] == interaction.guild_id for fight in active_fights.values()):
+            # Their bets were taken from the current backend and must be paid back to it
+            await interaction.response.send_message("❌ Wait for this server's fights to finish before switching.", ephemeral=True)
+            return
+
+        economy.local.enable(guild_id, backend == 'local')
+        logger.info(f"Guild {guild_id} switched to the {backend} economy by {interaction.user.id}")
+        await interaction.response.send_message(
+            f"✅ This server now uses the **{backend}** economy. Balances were not copied over.", ephemeral=True
+        )
+
+    @bot.tree.command(name="sleep", description="⚠️ Shut down the entire bot (Admin only)")
+    @app_commands.describe(force="Exit immediately instead of letting running fights and payouts finish")
     @app_commands.checks.has_permissions(administrator=True)
-    async def sleep(interaction: discord.Interaction):
-        """Emergency shutdown command that immediately stops all bot operations"""
+    async def sleep(interaction: discord.Interaction, force: bool = False):
+        """Shutdown command: drains running work first unless force is set"""
         try:
-            await interaction.response.send_message("🛑 EMERGENCY SHUTDOWN INITIATED", ephemeral=True)
-            logger.warning(f"Emergency shutdown triggered by {interaction.user.name} ({interaction.user.id})")
-            # Immediate shutdown
-            await bot.emergency_shutdown()
+            if force:
+                await interaction.response.send_message("🛑 EMERGENCY SHUTDOWN INITIATED", ephemeral=True)
+                logger.warning(f"Emergency shutdown triggered by {interaction.user.name} ({interaction.user.id})")
+                # Immediate shutdown
+                await bot.emergency_shutdown()
+                return
+
+            await interaction.response.send_message(
+                f"🛑 SHUTDOWN INITIATED - finishing running fights and payouts (up to {bot.config['DRAIN_TIMEOUT']:.0f}s)",
+                ephemeral=True
+            )
+            logger.warning(f"Graceful shutdown triggered by {interaction.user.name} ({interaction.user.id})")
+            await bot.drain_and_shutdown()
         except Exception as e:
-            logger.critical(f"Failed to execute emergency shutdown: {e}")
+            logger.critical(f"Failed to execute shutdown: {e}")
             os._exit(1)  # Force quit if normal shutdown fails
 
+async def main(bot):
+    register_commands(bot)
+
+    # SIGTERM (rolling restarts, platform stop) drains instead of killing in-flight work
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.ensure_future(bot.drain_and_shutdown())
+        )
+        # SIGHUP re-reads the runtime settings without a restart
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, bot.reload_settings)
+    except (NotImplementedError, AttributeError):
+        pass  # Signal handlers (and SIGHUP) are not available on Windows
+
     try:
         async with bot:
             await bot.start(bot.config['TOKEN'])
     except Exception as e:
         logger.error(f"Failed to start bot: {str(e)}")
+        raise  # A non-zero exit tells the supervisor to restart us
 
-async def run_web_server():
+async def run_web_server(bot):
     app = aiohttp.web.Application()
     
     async def handle_health_check(request):
         return aiohttp.web.Response(text="Bot is running!", status=200)
+
+    async def handle_metrics(request):
+        return aiohttp.web.json_response(bot.metrics())
+
+    async def handle_guild_memory(request):
+        return aiohttp.web.json_response(bot.guild_memory())
+
+    async def handle_profile(request):
+        """GET /debug/profile?seconds=10&mode=sample with PROFILE_TOKEN as a bearer token"""
+        token = bot.config['PROFILE_TOKEN']
+        if not token:
+            raise aiohttp.web.HTTPNotFound()
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            raise aiohttp.web.HTTPUnauthorized()
+        try:
+            seconds = float(request.query.get('seconds', '10'))
+            limit = int(request.query.get('limit', '40'))
+            report = await profiler.profile(seconds, request.query.get('mode', 'sample'), limit)
+        except ValueError as e:
+            raise aiohttp.web.HTTPBadRequest(text=str(e))
+        if report is None:
+            raise aiohttp.web.HTTPConflict(text="A profile is already running")
+        return aiohttp.web.Response(text=report)
         
     app.router.add_get('/', handle_health_check)
     app.router.add_get('/health', handle_health_check)
+    app.router.add_get('/metrics', handle_metrics)
+    app.router.add_get('/metrics/guilds', handle_guild_memory)
+    app.router.add_get('/debug/profile', handle_profile)
     
-    # Get port from environment with fallback ports
-    primary_port = int(os.environ.get('PORT', 10000))
-    fallback_ports = [10001, 10002, 10003, 8080, 8081]
+    # Get port from environment with fallback ports. Cluster processes each take PORT + their cluster ID
+    # and have no fallbacks: any other port may be a sibling's, and its metrics must stay where expected.
+    primary_port = int(os.environ.get('PORT', 10000)) + bot.config['CLUSTER_ID']
+    fallback_ports = [10001, 10002, 10003, 8080, 8081] if bot.config['CLUSTER_PROCESSES'] <= 1 else []
     
     runner = aiohttp.web.AppRunner(app)
     await runner.setup()
     
-    # Try primary port first, then fallbacks
+    # Try primary port first, then fallbacks. The instance lock means a busy port
+    # belongs to some other program, so it is skipped rather than reclaimed.
     for port in [primary_port] + fallback_ports:
         try:
             site = aiohttp.web.TCPSite(runner, '0.0.0.0', port)
@@ -662,37 +1095,29 @@ async def run_web_server():
             logger.info(f"Web server started successfully on port {port}")
             return
         except OSError as e:
-            if e.errno == 98:  # Address already in use
-                # Check if port is used by another process
-                pid = find_process_using_port(port)
-                if pid and pid != os.getpid():  # If process found and it's not us
-                    logger.warning(f"Port {port} is in use by process {pid}")
-                    if await cleanup_old_instance(pid):
-                        # Try starting the server again on this port
-                        try:
-                            site = aiohttp.web.TCPSite(runner, '0.0.0.0', port)
-                            await site.start()
-                            logger.info(f"Web server started successfully on port {port} after cleanup")
-                            return
-                        except OSError:
-                            logger.warning(f"Port {port} still in use after cleanup, trying next port...")
-                    else:
-                        logger.warning(f"Failed to cleanup process, trying next port...")
-                else:
-                    logger.warning(f"Port {port} is in use, trying next port...")
+            if e.errno in (errno.EADDRINUSE, 10048):  # 10048: WSAEADDRINUSE on Windows
+                logger.warning(f"Port {port} is in use, trying next port...")
             else:
                 logger.error(f"Failed to start web server on port {port}: {str(e)}")
                 raise  # Re-raise if it's a different error
-    
+
     # If we get here, all ports failed
-    raise RuntimeError("Failed to start web server: all ports are in use")
+    raise RuntimeError(f"Failed to start web server: {'all ports are' if fallback_ports else f'port {primary_port} is'} in use")
 
 async def start_everything():
+    # One process per token and cluster ID: a second gateway session would handle every interaction twice
+    config = load_config()
+    lock = InstanceLock(instance_lock_path(config))
+    if not lock.acquire():
+        logger.critical(f"Another instance (PID: {lock.holder()}) holds {lock.path}, refusing to start")
+        sys.exit(EXIT_DUPLICATE)
+
     try:
+        bot = create_bot(config)
         # Start both the web server and the bot
         await asyncio.gather(
-            run_web_server(),
-            main()
+            run_web_server(bot),
+            main(bot)
         )
     except Exception as e:
         logger.error(f"Critical error in start_everything: {str(e)}", exc_info=True)
@@ -0,0 +1,130 @@
+import time
+import random
+import logging
+from collections import deque
+
+logger = logging.getLogger('BotAutomation.CircuitBreaker')
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for a remote dependency.
+
+    Closed: calls go through and their outcomes are kept for a sliding window.
+    Once enough calls in the window failed, the circuit opens and calls are
+    refused without touching the network. After a jittered delay (doubling on
+    every consecutive open) one probe is let through in the half-open state;
+    its outcome closes the circuit again or re-opens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, window: float = 60.0, min_calls: int = 10, failure_rate: float = 0.5,
+                 open_for: float = 15.0, max_open_for: float = 300.0, jitter: float = 0.2):
+        """
+        Args:
+            name (str): Dependency name for logs
+            window (float): Seconds of call outcomes considered
+            min_calls (int): Calls needed in the window before the circuit may open
+            failure_rate (float): Share of failed calls in the window that opens the circuit
+            open_for (float): Seconds before the first probe after opening
+            max_open_for (float): Cap for the doubling delay between probes
+            jitter (float): Random +/- share applied to every probe delay
+        """
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate
+        self.open_for = open_for
+        self.max_open_for = max_open_for
+        self.jitter = jitter
+        self.state = self.CLOSED
+        self._outcomes = deque()  # (monotonic time, failed)
+        self._failures = 0
+        self._consecutive_opens = 0
+        self._probe_at = 0.0
+        self._probing = False
+        self.rejected = 0
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    @property
+    def failure_rate(self) -> float:
+        self._trim(time.monotonic())
+        return self._failures / len(self._outcomes) if self._outcomes else 0.0
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being refused (open and not yet due for a probe)"""
+        return self.state == self.OPEN and time.monotonic() < self._probe_at
+
+    def retry_in(self) -> float:
+        """Seconds until the circuit will let a call through again"""
+        if self.state == self.OPEN:
+            return max(0.0, self._probe_at - time.monotonic())
+        return 0.0
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; every allowed call must be followed by record() or abandon()"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() >= self._probe_at:
+            self.state = self.HALF_OPEN
+            self._probing = True
+            logger.info(f"{self.name} circuit half-open, sending a probe")
+            return True
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, failed: bool):
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+            if failed:
+                self._open(now)
+            else:
+                self._close()
+            return
+        if self.state == self.OPEN:
+            return  # Late result of a call made before the circuit opened
+
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        self._trim(now)
+        if len(self._outcomes) >= self.min_calls and self._failures / len(self._outcomes) >= self.failure_rate_threshold:
+            self._open(now)
+
+    def abandon(self):
+        """A call that was allowed ended without an outcome (e.g. it was cancelled)"""
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+
+    def _open(self, now: float):
+        self._consecutive_opens += 1
+        delay = min(self.max_open_for, self.open_for * 2 ** (self._consecutive_opens - 1))
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        self._probe_at = now + delay
+        self.state = self.OPEN
+        logger.warning(f"{self.name} circuit opened (failure rate {self.failure_rate:.0%}), next probe in {delay:.1f}s")
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._consecutive_opens = 0
+        self._outcomes.clear()
+        self._failures = 0
+        logger.info(f"{self.name} circuit closed, calls resume")
+
+    def snapshot(self):
+        return {
+            'state': self.state,
+            'failure_rate': round(self.failure_rate, 3),
+            'calls_in_window': len(self._outcomes),
+            'retry_in': round(self.retry_in(), 1),
+            'rejected': self.rejected,
+        }
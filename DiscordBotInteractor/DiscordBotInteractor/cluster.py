@@ -0,0 +1,95 @@
+"""
+Multi-process cluster launcher.
+
+Starts CLUSTER_PROCESSES bot processes, each running SHARDS_PER_PROCESS
+gateway shards on AutoShardedBot. A guild always lands on the same process,
+which keeps its fights in its own fight database, so the processes share no
+state.
+
+Usage: python3 cluster.py
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import multiprocessing
+from config import load_config
+from instance_lock import EXIT_DUPLICATE
+
+logger = logging.getLogger('BotAutomation.Cluster')
+
+def run_cluster_process(cluster_id, shard_ids, shard_count):
+    """Entry point of a single cluster process"""
+    # Configuration is read from the environment when the bot modules are imported
+    os.environ['SHARDING'] = 'auto'
+    os.environ['CLUSTER_ID'] = str(cluster_id)
+    os.environ['SHARD_COUNT'] = str(shard_count)
+    os.environ['SHARD_IDS'] = ','.join(str(shard_id) for shard_id in shard_ids)
+
+    import bot_automation
+    asyncio.run(bot_automation.start_everything())
+
+def plan_shards(processes, shards_per_process):
+    """Return the shard IDs assigned to each process"""
+    return [
+        list(range(cluster_id * shards_per_process, (cluster_id + 1) * shards_per_process))
+        for cluster_id in range(processes)
+    ]
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    config = load_config()
+
+    processes = config['CLUSTER_PROCESSES']
+    shards_per_process = config['SHARDS_PER_PROCESS']
+    shard_count = processes * shards_per_process
+
+    context = multiprocessing.get_context('spawn')
+    workers = []
+    for cluster_id, shard_ids in enumerate(plan_shards(processes, shards_per_process)):
+        process = context.Process(
+            target=run_cluster_process,
+            args=(cluster_id, shard_ids, shard_count),
+            name=f"cluster-{cluster_id}"
+        )
+        process.start()
+        logger.info(f"Started cluster {cluster_id} (PID: {process.pid}) with shards {shard_ids} of {shard_count}")
+        workers.append(process)
+        # Discord allows one IDENTIFY per 5 seconds per bucket; stagger process startup
+        time.sleep(5 * len(shard_ids))
+
+    def shutdown(signum, frame):
+        logger.warning(f"Received signal {signum}, stopping cluster")
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+
+    def reload_settings(signum, frame):
+        for process in workers:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGHUP)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, reload_settings)  # Every process reloads its runtime settings
+
+    exit_code = 0
+    for process in workers:
+        process.join()
+        if process.exitcode == EXIT_DUPLICATE:
+            logger.critical(f"Cluster process {process.name} found another instance running")
+            exit_code = EXIT_DUPLICATE
+        elif process.exitcode:
+            logger.error(f"Cluster process {process.name} exited with code {process.exitcode}")
+            exit_code = exit_code or 1
+
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,125 @@
 import os
-from dotenv import load_dotenv
+from dotenv import dotenv_values
+from settings import SETTINGS
+
+def _parse_shard_ids(value):
+    """Parse a comma separated SHARD_IDS value into a list of ints"""
+    if not value:
+        return None
+    return [int(shard_id) for shard_id in value.split(',') if shard_id.strip()]
 
 def load_config():
     """Load configuration from environment variables"""
-    load_dotenv()
+    # Like load_dotenv(): .env fills in what the environment doesn't set. Runtime settings are left
+    # out so the environment keeps only real values for them; settings.py reads .env itself on each reload.
+    for name, value in dotenv_values().items():
+        if name not in SETTINGS and value is not None:
+            os.environ.setdefault(name, value)
 
     config = {
         'TOKEN': os.getenv('DISCORD_TOKEN'),
         'TARGET_BOT_ID': '292953664492929025',  # Hardcoded target bot ID
-        'COMMAND_TIMEOUT': int(os.getenv('COMMAND_TIMEOUT', '30')),
-        'DEFAULT_DELAY': float(os.getenv('DEFAULT_DELAY', '2.0')),
         'LOG_LEVEL': os.getenv('LOG_LEVEL', 'INFO'),
         'UNBELIEVABOAT_API_KEY': os.getenv('UNBELIEVABOAT_API_TOKEN'),  # Match api_client.py naming
+
+        # Sharding: 'off' runs a single gateway connection, 'auto' uses AutoShardedBot
+        'SHARDING': os.getenv('SHARDING', 'off').lower(),
+        'SHARD_COUNT': int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None,
+        'SHARD_IDS': _parse_shard_ids(os.getenv('SHARD_IDS')),
+
+        # Cluster launcher (cluster.py): N processes x M shards each
+        'CLUSTER_PROCESSES': int(os.getenv('CLUSTER_PROCESSES', '1')),
+        'SHARDS_PER_PROCESS': int(os.getenv('SHARDS_PER_PROCESS', '1')),
+        'CLUSTER_ID': int(os.getenv('CLUSTER_ID', '0')),
+
+        # Gateway cache profile: 'full' caches everything, 'minimal' keeps only what target selection
+        # and the target bot's replies need
+        'CACHE_PROFILE': os.getenv('CACHE_PROFILE', 'full').lower(),
+        'MESSAGE_CACHE_SIZE': int(os.getenv('MESSAGE_CACHE_SIZE', '1000')),
+
+        # Seconds a graceful shutdown waits for in-flight fights and payouts before forcing exit
+        'DRAIN_TIMEOUT': float(os.getenv('DRAIN_TIMEOUT', '60')),
+
+        # SQLite file holding open challenges, their bets, pending credits and local economy balances
+        # across restarts; cluster processes each use their own (fights.<cluster id>.db)
+        'FIGHT_DB_PATH': os.getenv('FIGHT_DB_PATH', 'fights.db'),
+
+        # Pacing, concurrency limits, robbery amounts and CommandExecutor timings are runtime
+        # settings (settings.py), read from the same environment variables and SETTINGS_PATH
+
+        # Seconds a balance returned by UnbelievaBoat is trusted for admitting bets without another lookup
+        'BALANCE_CACHE_TTL': float(os.getenv('BALANCE_CACHE_TTL', '30')),
+        # Seconds between leaderboard scans that load every balance of every guild (0 = only on /prefetch).
+        # Robbery and bet code only use balances younger than BALANCE_CACHE_TTL, so raise it to match.
+        'BALANCE_PREFETCH_INTERVAL': float(os.getenv('BALANCE_PREFETCH_INTERVAL', '0')),
+        'BALANCE_PREFETCH_PAGE_SIZE': int(os.getenv('BALANCE_PREFETCH_PAGE_SIZE', '1000')),
+
+        # Guilds switched to the local economy with /economy: cash a user starts with,
+        # and how many balances are kept in memory in front of the database
+        'LOCAL_ECONOMY_STARTING_CASH': int(os.getenv('LOCAL_ECONOMY_STARTING_CASH', '0')),
+        'LOCAL_ECONOMY_HOT_SET': int(os.getenv('LOCAL_ECONOMY_HOT_SET', '50000')),
+
+        # Default bet settlement for guilds that haven't picked one with /payout:
+        # 'multiplier' pays winners 1.5x-2.5x from the house, 'parimutuel' splits the losing stakes
+        'PAYOUT_MODE': os.getenv('PAYOUT_MODE', 'multiplier').lower(),
+        # Share of the losing stakes the house keeps in pari-mutuel mode
+        'PARIMUTUEL_RAKE': float(os.getenv('PARIMUTUEL_RAKE', '0.05')),
+
+        # Seconds between memory watchdog checks (0 = only on /memory), and how long a fight may run once it
+        # got its ring (time waiting in the queue doesn't count) before it counts as stuck and is refunded
+        'WATCHDOG_INTERVAL': float(os.getenv('WATCHDOG_INTERVAL', '300')),
+        'MAX_FIGHT_AGE': float(os.getenv('MAX_FIGHT_AGE', '1800')),
+
+        # Per-interaction tracing (tracing.py): share of interactions written to TRACE_PATH as a Chrome trace,
+        # plus any interaction slower than TRACE_SLOW_THRESHOLD seconds (0 = only sampled ones)
+        'TRACE_PATH': os.getenv('TRACE_PATH', 'traces.json'),
+        'TRACE_SAMPLE_RATE': float(os.getenv('TRACE_SAMPLE_RATE', '0')),
+        'TRACE_SLOW_THRESHOLD': float(os.getenv('TRACE_SLOW_THRESHOLD', '0')),
+
+        # Bearer token for the /debug/profile endpoint of the health server (unset = endpoint disabled)
+        'PROFILE_TOKEN': os.getenv('PROFILE_TOKEN'),
+
+        # Lock file that keeps a second copy of the bot (same cluster ID) from starting
+        'INSTANCE_LOCK_PATH': os.getenv('INSTANCE_LOCK_PATH', 'bot.lock'),
+        # supervisor.py: its own lock, where crash records go, and the restart backoff in seconds
+        'SUPERVISOR_LOCK_PATH': os.getenv('SUPERVISOR_LOCK_PATH', 'supervisor.lock'),
+        'CRASH_LOG_PATH': os.getenv('CRASH_LOG_PATH', 'crashes.jsonl'),
+        'RESTART_BACKOFF_BASE': float(os.getenv('RESTART_BACKOFF_BASE', '5')),
+        'RESTART_BACKOFF_MAX': float(os.getenv('RESTART_BACKOFF_MAX', '300')),
     }
 
     # Validate required configuration
     if not config['TOKEN']:
         raise ValueError("DISCORD_TOKEN is required in .env file")
-        
+
     if not config['UNBELIEVABOAT_API_KEY']:
         raise ValueError("UNBELIEVABOAT_API_TOKEN is required in .env file")  # Updated error message
 
+    if config['SHARDING'] not in ('off', 'auto'):
+        raise ValueError("SHARDING must be either 'off' or 'auto'")
+
+    if config['CACHE_PROFILE'] not in ('full', 'minimal'):
+        raise ValueError("CACHE_PROFILE must be either 'full' or 'minimal'")
+
+    if config['PAYOUT_MODE'] not in ('multiplier', 'parimutuel'):
+        raise ValueError("PAYOUT_MODE must be either 'multiplier' or 'parimutuel'")
+
+    if not 0 <= config['PARIMUTUEL_RAKE'] < 1:
+        raise ValueError("PARIMUTUEL_RAKE must be between 0 and 1")
+
+    if not 1 <= config['BALANCE_PREFETCH_PAGE_SIZE'] <= 1000:
+        raise ValueError("BALANCE_PREFETCH_PAGE_SIZE must be between 1 and 1000")
+
+    if config['MAX_FIGHT_AGE'] < 60:
+        raise ValueError("MAX_FIGHT_AGE must be at least 60 seconds")
+
+    if not 0 <= config['TRACE_SAMPLE_RATE'] <= 1:
+        raise ValueError("TRACE_SAMPLE_RATE must be between 0 and 1")
+
+    if config['LOCAL_ECONOMY_HOT_SET'] < 1:
+        raise ValueError("LOCAL_ECONOMY_HOT_SET must be at least 1")
+
+    if config['SHARD_IDS'] is not None and config['SHARD_COUNT'] is None:
+        raise ValueError("SHARD_COUNT is required when SHARD_IDS is set")
+
     return config
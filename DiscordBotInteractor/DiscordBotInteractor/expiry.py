@@ -0,0 +1,101 @@
+import time
+import heapq
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('BotAutomation.Expiry')
+
+class ExpiryScheduler:
+    """
+    One task that owns every deadline, instead of a timer task per challenge.
+
+    Deadlines are wall-clock timestamps so they can be rebuilt from persisted
+    state after a restart. Cancelled or rescheduled entries stay in the heap
+    and are skipped when they surface.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], Awaitable[None]], batch_size: int = 50):
+        """
+        Args:
+            handler: Coroutine function called with a batch of due keys
+            batch_size (int): Maximum number of keys handed to one handler call
+        """
+        self.handler = handler
+        self.batch_size = batch_size
+        self._heap: List[Tuple[float, Any]] = []
+        self._deadlines: Dict[Any, float] = {}  # key -> live deadline
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, key: Any, deadline: float):
+        """Expire key at the given time.time() deadline, replacing any earlier schedule"""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if self._heap[0][1] == key:
+            self._wakeup.set()  # New earliest deadline, re-arm the sleep
+
+    def cancel(self, key: Any):
+        self._deadlines.pop(key, None)
+
+    def next_deadline(self) -> Optional[float]:
+        return min(self._deadlines.values()) if self._deadlines else None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Stop firing expirations; pending deadlines are left for the next start.
+
+        A batch already handed to the handler is allowed to finish so its
+        refunds are not cut off halfway. The task is only cancelled if that
+        batch takes longer than timeout seconds.
+        """
+        task, self._task = self._task, None
+        if task is None or task.done():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Expiry batch still running after {timeout:.0f}s, cancelling it")
+            task.cancel()
+
+    def _pop_due(self, now: float) -> List[Any]:
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            deadline, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) != deadline:
+                continue  # Cancelled or rescheduled
+            del self._deadlines[key]
+            due.append(key)
+        return due
+
+    async def _run(self):
+        while not self._stopping:
+            due = self._pop_due(time.time())
+            if due:
+                try:
+                    await self.handler(due)
+                except Exception as e:
+                    logger.error(f"Error expiring {len(due)} entries: {str(e)}", exc_info=True)
+                continue
+
+            # Drop stale entries so the sleep below targets a live deadline
+            while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
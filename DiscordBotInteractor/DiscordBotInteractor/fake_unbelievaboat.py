@@ -0,0 +1,157 @@
+import time
+import random
+import asyncio
+import logging
+import argparse
+import aiohttp.web
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger('BotAutomation.FakeUnbelievaBoat')
+
+class FakeUnbelievaBoat:
+    """
+    Local stand-in for the UnbelievaBoat REST API, for load tests.
+
+    Serves GET/PATCH /api/v1/guilds/{guild_id}/users/{user_id} and the paged
+    leaderboard at GET /api/v1/guilds/{guild_id}/users against in-memory
+    balances, with configurable latency and a global token bucket
+    that answers 429 with Retry-After once it runs dry. Point the bot at it
+    with UNBELIEVABOAT_API_URL=http://host:port/api.
+    """
+
+    def __init__(self, starting_cash: int = 1_000_000, latency: float = 0.05, jitter: float = 0.02, rate_limit: float = 0.0):
+        """
+        Args:
+            starting_cash (int): Cash of a user the first time they are seen
+            latency (float): Mean seconds added to every request
+            jitter (float): Maximum seconds of random latency on top of the mean
+            rate_limit (float): Requests per second before answering 429 (0 disables it)
+        """
+        self.starting_cash = starting_cash
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.balances: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self.calls = Counter()  # "METHOD status" -> count
+        self._tokens = rate_limit
+        self._refilled_at = time.monotonic()
+
+    def reset(self):
+        self.balances.clear()
+        self.calls.clear()
+        self._tokens = self.rate_limit
+        self._refilled_at = time.monotonic()
+
+    def _take_token(self) -> float:
+        """Spend one request from the bucket, returning seconds until one is available if it is empty"""
+        if not self.rate_limit:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled_at) * self.rate_limit)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate_limit
+
+    def _user(self, guild_id: str, user_id: str) -> Dict[str, int]:
+        user = self.balances.get((guild_id, user_id))
+        if user is None:
+            user = self.balances[(guild_id, user_id)] = {'cash': self.starting_cash, 'bank': 0}
+        return user
+
+    def seed(self, guild_id: str, user_ids):
+        """Create users up front so they show up on the leaderboard"""
+        for user_id in user_ids:
+            self._user(guild_id, user_id)
+
+    def _body(self, guild_id: str, user_id: str, user: Dict[str, int]) -> Dict:
+        return {'user_id': user_id, 'guild_id': guild_id, 'cash': user['cash'], 'bank': user['bank'], 'total': user['cash'] + user['bank']}
+
+    async def _refuse(self, request: aiohttp.web.Request) -> Optional[aiohttp.web.Response]:
+        """Latency, then the 429/401 answer for a request that doesn't get through, if any"""
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+        retry_after = self._take_token()
+        if retry_after:
+            self.calls[f"{request.method} 429"] += 1
+            return aiohttp.web.json_response(
+                {'message': 'You are being rate limited.', 'retry_after': int(retry_after * 1000)},
+                status=429,
+                headers={'Retry-After': str(max(1, round(retry_after)))}
+            )
+
+        if request.headers.get('Authorization') is None:
+            self.calls[f"{request.method} 401"] += 1
+            return aiohttp.web.json_response({'message': '401: Unauthorized'}, status=401)
+        return None
+
+    async def handle_user(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        refused = await self._refuse(request)
+        if refused:
+            return refused
+
+        guild_id, user_id = request.match_info['guild_id'], request.match_info['user_id']
+        user = self._user(guild_id, user_id)
+        if request.method == 'PATCH':
+            changes = await request.json()
+            user['cash'] += int(changes.get('cash', 0))
+            user['bank'] += int(changes.get('bank', 0))
+
+        self.calls[f"{request.method} 200"] += 1
+        return aiohttp.web.json_response(self._body(guild_id, user_id, user))
+
+    async def handle_leaderboard(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        refused = await self._refuse(request)
+        if refused:
+            return refused
+
+        guild_id = request.match_info['guild_id']
+        sort = request.query.get('sort', 'total')
+        limit = min(1000, int(request.query.get('limit', 1000)))
+        page = max(1, int(request.query.get('page', 1)))
+
+        users = [self._body(guild, user_id, user) for (guild, user_id), user in self.balances.items() if guild == guild_id]
+        users.sort(key=lambda body: body.get(sort, body['total']), reverse=True)
+        for rank, body in enumerate(users, 1):
+            body['rank'] = str(rank)
+        total_pages = max(1, -(-len(users) // limit))
+
+        self.calls["GET leaderboard 200"] += 1
+        return aiohttp.web.json_response({
+            'users': users[(page - 1) * limit:page * limit],
+            'page': page,
+            'total_pages': total_pages,
+        })
+
+    def app(self) -> aiohttp.web.Application:
+        app = aiohttp.web.Application()
+        app.router.add_get('/api/v1/guilds/{guild_id}/users', self.handle_leaderboard)
+        app.router.add_get('/api/v1/guilds/{guild_id}/users/{user_id}', self.handle_user)
+        app.router.add_patch('/api/v1/guilds/{guild_id}/users/{user_id}', self.handle_user)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> Tuple[aiohttp.web.AppRunner, str]:
+        """Serve in the running loop; returns the runner (for cleanup) and the API base URL"""
+        runner = aiohttp.web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        site = aiohttp.web.TCPSite(runner, host, port)
+        await site.start()
+        bound_port = runner.addresses[0][1]
+        logger.info(f"Fake UnbelievaBoat API listening on {host}:{bound_port}")
+        return runner, f"http://{host}:{bound_port}/api"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake UnbelievaBoat API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--starting-cash', type=int, default=1_000_000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="Requests per second before 429s (0 = unlimited)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeUnbelievaBoat(args.starting_cash, args.latency, args.jitter, args.rate_limit)
+    aiohttp.web.run_app(fake.app(), host=args.host, port=args.port)
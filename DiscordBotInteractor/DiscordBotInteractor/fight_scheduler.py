@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import contextlib
+from collections import Counter, deque
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger('BotAutomation.FightScheduler')
+
+class _Waiter:
+    __slots__ = ('guild_id', 'channel_id', 'future')
+
+    def __init__(self, guild_id: int, channel_id: int, future: asyncio.Future):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.future = future
+
+class FightScheduler:
+    """
+    Caps how many fights run at once per channel and per guild.
+
+    Accepted fights beyond the limits wait in a FIFO queue and start as soon as
+    a running fight in their channel/guild finishes, which keeps the message
+    rate of a channel bounded no matter how many challenges are accepted.
+    A limit of 0 means unlimited.
+    """
+
+    def __init__(self, max_per_channel: int = 0, max_per_guild: int = 0):
+        self.max_per_channel = max_per_channel
+        self.max_per_guild = max_per_guild
+        self._running_by_channel = Counter()
+        self._running_by_guild = Counter()
+        self._queue = deque()
+
+    def set_limits(self, max_per_channel: int, max_per_guild: int):
+        """Change the limits while fights run; raised limits start queued fights right away"""
+        self.max_per_channel = max_per_channel
+        self.max_per_guild = max_per_guild
+        self._promote()
+
+    def _has_capacity(self, guild_id: int, channel_id: int) -> bool:
+        if self.max_per_channel and self._running_by_channel[channel_id] >= self.max_per_channel:
+            return False
+        if self.max_per_guild and self._running_by_guild[guild_id] >= self.max_per_guild:
+            return False
+        return True
+
+    def _take(self, guild_id: int, channel_id: int):
+        self._running_by_channel[channel_id] += 1
+        self._running_by_guild[guild_id] += 1
+
+    def _release(self, guild_id: int, channel_id: int):
+        self._running_by_channel[channel_id] -= 1
+        if self._running_by_channel[channel_id] <= 0:
+            del self._running_by_channel[channel_id]
+        self._running_by_guild[guild_id] -= 1
+        if self._running_by_guild[guild_id] <= 0:
+            del self._running_by_guild[guild_id]
+
+    def _promote(self):
+        """Start queued fights in FIFO order wherever capacity has freed up"""
+        for waiter in list(self._queue):
+            if waiter.future.done():
+                self._queue.remove(waiter)
+            elif self._has_capacity(waiter.guild_id, waiter.channel_id):
+                self._queue.remove(waiter)
+                self._take(waiter.guild_id, waiter.channel_id)
+                waiter.future.set_result(None)
+
+    def queue_position(self, waiter: _Waiter) -> int:
+        """1-based position among queued fights of the same guild"""
+        position = 1
+        for queued in self._queue:
+            if queued is waiter:
+                return position
+            if queued.guild_id == waiter.guild_id:
+                position += 1
+        return 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self, guild_id: int, channel_id: int, on_queued: Optional[Callable[[int], Awaitable[None]]] = None):
+        """
+        Hold a fight slot for the duration of the block, queueing if needed
+
+        Args:
+            guild_id (int): Guild the fight runs in
+            channel_id (int): Channel the fight posts to
+            on_queued: Coroutine function called with the queue position when the fight has to wait
+        """
+        if not self._queue and self._has_capacity(guild_id, channel_id):
+            self._take(guild_id, channel_id)
+        else:
+            waiter = _Waiter(guild_id, channel_id, asyncio.get_running_loop().create_future())
+            self._queue.append(waiter)
+            self._promote()  # Earlier fights keep priority; this one starts now only if nothing ahead blocks it
+            try:
+                if not waiter.future.done():
+                    position = self.queue_position(waiter)
+                    logger.info(f"Fight queued in channel {channel_id} at position {position}")
+                    if on_queued:
+                        await on_queued(position)
+                await waiter.future
+            except BaseException:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    self._release(guild_id, channel_id)  # Slot was granted as we were cancelled
+                    self._promote()
+                else:
+                    waiter.future.cancel()
+                    if waiter in self._queue:
+                        self._queue.remove(waiter)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(guild_id, channel_id)
+            self._promote()
+
+    def snapshot(self):
+        return {
+            'running': sum(self._running_by_channel.values()),
+            'busy_channels': len(self._running_by_channel),
+            'queued': len(self._queue),
+        }
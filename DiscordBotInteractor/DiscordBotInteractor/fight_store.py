@@ -0,0 +1,313 @@
+import os
+import time
+import sqlite3
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from bet_book import BetBook
+
+logger = logging.getLogger('BotAutomation.FightStore')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fights (
+    message_id      INTEGER PRIMARY KEY,
+    guild_id        INTEGER NOT NULL,
+    channel_id      INTEGER NOT NULL,
+    challenger_id   INTEGER NOT NULL,
+    challenger_name TEXT NOT NULL,
+    target_id       INTEGER NOT NULL,
+    target_name     TEXT NOT NULL,
+    accepted        INTEGER NOT NULL DEFAULT 0,
+    expires_at      REAL NOT NULL,
+    payout_mode     TEXT NOT NULL DEFAULT 'multiplier',
+    rake            REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS bets (
+    message_id INTEGER NOT NULL,
+    user_id    INTEGER NOT NULL,
+    fighter_id INTEGER NOT NULL,
+    amount     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bets_by_fight ON bets (message_id);
+CREATE TABLE IF NOT EXISTS guild_settings (
+    guild_id    INTEGER PRIMARY KEY,
+    payout_mode TEXT NOT NULL,
+    rake        REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settlements (
+    message_id  INTEGER PRIMARY KEY,
+    guild_id    INTEGER NOT NULL,
+    payout_mode TEXT NOT NULL,
+    pot         INTEGER NOT NULL,
+    paid_out    INTEGER NOT NULL,
+    settled_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS settlements_by_guild ON settlements (guild_id);
+CREATE TABLE IF NOT EXISTS credit_outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id        TEXT NOT NULL,
+    user_id         TEXT NOT NULL,
+    amount          INTEGER NOT NULL,
+    reason          TEXT NOT NULL,
+    created_at      REAL NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    failed          INTEGER NOT NULL DEFAULT 0,
+    last_error      TEXT
+);
+CREATE INDEX IF NOT EXISTS credit_outbox_due ON credit_outbox (failed, next_attempt_at);
+CREATE TABLE IF NOT EXISTS economy_guilds (
+    guild_id   TEXT PRIMARY KEY,
+    enabled_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS economy_balances (
+    guild_id TEXT NOT NULL,
+    user_id  TEXT NOT NULL,
+    cash     INTEGER NOT NULL,
+    bank     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS economy_balances_by_cash ON economy_balances (guild_id, cash DESC);
+"""
+
+# Columns added to existing tables after their first release: table -> [(column, definition)]
+MIGRATIONS = {
+    'fights': [
+        ('payout_mode', "TEXT NOT NULL DEFAULT 'multiplier'"),
+        ('rake', "REAL NOT NULL DEFAULT 0"),
+    ],
+}
+
+FIGHT_COLUMNS = ('guild_id', 'channel_id', 'challenger_id', 'challenger_name', 'target_id', 'target_name', 'accepted', 'expires_at', 'payout_mode', 'rake')
+
+class FightStore:
+    """
+    SQLite record of open challenges and the bets placed on them.
+
+    Every challenge and bet is written here before it is acknowledged, so a
+    restart can pick open challenges back up and refund interrupted fights.
+    It also holds the credit outbox: payouts and refunds waiting to be
+    delivered to UnbelievaBoat by CreditOutbox, and the balances of guilds
+    that use the local economy instead (see LocalEconomy).
+    """
+
+    def __init__(self, path: str, starting_cash: int = 0):
+        self.path = path
+        self.starting_cash = starting_cash  # Cash of a local economy user the first time they are credited
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        logger.info(f"Fight store opened at {path}")
+
+    def _migrate(self):
+        for table, columns in MIGRATIONS.items():
+            existing = {row['name'] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for column, definition in columns:
+                if column not in existing:
+                    logger.info(f"Adding column {table}.{column}")
+                    with self.conn:
+                        self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def save_fight(self, message_id: int, fight: Dict):
+        with self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO fights (message_id, {', '.join(FIGHT_COLUMNS)}) VALUES (?{', ?' * len(FIGHT_COLUMNS)})",
+                (message_id, *(fight[column] for column in FIGHT_COLUMNS))
+            )
+
+    def set_accepted(self, message_id: int):
+        with self.conn:
+            self.conn.execute("UPDATE fights SET accepted = 1 WHERE message_id = ?", (message_id,))
+
+    def delete_fight(self, message_id: int, credits: Iterable[Tuple[str, str, int, str]] = (), settlement: Optional[Dict] = None,
+                     local_credits: bool = False):
+        """
+        Forget a fight and its bets once it has been settled or refunded
+
+        Its payouts or refunds (guild_id, user_id, amount, reason) and the
+        settlement record are written in the same transaction, so a restart
+        can neither lose them nor refund a fight that was already paid out.
+        With local_credits they are applied to local economy balances in that
+        transaction instead of being queued for the outbox.
+        """
+        now = time.time()
+        with self.conn:
+            if local_credits:
+                self._add_to_balances((guild_id, user_id, amount) for guild_id, user_id, amount, _ in credits)
+            else:
+                self._insert_credits(credits, now)
+            if settlement is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO settlements (message_id, guild_id, payout_mode, pot, paid_out, settled_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (message_id, settlement['guild_id'], settlement['payout_mode'], settlement['pot'], settlement['paid_out'], now)
+                )
+            self.conn.execute("DELETE FROM bets WHERE message_id = ?", (message_id,))
+            self.conn.execute("DELETE FROM fights WHERE message_id = ?", (message_id,))
+
+    def add_bet(self, message_id: int, user_id: int, fighter_id: int, amount: int):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO bets (message_id, user_id, fighter_id, amount) VALUES (?, ?, ?, ?)",
+                (message_id, user_id, fighter_id, amount)
+            )
+
+    def load(self) -> Tuple[Dict[int, Dict], Dict[int, BetBook]]:
+        """Return every stored fight and its bet book, keyed by challenge message ID"""
+        fights = {}
+        for row in self.conn.execute("SELECT * FROM fights"):
+            fight = {column: row[column] for column in FIGHT_COLUMNS}
+            fight['accepted'] = bool(fight['accepted'])
+            fights[row['message_id']] = fight
+
+        books: Dict[int, BetBook] = {}
+        for row in self.conn.execute("SELECT * FROM bets ORDER BY rowid"):
+            fight = fights.get(row['message_id'])
+            if fight is None:
+                continue
+            book = books.get(row['message_id'])
+            if book is None:
+                book = books[row['message_id']] = BetBook(fight['challenger_id'], fight['target_id'])
+            book.add(row['user_id'], row['fighter_id'], row['amount'])
+        return fights, books
+
+    def get_guild_settings(self, guild_id: int) -> Optional[Tuple[str, float]]:
+        """(payout_mode, rake) chosen for a guild, None if it uses the defaults"""
+        row = self.conn.execute("SELECT payout_mode, rake FROM guild_settings WHERE guild_id = ?", (guild_id,)).fetchone()
+        return (row['payout_mode'], row['rake']) if row else None
+
+    def set_guild_settings(self, guild_id: int, payout_mode: str, rake: float):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO guild_settings (guild_id, payout_mode, rake) VALUES (?, ?, ?)",
+                (guild_id, payout_mode, rake)
+            )
+
+    def house_totals(self, guild_id: int) -> Dict[str, Dict[str, int]]:
+        """
+        Per payout mode: fights settled, total staked, total paid out and the
+        house's net (positive when the house kept money, negative when it minted it)
+        """
+        totals = {}
+        for row in self.conn.execute(
+            "SELECT payout_mode, COUNT(*) AS fights, SUM(pot) AS pot, SUM(paid_out) AS paid_out "
+            "FROM settlements WHERE guild_id = ? GROUP BY payout_mode", (guild_id,)
+        ):
+            totals[row['payout_mode']] = {
+                'fights': row['fights'],
+                'pot': row['pot'],
+                'paid_out': row['paid_out'],
+                'house_net': row['pot'] - row['paid_out'],
+            }
+        return totals
+
+    def _insert_credits(self, credits: Iterable[Tuple[str, str, int, str]], now: float, held: Optional[str] = None):
+        self.conn.executemany(
+            "INSERT INTO credit_outbox (guild_id, user_id, amount, reason, created_at, next_attempt_at, failed, last_error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(guild_id, user_id, amount, reason, now, now, int(held is not None), held) for guild_id, user_id, amount, reason in credits]
+        )
+
+    def add_credits(self, credits: Iterable[Tuple[str, str, int, str]]):
+        """Queue credits (guild_id, user_id, amount, reason) for the outbox worker"""
+        with self.conn:
+            self._insert_credits(credits, time.time())
+
+    def hold_credits(self, credits: Iterable[Tuple[str, str, int, str]], error: str):
+        """Record credits that may be owed as failed, so they wait for manual review instead of being sent"""
+        with self.conn:
+            self._insert_credits(credits, time.time(), held=error)
+
+    def due_credits(self, now: float, limit: int) -> List[sqlite3.Row]:
+        """Oldest pending credits whose next attempt is due"""
+        return self.conn.execute(
+            "SELECT id, guild_id, user_id, amount, attempts FROM credit_outbox "
+            "WHERE failed = 0 AND next_attempt_at <= ? ORDER BY id LIMIT ?", (now, limit)
+        ).fetchall()
+
+    def next_credit_at(self) -> Optional[float]:
+        row = self.conn.execute("SELECT MIN(next_attempt_at) AS next_at FROM credit_outbox WHERE failed = 0").fetchone()
+        return row['next_at']
+
+    def checkpoint_credits(self, delivered: List[int], retries: List[Tuple[float, str, int]], failed: List[Tuple[str, int]]):
+        """
+        Record the outcome of one delivery batch in a single transaction
+
+        Args:
+            delivered: IDs of credits the API accepted, removed from the outbox
+            retries: (next attempt time, error, ID) of credits to try again
+            failed: (error, ID) of credits the API rejected; kept for manual review
+        """
+        with self.conn:
+            self.conn.executemany("DELETE FROM credit_outbox WHERE id = ?", [(credit_id,) for credit_id in delivered])
+            self.conn.executemany(
+                "UPDATE credit_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?", retries
+            )
+            self.conn.executemany(
+                "UPDATE credit_outbox SET attempts = attempts + 1, failed = 1, last_error = ? WHERE id = ?", failed
+            )
+
+    def outbox_counts(self) -> Dict[str, int]:
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(failed = 0), 0) AS pending, COALESCE(SUM(failed = 0 AND attempts > 0), 0) AS retrying, "
+            "COALESCE(SUM(failed), 0) AS failed FROM credit_outbox"
+        ).fetchone()
+        return {'pending': row['pending'], 'retrying': row['retrying'], 'failed': row['failed']}
+
+    def economy_guilds(self) -> List[str]:
+        """Guilds that use the local economy"""
+        return [row['guild_id'] for row in self.conn.execute("SELECT guild_id FROM economy_guilds")]
+
+    def set_economy_guild(self, guild_id: str, local: bool):
+        with self.conn:
+            if local:
+                self.conn.execute("INSERT OR IGNORE INTO economy_guilds (guild_id, enabled_at) VALUES (?, ?)", (guild_id, time.time()))
+            else:
+                self.conn.execute("DELETE FROM economy_guilds WHERE guild_id = ?", (guild_id,))
+
+    def get_balance(self, guild_id: str, user_id: str) -> Optional[Tuple[int, int]]:
+        """(cash, bank) of a local economy user, None if they have never had a balance"""
+        row = self.conn.execute(
+            "SELECT cash, bank FROM economy_balances WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+        ).fetchone()
+        return (row['cash'], row['bank']) if row else None
+
+    def write_balances(self, balances: Iterable[Tuple[str, str, int, int]]):
+        """Store (guild_id, user_id, cash, bank) rows in one transaction"""
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO economy_balances (guild_id, user_id, cash, bank) VALUES (?, ?, ?, ?)", balances)
+
+    def add_to_balances(self, deltas: Iterable[Tuple[str, str, int]]):
+        """Add (guild_id, user_id, amount) to local economy cash in one transaction"""
+        with self.conn:
+            self._add_to_balances(deltas)
+
+    def _add_to_balances(self, deltas: Iterable[Tuple[str, str, int]]):
+        self.conn.executemany(
+            "INSERT INTO economy_balances (guild_id, user_id, cash) VALUES (?, ?, ? + ?) "
+            "ON CONFLICT (guild_id, user_id) DO UPDATE SET cash = cash + ?",
+            [(guild_id, user_id, self.starting_cash, amount, amount) for guild_id, user_id, amount in deltas]
+        )
+
+    def leaderboard(self, guild_id: str, offset: int, limit: int) -> Tuple[List[sqlite3.Row], int]:
+        """One page of a local economy guild's balances by cash, and how many users it has"""
+        total = self.conn.execute("SELECT COUNT(*) AS users FROM economy_balances WHERE guild_id = ?", (guild_id,)).fetchone()['users']
+        rows = self.conn.execute(
+            "SELECT user_id, cash, bank FROM economy_balances WHERE guild_id = ? ORDER BY cash DESC LIMIT ? OFFSET ?",
+            (guild_id, limit, offset)
+        ).fetchall()
+        return rows, total
+
+    def close(self):
+        self.conn.close()
+
+def fight_db_path(config) -> str:
+    """
+    Fight database for this process. Cluster processes each keep their own:
+    a guild always lands on the same process, and restore, expiry and the
+    credit outbox then only ever see that process's fights and credits.
+    """
+    if config['CLUSTER_PROCESSES'] <= 1:
+        return config['FIGHT_DB_PATH']
+    root, ext = os.path.splitext(config['FIGHT_DB_PATH'])
+    return f"{root}.{config['CLUSTER_ID']}{ext}"
@@ -3,12 +3,24 @@ from discord import app_commands
 import asyncio
 from discord.ui import Button, View, Modal, TextInput
 import logging
-from utils import setup_logging
+from utils import setup_logging, inflight, defer_interaction, respond, latency_budget
 import os
+import time
 import random
 from typing import Dict, List, Optional
 from config import load_config
-from api_client import UnbelievaBoatAPI
+from api_client import UnbelievaBoatAPI, ECONOMY_UNAVAILABLE
+from fight_store import FightStore, fight_db_path
+from local_economy import LocalEconomy, EconomyRouter
+from bet_book import BetBook
+from bet_ledger import BetLedger
+from balances import BalanceTable, BalancePrefetcher
+from outbox import CreditOutbox
+from expiry import ExpiryScheduler
+from fight_scheduler import FightScheduler
+from outbound import followup, SETTLEMENT, CONFIRMATION, NARRATION
+from tracing import tracer
+from settings import settings
 
 # Setup logging
 logger = setup_logging()
@@ -16,10 +28,37 @@ logger = setup_logging()
 # Load configuration and initialize API client
 config = load_config()
 api_client = UnbelievaBoatAPI()
+fight_store = FightStore(fight_db_path(config), config['LOCAL_ECONOMY_STARTING_CASH'])
+# Every money call goes through the router: UnbelievaBoat, or the local economy for guilds that chose it with /economy
+local_economy = LocalEconomy(fight_store, config['LOCAL_ECONOMY_HOT_SET'])
+economy = EconomyRouter(api_client, local_economy)
+# Last known balances, shared by bet admission and the robbery commands; warmed per guild from the leaderboard
+balance_table = BalanceTable()
+balance_prefetcher = BalancePrefetcher(economy, balance_table, config['BALANCE_PREFETCH_INTERVAL'], config['BALANCE_PREFETCH_PAGE_SIZE'])
+# Payouts and refunds are written to the fight store's outbox and delivered in the background;
+# delivered balances keep the balance table current
+credit_outbox = CreditOutbox(fight_store, economy, on_delivered=lambda guild_id, user_id, data: balance_table.observe(guild_id, user_id, data.get('cash')))
+bet_ledger = BetLedger(economy, credit_outbox, balance_table, config['BALANCE_CACHE_TTL'])
 
-# Store active fights and bets
+# Store active fights and bets (IDs and display names only, mirrored in fight_store)
 active_fights: Dict[int, Dict] = {}  # message_id -> fight info
-active_bets: Dict[int, List[Dict]] = {}  # message_id -> list of bets
+active_bets: Dict[int, BetBook] = {}  # message_id -> bet book
+running_fights: Dict[int, asyncio.Task] = {}  # message_id -> task playing an accepted fight
+
+# Seconds past its deadline before the watchdog closes a challenge the expiry scheduler missed
+EXPIRY_GRACE = 60
+
+# Stable custom_ids for every challenge message; the persistent FightView looks the fight up by message ID
+ACCEPT_CUSTOM_ID = 'fight:accept'
+BET_CHALLENGER_CUSTOM_ID = 'fight:bet:challenger'
+BET_TARGET_CUSTOM_ID = 'fight:bet:target'
+
+PAYOUT_MODES = ('multiplier', 'parimutuel')
+
+BETTING_CLOSED = "Betting is closed, this fight has already started!"
+
+def mention(user_id: int) -> str:
+    return f"<@{user_id}>"
 
 def get_hearts_display(current_hp: int, max_hp: int = 100) -> str:
     """Return a string of hearts based on percentage of health remaining"""
@@ -27,22 +66,35 @@ def get_hearts_display(current_hp: int, max_hp: int = 100) -> str:
     hearts_remaining = round((current_hp / max_hp) * heart_count)
     return "❤️" * hearts_remaining + "🖤" * (heart_count - hearts_remaining)
 
-async def get_user_balance(guild_id: str, user_id: str) -> Optional[int]:
-    """Get user balance using UnbelievaBoat API"""
-    return await api_client.get_balance(guild_id, user_id)
+async def get_user_balance(guild_id: str, user_id: str, timeout: Optional[float] = None) -> Optional[int]:
+    """Get user balance from the balance table when fresh, else from the guild's economy within timeout seconds"""
+    if economy.is_local(guild_id):
+        return await local_economy.get_balance(guild_id, user_id)
+    balance = balance_table.get(guild_id, user_id, config['BALANCE_CACHE_TTL'])
+    if balance is None:
+        balance = await economy.get_balance(guild_id, user_id, timeout)
+        balance_table.observe(guild_id, user_id, balance)
+    return balance
 
-async def update_money(guild_id: str, user_id: str, amount: int) -> Optional[Dict]:
-    """Update user balance using UnbelievaBoat API"""
-    if amount > 0:
-        return await api_client.add_money(guild_id, user_id, amount)
+def close_fight(message_id: int, guild_id: str, credits: List, settlement: Optional[Dict] = None):
+    """Close a fight in the store with its payouts or refunds, applied locally or queued for the outbox"""
+    local = economy.is_local(guild_id)
+    with tracer.span('fight store close', 'store', credits=len(credits)):
+        fight_store.delete_fight(message_id, credits, settlement, local_credits=local)
+    if local:
+        local_economy.forget(guild_id, [user_id for _, user_id, _, _ in credits])
     else:
-        return await api_client.remove_money(guild_id, user_id, abs(amount))
+        credit_outbox.wake()
+
+def payout_settings(guild_id: int):
+    """(payout_mode, rake) for a guild: its /payout choice, else the configured default"""
+    return fight_store.get_guild_settings(guild_id) or (config['PAYOUT_MODE'], config['PARIMUTUEL_RAKE'])
 
 class BetModal(Modal):
-    def __init__(self, message_id: int, fighter: discord.Member):
-        super().__init__(title=f"Place bet on {fighter.display_name}")
+    def __init__(self, message_id: int, fighter_id: int, fighter_name: str):
+        super().__init__(title=f"Place bet on {fighter_name}")
         self.message_id = message_id
-        self.fighter = fighter
+        self.fighter_id = fighter_id
         
         self.amount = TextInput(
             label="Bet Amount (minimum: $1)",
@@ -53,239 +105,468 @@ class BetModal(Modal):
         )
         self.add_item(self.amount)
 
+    @inflight('bet')
     async def on_submit(self, interaction: discord.Interaction):
         try:
             amount = int(self.amount.value)
             if amount < 1:
                 await interaction.response.send_message("Minimum bet amount is $1!", ephemeral=True)
                 return
+
+            if not economy.available_for(interaction.guild_id):
+                await interaction.response.send_message(ECONOMY_UNAVAILABLE, ephemeral=True)
+                return
                 
+            # Balance check and deduction are remote calls; acknowledge the modal first
+            await defer_interaction(interaction, 'bet')
+
+            fight_info = active_fights.get(self.message_id)
+            if not fight_info or fight_info.get('closed'):
+                await respond(interaction, "This fight is no longer active!", ephemeral=True)
+                return
+            if fight_info['accepted']:
+                await respond(interaction, BETTING_CLOSED, ephemeral=True)
+                return
+
             guild_id = str(interaction.guild_id)
             user_id = str(interaction.user.id)
             
-            # Check user balance
-            balance = await get_user_balance(guild_id, user_id)
-            if balance is None:
-                await interaction.response.send_message("Error checking balance. Please try again.", ephemeral=True)
+            # Admit against the cached balance and debit in one call; the returned cash is checked
+            taken, balance = await bet_ledger.withdraw(guild_id, user_id, amount, latency_budget.remaining(interaction))
+            if taken is None:
+                await respond(
+                    interaction,
+                    f"⚠️ Couldn't confirm your ${amount:,} bet with the economy, so it wasn't placed. "
+                    f"If the money left your balance it will be refunded once an admin has checked it.",
+                    ephemeral=True
+                )
                 return
-                
-            logger.info(f"User {user_id} balance: ${balance:,}, trying to bet: ${amount:,}")
-            if balance < amount:
-                await interaction.response.send_message(f"You don't have enough money! Your balance: ${balance:,}", ephemeral=True)
+            if not taken:
+                if balance is None:
+                    await respond(interaction, "Failed to process bet! Please try again.", ephemeral=True)
+                else:
+                    logger.info(f"User {user_id} balance: ${balance:,}, tried to bet: ${amount:,}")
+                    await respond(interaction, f"You don't have enough money! Your balance: ${balance:,}", ephemeral=True)
                 return
-                
-            # Remove bet amount (use negative amount to remove money)
-            result = await update_money(guild_id, user_id, -amount)
-            if not result:
-                await interaction.response.send_message("Failed to process bet! Please try again.", ephemeral=True)
+
+            if not betting_open(active_fights.get(self.message_id)):
+                # Challenge was accepted, expired or settled while the debit was in flight
+                credit_outbox.enqueue(guild_id, user_id, amount, f"fight {self.message_id} late bet refund")
+                await respond(interaction, "Betting on this fight closed before your bet went through. Your bet was refunded.", ephemeral=True)
                 return
                 
             # Record bet
-            if self.message_id not in active_bets:
-                active_bets[self.message_id] = []
+            fight_store.add_bet(self.message_id, interaction.user.id, self.fighter_id, amount)
+            book = active_bets.get(self.message_id)
+            if book is None:
+                book = active_bets[self.message_id] = BetBook(fight_info['challenger_id'], fight_info['target_id'])
+            book.add(interaction.user.id, self.fighter_id, amount)
             
-            active_bets[self.message_id].append({
-                'user': interaction.user,
-                'amount': amount,
-                'fighter': self.fighter
-            })
-            
-            await interaction.response.send_message(
-                f"💰 {interaction.user.mention} has bet ${amount:,} on {self.fighter.mention}!",
+            await respond(
+                interaction,
+                f"💰 {interaction.user.mention} has bet ${amount:,} on {mention(self.fighter_id)}!",
                 ephemeral=False
             )
+
+            # Refresh the pot and odds shown on the challenge message
+            try:
+                await interaction.message.edit(content=challenge_text(fight_info, book))
+            except discord.HTTPException as e:
+                logger.warning(f"Failed to update odds on fight {self.message_id}: {str(e)}")
             
         except ValueError:
             await interaction.response.send_message("Please enter a valid number!", ephemeral=True)
 
-class FightButton(Button):
-    def __init__(self, custom_id: str, label: str, style: discord.ButtonStyle):
-        super().__init__(style=style, label=label, custom_id=custom_id)
+def betting_open(fight: Optional[Dict]) -> bool:
+    """Bets are taken until the challenge is accepted or closed (refunded or settled)"""
+    return fight is not None and not fight['accepted'] and not fight.get('closed')
 
-    async def callback(self, interaction: discord.Interaction):
-        if self.custom_id.startswith('accept_'):
-            message_id = int(self.custom_id.split('_')[1])
-            fight_info = active_fights.get(message_id)
-            
-            if not fight_info:
-                await interaction.response.send_message("This fight is no longer active!", ephemeral=True)
-                return
-                
-            if interaction.user.id != fight_info['target'].id:
-                await interaction.response.send_message("You are not the challenged player!", ephemeral=True)
-                return
-                
-            # Start the fight
-            fight_info['accepted'] = True
-            self.disabled = True
-            await interaction.message.edit(view=self.view)
-            
-            # Fight sequence
-            challenger = fight_info['challenger']
-            target = fight_info['target']
-            
-            await interaction.response.send_message(f"🥊 The fight between {challenger.mention} and {target.mention} begins!")
-            
-            # Fight mechanics with hearts system
-            rounds = []
-            challenger_hp = 100
-            target_hp = 100
-            
-            moves = [
-                ("throws a quick jab", "dodges the jab", "lands a solid hit", 25, "💫"),
-                ("goes for an uppercut", "steps back", "connects with devastating force", 35, "💥"),
-                ("attempts a roundhouse kick", "blocks the kick", "lands perfectly", 40, "🦶"),
-                ("tries a body shot", "guards their body", "hits the mark", 30, "👊"),
-                ("launches a haymaker", "ducks under", "catches them off guard", 45, "⚡")
-            ]
-            
-            # Special moves that can only be used once per fighter
-            special_moves = {
-                challenger.id: True,  # True means special move is available
-                target.id: True
-            }
+def challenge_text(fight: Dict, book: Optional[BetBook] = None) -> str:
+    """Content of a challenge message, with the betting pot and odds once bets are in"""
+    text = (
+        f"🥊 {mention(fight['challenger_id'])} has challenged {mention(fight['target_id'])} to a fight!\n"
+        f"Place your bets now! The challenged player must accept <t:{int(fight['expires_at'])}:R>.\n"
+        f"If the fight is not accepted, all bets will be refunded."
+    )
+    if fight['payout_mode'] == 'parimutuel':
+        text += f"\n🎲 Pari-mutuel betting: winners split the losing side's stakes ({fight['rake']:.0%} house rake)."
+    else:
+        text += "\n🎲 Winning bets pay 1.5x to 2.5x, depending on the winner's remaining health."
+    if book is None or not book.pot:
+        return text
+
+    sides = []
+    for fighter_id, name in ((fight['challenger_id'], fight['challenger_name']), (fight['target_id'], fight['target_name'])):
+        odds = book.odds(fighter_id, fight['rake']) if fight['payout_mode'] == 'parimutuel' else None
+        sides.append(f"{name}: ${book.total_on(fighter_id):,}" + (f" ({odds:.2f}x)" if odds else ""))
+    return f"{text}\n\n💰 **Pot: ${book.pot:,}** — " + " | ".join(sides)
+
+def build_fight_components(fight: Dict, accepted: bool = False) -> View:
+    """
+    Render the buttons for one challenge message.
+
+    The view is stopped before it is sent so discord.py doesn't keep it around
+    per message; clicks are routed by custom_id to the persistent FightView.
+    """
+    view = View(timeout=None)
+    view.add_item(Button(style=discord.ButtonStyle.success, label="Accept Fight", custom_id=ACCEPT_CUSTOM_ID, disabled=accepted))
+    view.add_item(Button(style=discord.ButtonStyle.secondary, label=f"Bet on {fight['challenger_name']}", custom_id=BET_CHALLENGER_CUSTOM_ID, disabled=accepted))
+    view.add_item(Button(style=discord.ButtonStyle.secondary, label=f"Bet on {fight['target_name']}", custom_id=BET_TARGET_CUSTOM_ID, disabled=accepted))
+    view.stop()
+    return view
+
+class FightView(View):
+    """Persistent dispatcher for the buttons of every challenge, registered once with bot.add_view"""
+
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="Accept Fight", style=discord.ButtonStyle.success, custom_id=ACCEPT_CUSTOM_ID)
+    @inflight('fight')
+    async def accept(self, interaction: discord.Interaction, button: Button):
+        await run_fight(interaction)
+
+    @discord.ui.button(label="Bet on challenger", style=discord.ButtonStyle.secondary, custom_id=BET_CHALLENGER_CUSTOM_ID)
+    async def bet_challenger(self, interaction: discord.Interaction, button: Button):
+        await open_bet_modal(interaction, 'challenger')
+
+    @discord.ui.button(label="Bet on target", style=discord.ButtonStyle.secondary, custom_id=BET_TARGET_CUSTOM_ID)
+    async def bet_target(self, interaction: discord.Interaction, button: Button):
+        await open_bet_modal(interaction, 'target')
+
+async def open_bet_modal(interaction: discord.Interaction, side: str):
+    message_id = interaction.message.id
+    fight_info = active_fights.get(message_id)
+
+    if not fight_info or fight_info.get('closed'):
+        await interaction.response.send_message("This fight is no longer active!", ephemeral=True)
+        return
+    if fight_info['accepted']:
+        await interaction.response.send_message(BETTING_CLOSED, ephemeral=True)
+        return
+
+    # Show betting modal; bets are open until the challenge is accepted
+    await interaction.response.send_modal(BetModal(message_id, fight_info[f'{side}_id'], fight_info[f'{side}_name']))
+
+async def run_fight(interaction: discord.Interaction):
+    message_id = interaction.message.id
+    fight_info = active_fights.get(message_id)
+    
+    if not fight_info:
+        await interaction.response.send_message("This fight is no longer active!", ephemeral=True)
+        return
+        
+    if interaction.user.id != fight_info['target_id']:
+        await interaction.response.send_message("You are not the challenged player!", ephemeral=True)
+        return
+
+    if fight_info['accepted']:
+        await interaction.response.send_message("This fight has already started!", ephemeral=True)
+        return
+        
+    # Start the fight
+    fight_info['accepted'] = True
+    fight_store.set_accepted(message_id)
+    interaction.client.expiry_scheduler.cancel(message_id)
+    await interaction.message.edit(view=build_fight_components(fight_info, accepted=True))
+    
+    queued = False
+
+    async def announce_queued(position: int):
+        nonlocal queued
+        queued = True
+        await interaction.response.send_message(
+            f"⏳ {mention(fight_info['challenger_id'])} vs {mention(fight_info['target_id'])} is waiting for a free ring "
+            f"(position {position} in the queue). The fight starts automatically."
+        )
+
+    # Limit concurrent fights per channel/guild; extra fights wait their turn
+    running_fights[message_id] = asyncio.current_task()
+    try:
+        async with interaction.client.fight_scheduler.slot(fight_info['guild_id'], fight_info['channel_id'], on_queued=announce_queued):
+            fight_info['started_at'] = time.time()  # MAX_FIGHT_AGE counts from here, not from the wait in the queue
+            await play_fight(interaction, message_id, fight_info, fight_poster(interaction, message_id, queued))
+    except (Exception, asyncio.CancelledError) as e:
+        # A fight that can't finish (message deleted, Discord error, stopped by the watchdog) is refunded, not left behind
+        logger.error(f"Fight {message_id} did not finish: {type(e).__name__} {str(e)}")
+        await abandon_fight(interaction.client, message_id, "the fight was interrupted")
+        if isinstance(e, asyncio.CancelledError):
+            raise
+    finally:
+        running_fights.pop(message_id, None)
+
+def fight_poster(interaction: discord.Interaction, message_id: int, queued: bool):
+    """
+    Where a fight's messages go: followups to the Accept click, or straight to
+    the channel for a fight that waited in the queue, since the interaction
+    token expires 15 minutes after the click
+    """
+    if not queued:
+        return lambda content, priority=CONFIRMATION: followup(interaction, content, priority)
+    channel = interaction.client.get_partial_messageable(interaction.channel_id, guild_id=interaction.guild_id)
+    return lambda content, priority=CONFIRMATION: interaction.client.outbound.send(
+        interaction.channel_id, channel, content, priority, message_id if priority == NARRATION else None
+    )
+
+async def play_fight(interaction: discord.Interaction, message_id: int, fight_info: Dict, post):
+    # Fight sequence
+    challenger_id, challenger_name = fight_info['challenger_id'], fight_info['challenger_name']
+    target_id, target_name = fight_info['target_id'], fight_info['target_name']
+    
+    begins = f"🥊 The fight between {mention(challenger_id)} and {mention(target_id)} begins!"
+    if interaction.response.is_done():  # The click was answered with the queue notice
+        await post(begins)
+    else:
+        await respond(interaction, begins)
+    
+    # Fight mechanics with hearts system
+    rounds = []
+    challenger_hp = 100
+    target_hp = 100
+    
+    moves = [
+        ("throws a quick jab", "dodges the jab", "lands a solid hit", 25, "💫"),
+        ("goes for an uppercut", "steps back", "connects with devastating force", 35, "💥"),
+        ("attempts a roundhouse kick", "blocks the kick", "lands perfectly", 40, "🦶"),
+        ("tries a body shot", "guards their body", "hits the mark", 30, "👊"),
+        ("launches a haymaker", "ducks under", "catches them off guard", 45, "⚡")
+    ]
+    
+    # Special moves that can only be used once per fighter
+    special_moves = {
+        challenger_id: True,  # True means special move is available
+        target_id: True
+    }
+    
+    while challenger_hp > 0 and target_hp > 0:
+        await tracer.sleep(settings['ROUND_DELAY'])  # Delay between rounds
+        
+        # Randomly determine attacker and defender
+        if random.random() < 0.5:
+            attacker, defender = challenger_id, target_id
+            hp_to_reduce = 'target_hp'
+        else:
+            attacker, defender = target_id, challenger_id
+            hp_to_reduce = 'challenger_hp'
+        
+        # 15% chance for special move if available
+        if random.random() < 0.15 and special_moves[attacker]:
+            special_moves[attacker] = False  # Use up special move
+            damage = random.randint(50, 60)  # Special move does big damage
+            if hp_to_reduce == 'target_hp':
+                target_hp -= damage
+            else:
+                challenger_hp -= damage
+            round_msg = f"⭐ SPECIAL MOVE! {mention(attacker)} unleashes a devastating combo! (-{damage} HP)"
+        else:
+            # Regular moves
+            move, dodge, hit, damage, emoji = random.choice(moves)
             
-            while challenger_hp > 0 and target_hp > 0:
-                await asyncio.sleep(3)  # Delay between rounds
-                
-                # Randomly determine attacker and defender
-                if random.random() < 0.5:
-                    attacker, defender = challenger, target
-                    hp_to_reduce = 'target_hp'
-                else:
-                    attacker, defender = target, challenger
-                    hp_to_reduce = 'challenger_hp'
+            # 70% chance to hit
+            if random.random() < 0.7:
+                # 20% chance for critical hit (1.5x damage)
+                if random.random() < 0.2:
+                    damage = int(damage * 1.5)
+                    hit = "CRITICAL HIT! " + hit
+                    emoji = "🌟"
                 
-                # 15% chance for special move if available
-                if random.random() < 0.15 and special_moves[attacker.id]:
-                    special_moves[attacker.id] = False  # Use up special move
-                    damage = random.randint(50, 60)  # Special move does big damage
-                    if hp_to_reduce == 'target_hp':
-                        target_hp -= damage
-                    else:
-                        challenger_hp -= damage
-                    round_msg = f"⭐ SPECIAL MOVE! {attacker.mention} unleashes a devastating combo! (-{damage} HP)"
+                if hp_to_reduce == 'target_hp':
+                    target_hp -= damage
                 else:
-                    # Regular moves
-                    move, dodge, hit, damage, emoji = random.choice(moves)
-                    
-                    # 70% chance to hit
-                    if random.random() < 0.7:
-                        # 20% chance for critical hit (1.5x damage)
-                        if random.random() < 0.2:
-                            damage = int(damage * 1.5)
-                            hit = "CRITICAL HIT! " + hit
-                            emoji = "🌟"
-                        
-                        if hp_to_reduce == 'target_hp':
-                            target_hp -= damage
-                        else:
-                            challenger_hp -= damage
-                        round_msg = f"{emoji} {attacker.mention} {move} and {hit}! (-{damage} HP)"
-                    else:
-                        round_msg = f"💨 {attacker.mention} {move} but {defender.mention} {dodge}!"
-                
-                rounds.append(round_msg)
-                # Show current HP and hearts status
-                hearts_display = {
-                    challenger.display_name: get_hearts_display(challenger_hp),
-                    target.display_name: get_hearts_display(target_hp)
-                }
-                status = f"\n{challenger.display_name}: {challenger_hp}HP {hearts_display[challenger.display_name]}\n{target.display_name}: {target_hp}HP {hearts_display[target.display_name]}"
-                await interaction.followup.send(f"{round_msg}{status}")
-            
-            # Determine winner
-            winner = challenger if target_hp <= 0 else target
-            loser = target if target_hp <= 0 else challenger
-            
-            # Process bets with multipliers based on remaining health
-            if message_id in active_bets:
-                guild_id = str(interaction.guild_id)
-                winner_hp = challenger_hp if winner == challenger else target_hp
-                
-                # Higher multiplier for more health remaining
-                multiplier = 1.5 + (winner_hp / 100)  # Scales from 1.5x to 2.5x based on remaining HP
-                
-                for bet in active_bets[message_id]:
-                    if bet['fighter'].id == winner.id:
-                        winnings = int(bet['amount'] * multiplier)
-                        await update_money(guild_id, str(bet['user'].id), winnings)
-                        await interaction.followup.send(f"💰 {bet['user'].mention} won ${winnings:,} from their bet! ({multiplier:.1f}x multiplier)")
-                
-                del active_bets[message_id]
-            
-            # Victory message
-            if winner_hp > 75:
-                await interaction.followup.send(f"🏆 DOMINANT VICTORY! {winner.mention} crushes {loser.mention} with {winner_hp}HP remaining!")
-            elif winner_hp > 50:
-                await interaction.followup.send(f"🏆 SOLID WIN! {winner.mention} defeats {loser.mention} with {winner_hp}HP remaining!")
+                    challenger_hp -= damage
+                round_msg = f"{emoji} {mention(attacker)} {move} and {hit}! (-{damage} HP)"
             else:
-                await interaction.followup.send(f"🏆 CLOSE FIGHT! {winner.mention} barely defeats {loser.mention} with {winner_hp}HP remaining!")
-            
-            del active_fights[message_id]
-
-class BetButton(Button):
-    def __init__(self, fighter: discord.Member):
-        super().__init__(
-            style=discord.ButtonStyle.secondary,
-            label=f"Bet on {fighter.display_name}",
-            custom_id=f'temp_bet_{fighter.id}'  # Temporary ID, will be updated
-        )
-        self.fighter = fighter
-        self.message_id = None  # Will be set after message is sent
+                round_msg = f"💨 {mention(attacker)} {move} but {mention(defender)} {dodge}!"
+        
+        rounds.append(round_msg)
+        # Show current HP and hearts status
+        status = f"\n{challenger_name}: {challenger_hp}HP {get_hearts_display(challenger_hp)}\n{target_name}: {target_hp}HP {get_hearts_display(target_hp)}"
+        await post(f"{round_msg}{status}", NARRATION)
+    
+    # Determine winner
+    winner = challenger_id if target_hp <= 0 else target_id
+    loser = target_id if target_hp <= 0 else challenger_id
+    winner_hp = challenger_hp if winner == challenger_id else target_hp
+    
+    if message_id in active_bets:
+        await settle_bets(interaction, message_id, fight_info, winner, winner_hp, post)
+    
+    # Victory message
+    if winner_hp > 75:
+        await post(f"🏆 DOMINANT VICTORY! {mention(winner)} crushes {mention(loser)} with {winner_hp}HP remaining!")
+    elif winner_hp > 50:
+        await post(f"🏆 SOLID WIN! {mention(winner)} defeats {mention(loser)} with {winner_hp}HP remaining!")
+    else:
+        await post(f"🏆 CLOSE FIGHT! {mention(winner)} barely defeats {mention(loser)} with {winner_hp}HP remaining!")
+    
+    del active_fights[message_id]
+    fight_store.delete_fight(message_id)
 
-    async def callback(self, interaction: discord.Interaction):
-        if not self.message_id:
-            await interaction.response.send_message("Error: Fight not properly initialized", ephemeral=True)
-            return
+async def settle_bets(interaction: discord.Interaction, message_id: int, fight_info: Dict, winner: int, winner_hp: int, post):
+    """Pay out the winning side's bets using the payout mode the fight was created with, closing the fight"""
+    guild_id = str(interaction.guild_id)
+    fight_info['closed'] = True
+    book = active_bets.pop(message_id)
+    kind = 'payout'
 
-        fight_info = active_fights.get(self.message_id)
+    if fight_info['payout_mode'] == 'parimutuel':
+        # Winners split the losing stakes; the house keeps only the rake
+        payouts, house_take = book.parimutuel_payouts(winner, fight_info['rake'])
+        logger.info(f"Fight {message_id} settled pari-mutuel: pot ${book.pot:,}, house take ${house_take:,}")
+        if book.total_on(winner):
+            announcement = "💰 {user} won ${amount:,} from the betting pool!"
+        else:
+            # Nobody backed the winner, so the losing stakes went back to their owners
+            kind = 'refund'
+            announcement = "💰 Refunded ${amount:,} to {user}, nobody bet on the winner."
+    else:
+        # Higher multiplier for more health remaining
+        multiplier = 1.5 + (winner_hp / 100)  # Scales from 1.5x to 2.5x based on remaining HP
         
-        if not fight_info:
-            await interaction.response.send_message("This fight is no longer active!", ephemeral=True)
-            return
-            
-        # Show betting modal - removed acceptance check to allow pre-fight betting
-        await interaction.response.send_modal(BetModal(self.message_id, self.fighter))
+        # Only the winning side's bettors are visited
+        payouts = {user_id: int(stake * multiplier) for user_id, stake in book.stakes_on(winner).items()}
+        announcement = "💰 {user} won ${amount:,} from their bet! (" + f"{multiplier:.1f}x multiplier)"
 
-class FightView(View):
-    def __init__(self, challenger: discord.Member, target: discord.Member, timeout: float = 180):
-        super().__init__(timeout=timeout)
-        self.message_id = None  # Will be set after the message is sent
-        self.challenger = challenger
-        self.target = target
-        self.accept_button = FightButton('accept', "Accept Fight", discord.ButtonStyle.success)
-        self.add_item(self.accept_button)
-        self.add_item(BetButton(challenger))
-        self.add_item(BetButton(target))
-
-    async def set_message_id(self, message_id: int):
-        self.message_id = message_id
-        self.accept_button.custom_id = f'accept_{message_id}'
-        for item in self.children:
-            if isinstance(item, BetButton):
-                item.message_id = message_id
-
-    async def on_timeout(self):
-        """Handle timeout - refund all bets if fight wasn't accepted"""
-        if self.message_id in active_fights and not active_fights[self.message_id]['accepted']:
-            if self.message_id in active_bets:
-                guild_id = str(self.message.guild.id)
-                for bet in active_bets[self.message_id]:
-                    # Refund the bet amount
-                    await update_money(guild_id, str(bet['user'].id), bet['amount'])
-                    try:
-                        await self.message.channel.send(f"💰 Refunded ${bet['amount']:,} to {bet['user'].mention} as the fight was not accepted.")
-                    except:
-                        pass  # Message might fail to send
-                del active_bets[self.message_id]
-            del active_fights[self.message_id]
-            try:
-                await self.message.edit(content="⏰ Challenge has expired!", view=None)
-            except:
-                pass  # Message might have been deleted
+    # Payouts are recorded in the same transaction that closes the fight
+    close_fight(
+        message_id, guild_id,
+        credits=[(guild_id, str(user_id), amount, f"fight {message_id} {kind}") for user_id, amount in payouts.items()],
+        settlement={'guild_id': interaction.guild_id, 'payout_mode': fight_info['payout_mode'], 'pot': book.pot, 'paid_out': sum(payouts.values())}
+    )
+
+    for user_id, amount in payouts.items():
+        await post(announcement.format(user=mention(user_id), amount=amount), SETTLEMENT)
+
+async def refund_bets(client, message_id: int, reason: str):
+    """Refund every bet on a fight, close it in the store and announce the refunds in the fight's channel"""
+    fight = active_fights[message_id]
+    fight['closed'] = True  # No new bets while the refunds are announced
+    book = active_bets.pop(message_id, None)
+    refunds = list(book.users()) if book else []  # Everything each user staked on this fight
+
+    # Refunds are recorded in the same transaction that closes the fight
+    close_fight(
+        message_id, str(fight['guild_id']),
+        credits=[(str(fight['guild_id']), str(user_id), amount, f"fight {message_id} refund") for user_id, amount in refunds]
+    )
+
+    channel = client.get_partial_messageable(fight['channel_id'], guild_id=fight['guild_id'])
+    for user_id, amount in refunds:
+        try:
+            await client.outbound.send(fight['channel_id'], channel, f"💰 Refunded ${amount:,} to {mention(user_id)} as {reason}.", SETTLEMENT)
+        except:
+            pass  # Message might fail to send
+
+async def abandon_fight(client, message_id: int, reason: str):
+    """Refund and forget an accepted fight that won't be settled; bets already paid out are not refunded again"""
+    if message_id not in active_fights:
+        return
+    await refund_bets(client, message_id, reason)
+    del active_fights[message_id]
+
+async def sweep_stale_fights(client) -> int:
+    """
+    Close fights that outlived their purpose (StateWatchdog sweep): challenges
+    the expiry scheduler missed, fights running longer than MAX_FIGHT_AGE and
+    bet books left behind by a closed fight. A stuck fight that is still
+    running is cancelled and refunds itself.
+    """
+    now = time.time()
+    swept = 0
+    for message_id, fight in list(active_fights.items()):
+        if not fight['accepted']:
+            if now < fight['expires_at'] + EXPIRY_GRACE:
+                continue
+            client.expiry_scheduler.cancel(message_id)
+            await expire_fight(client, message_id)
+        else:
+            if 'started_at' not in fight or now - fight['started_at'] < config['MAX_FIGHT_AGE']:
+                continue  # Still waiting for a ring, or within its time
+            logger.warning(f"Fight {message_id} has been running for {now - fight['started_at']:.0f}s, closing it")
+            task = running_fights.get(message_id)
+            if task is not None and not task.done():
+                task.cancel()
+            else:
+                await abandon_fight(client, message_id, "the fight got stuck")
+        swept += 1
+
+    # Bet books whose fight is gone can't be paid or refunded from here (the guild went with the fight)
+    for message_id in [message_id for message_id in active_bets if message_id not in active_fights]:
+        book = active_bets.pop(message_id)
+        logger.error(f"Dropping bets on closed fight {message_id} for manual review: {dict(book.users())}")
+        fight_store.delete_fight(message_id)
+        swept += 1
+    return swept
+
+async def expire_fight(client, message_id: int, notice: str = "⏰ Challenge has expired!"):
+    """Refund all bets and close the challenge if the fight wasn't accepted"""
+    fight = active_fights.get(message_id)
+    if not fight or fight['accepted']:
+        return
+
+    await refund_bets(client, message_id, "the fight was not accepted")
+    del active_fights[message_id]
+    try:
+        channel = client.get_partial_messageable(fight['channel_id'], guild_id=fight['guild_id'])
+        await channel.get_partial_message(message_id).edit(content=notice, view=None)
+    except:
+        pass  # Message might have been deleted
+
+async def expire_fights(client, message_ids: List[int]):
+    """Expire a batch of due challenges concurrently (ExpiryScheduler handler)"""
+    async with client.track_inflight('refund'):
+        results = await asyncio.gather(*(expire_fight(client, message_id) for message_id in message_ids), return_exceptions=True)
+    for message_id, result in zip(message_ids, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to expire fight {message_id}: {str(result)}")
+
+async def restore_fights(client):
+    """
+    Reload challenges saved before a restart. Open challenges resume with their
+    original deadline; fights that were interrupted mid-fight are refunded.
+    """
+    fights, books = fight_store.load()
+    active_fights.update(fights)
+    active_bets.update(books)
+
+    for message_id, fight in fights.items():
+        if not fight['accepted']:
+            client.expiry_scheduler.schedule(message_id, fight['expires_at'])
+            continue
+
+        logger.warning(f"Refunding fight {message_id}, it was interrupted by a restart")
+        await refund_bets(client, message_id, "the fight was interrupted")
+        del active_fights[message_id]
+
+    if fights:
+        logger.info(f"Restored {len(fights)} fights from {fight_store.path}")
 
 async def setup_fight_commands(bot):
+    # One dispatcher for every challenge message, including ones sent before a restart
+    bot.add_view(FightView())
+
+    # One scheduler owns every challenge deadline; it is rebuilt from the fight store on startup
+    bot.expiry_scheduler = ExpiryScheduler(lambda message_ids: expire_fights(bot, message_ids))
+    await restore_fights(bot)
+    bot.expiry_scheduler.start()
+
+    bot.fight_scheduler = FightScheduler(settings['MAX_FIGHTS_PER_CHANNEL'], settings['MAX_FIGHTS_PER_GUILD'])
+    settings.on_change(lambda changed: bot.fight_scheduler.set_limits(settings['MAX_FIGHTS_PER_CHANNEL'], settings['MAX_FIGHTS_PER_GUILD']))
+
+    # Delivers payouts and refunds left in the outbox by a previous run as well as new ones
+    bot.credit_outbox = credit_outbox
+    credit_outbox.start()
+
+    bot.watchdog.track('active_fights', lambda: len(active_fights))
+    bot.watchdog.track('running_fights', lambda: len(running_fights))
+    bot.watchdog.track('bet_books', lambda: len(active_bets))
+    bot.watchdog.track('bets', lambda: sum(len(book) for book in active_bets.values()))
+    bot.watchdog.track('balance_table', lambda: len(balance_table))
+    bot.watchdog.track('local_economy_hot_set', lambda: len(local_economy))
+    bot.watchdog.add_sweep('stale_fights', lambda: sweep_stale_fights(bot))
+    # Balances older than the cache TTL are never read again
+    bot.watchdog.add_sweep('balance_table', lambda: balance_table.expire(config['BALANCE_CACHE_TTL']))
+
     @bot.tree.command(name="fight", description="Challenge another player to a fist fight")
     @app_commands.describe(target="The player you want to challenge")
     async def fight(interaction: discord.Interaction, target: discord.Member):
@@ -297,25 +578,64 @@ async def setup_fight_commands(bot):
             await interaction.response.send_message("You can't fight yourself!", ephemeral=True)
             return
 
-        # Create the view
-        view = FightView(interaction.user, target)
+        payout_mode, rake = payout_settings(interaction.guild_id)
+        fight_info = {
+            'guild_id': interaction.guild_id,
+            'channel_id': interaction.channel_id,
+            'challenger_id': interaction.user.id,
+            'challenger_name': interaction.user.display_name,
+            'target_id': target.id,
+            'target_name': target.display_name,
+            'accepted': False,
+            'expires_at': time.time() + settings['CHALLENGE_TIMEOUT'],
+            'payout_mode': payout_mode,  # Fixed for the fight, so bets settle the way they were placed
+            'rake': rake,
+        }
         
         # Send the challenge message
-        response = await interaction.response.send_message(
-            f"🥊 {interaction.user.mention} has challenged {target.mention} to a fight!\n"
-            f"Place your bets now! The challenged player has 3 minutes to accept.\n"
-            f"If the fight is not accepted, all bets will be refunded.",
-            view=view
+        await interaction.response.send_message(
+            challenge_text(fight_info),
+            view=build_fight_components(fight_info)
         )
         
         # Get the message from the response
         message = await interaction.original_response()
-        view.message = message  # Store message for timeout handling
-        await view.set_message_id(message.id)
         
         # Store fight information
-        active_fights[message.id] = {
-            'challenger': interaction.user,
-            'target': target,
-            'accepted': False,
-        }
+        active_fights[message.id] = fight_info
+        fight_store.save_fight(message.id, fight_info)
+        interaction.client.expiry_scheduler.schedule(message.id, fight_info['expires_at'])
+
+    @bot.tree.command(name="payout", description="[ADMIN] Choose how fight bets are paid out in this server")
+    @app_commands.describe(
+        mode="multiplier: the house pays 1.5x-2.5x, parimutuel: winners split the losing stakes",
+        rake="House share of the losing stakes in pari-mutuel mode, e.g. 0.05 for 5%"
+    )
+    @app_commands.choices(mode=[app_commands.Choice(name=mode, value=mode) for mode in PAYOUT_MODES])
+    @app_commands.default_permissions(administrator=True)  # Only visible to admins
+    @app_commands.checks.has_permissions(administrator=True)  # Double-check permissions
+    async def payout(interaction: discord.Interaction, mode: Optional[str] = None, rake: Optional[float] = None):
+        current_mode, current_rake = payout_settings(interaction.guild_id)
+        if mode is None and rake is None:
+            lines = [f"🎲 Payout mode: **{current_mode}**" + (f" ({current_rake:.0%} rake)" if current_mode == 'parimutuel' else "")]
+            for settled_mode, totals in fight_store.house_totals(interaction.guild_id).items():
+                lines.append(
+                    f"{settled_mode}: {totals['fights']:,} fights, ${totals['pot']:,} staked, "
+                    f"${totals['paid_out']:,} paid out, house net ${totals['house_net']:,}"
+                )
+            await interaction.response.send_message("\n".join(lines), ephemeral=True)
+            return
+
+        if rake is not None and not 0 <= rake < 1:
+            await interaction.response.send_message("Rake must be between 0 and 1 (e.g. 0.05 for 5%)!", ephemeral=True)
+            return
+
+        mode = mode or current_mode
+        rake = current_rake if rake is None else rake
+        fight_store.set_guild_settings(interaction.guild_id, mode, rake)
+        logger.info(f"Guild {interaction.guild_id} payout mode set to {mode} (rake {rake:.2%}) by {interaction.user.id}")
+        await interaction.response.send_message(
+            f"🎲 Payout mode is now **{mode}**" + (f" with a {rake:.0%} rake" if mode == 'parimutuel' else "")
+            + ". Challenges already open keep their original mode.",
+            ephemeral=True
+        )
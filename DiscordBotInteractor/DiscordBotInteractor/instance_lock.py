@@ -0,0 +1,69 @@
+import os
+import logging
+from typing import Optional
+
+logger = logging.getLogger('BotAutomation.InstanceLock')
+
+# Exit code of a process that found another instance holding its lock; the supervisor doesn't restart it
+EXIT_DUPLICATE = 3
+
+class InstanceLock:
+    """
+    Exclusive lock on a file, held for the life of the process.
+
+    Uses flock (LockFileEx through msvcrt on Windows), so the lock goes away
+    with the process however it dies and a stale lock file never blocks a
+    restart. The holder's PID is written into the file for operators.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        """Take the lock without waiting; False if another process holds it"""
+        lock_file = open(self.path, 'a+')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def holder(self) -> Optional[int]:
+        """PID written by the current holder, if readable"""
+        try:
+            with open(self.path) as lock_file:
+                return int(lock_file.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def release(self):
+        if self._file is None:
+            return
+        if os.name == 'nt':
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+def instance_lock_path(config) -> str:
+    """Lock file for this bot process; cluster processes each lock their own"""
+    root, ext = os.path.splitext(config['INSTANCE_LOCK_PATH'])
+    return f"{root}.{config['CLUSTER_ID']}{ext}"
@@ -0,0 +1,438 @@
+"""
+Offline load test for the bot's interaction handlers.
+
+Starts fake_unbelievaboat.py in-process, points the bot's API client at it and
+fires synthetic /fight, bet, accept, /woozie and /plock interactions at the
+real handlers of an AutomationBot that never connects to Discord. Reports
+throughput, p50/p99 latency and UnbelievaBoat API calls per scenario.
+
+    python loadtest.py --scenario mixed --duration 30 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import itertools
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import discord
+from fake_unbelievaboat import FakeUnbelievaBoat
+
+logger = logging.getLogger('BotAutomation.LoadTest')
+
+# Arrival rates (interactions per second) per action
+SCENARIOS = {
+    'fights': {'fight': 2.0, 'bet': 10.0, 'accept': 1.5},
+    'robbery': {'woozie': 5.0, 'plock': 5.0},
+    'mixed': {'fight': 1.0, 'bet': 5.0, 'accept': 0.8, 'woozie': 2.0, 'plock': 2.0},
+}
+
+GUILD_ID = 900000000000000001
+ROLE_SHARES = {'Woozie': 0.3, 'Glock': 0.3, 'Shotgun': 0.1}
+
+class _ScaledAsyncio:
+    """asyncio stand-in for the tracing module that scales the bot's round and narration sleeps"""
+
+    def __init__(self, scale: float):
+        self.scale = scale
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    async def sleep(self, delay, result=None):
+        return await asyncio.sleep(delay * self.scale, result)
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+class FakeMember:
+    bot = False
+
+    def __init__(self, user_id: int, name: str, roles: List[FakeRole]):
+        self.id = user_id
+        self.name = self.display_name = name
+        self.roles = roles
+        self.mention = f"<@{user_id}>"
+
+class FakeGuild:
+    chunked = True
+
+    def __init__(self, guild_id: int, members: List[FakeMember], roles: List[FakeRole]):
+        self.id = guild_id
+        self.name = "Load Test"
+        self.members = members
+        self.roles = roles
+
+class FakeMessage:
+    def __init__(self, driver: 'Driver', message_id: int, channel_id: int):
+        self.driver = driver
+        self.id = message_id
+        self.channel_id = channel_id
+
+    async def edit(self, **kwargs):
+        self.driver.messages['edit'] += 1
+
+class FakeChannel:
+    """What bot.get_partial_messageable returns during a load test (refund and expiry notices)"""
+
+    def __init__(self, driver: 'Driver', channel_id: int):
+        self.driver = driver
+        self.id = channel_id
+
+    async def send(self, content=None, **kwargs):
+        self.driver.messages['channel'] += 1
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return FakeMessage(self.driver, message_id, self.id)
+
+class FakeResponse:
+    def __init__(self, interaction: 'FakeInteraction'):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    def _acknowledge(self):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        self._interaction.acked_at = time.perf_counter()
+
+    async def send_message(self, content=None, **kwargs):
+        self._acknowledge()
+        self._interaction.driver.messages['response'] += 1
+
+    async def defer(self, **kwargs):
+        self._acknowledge()
+
+    async def send_modal(self, modal):
+        self._acknowledge()
+        self._interaction.modal = modal
+
+class FakeFollowup:
+    def __init__(self, driver: 'Driver'):
+        self.driver = driver
+
+    async def send(self, content=None, **kwargs):
+        self.driver.messages['followup'] += 1
+
+class FakeInteraction(discord.Interaction):
+    """
+    Interaction built in memory instead of from a gateway payload. It is a
+    discord.Interaction subclass so decorators like utils.inflight accept it.
+    """
+
+    def __init__(self, driver: 'Driver', interaction_type: discord.InteractionType, user: FakeMember,
+                 channel_id: int, command=None, message: Optional[FakeMessage] = None):
+        self.id = discord.utils.time_snowflake(discord.utils.utcnow())
+        self.type = interaction_type
+        self.guild_id = GUILD_ID
+        self.user = user
+        self.message = message
+        self.extras = {}
+        self.driver = driver
+        self.modal = None
+        self.fake_channel_id = channel_id
+        self.created = time.perf_counter()
+        self.acked_at = None
+        self._command = command
+        self._fake_response = FakeResponse(self)
+        self._fake_followup = FakeFollowup(driver)
+        self._original = None
+
+    @property
+    def client(self):
+        return self.driver.bot
+
+    @property
+    def guild(self):
+        return self.driver.guild
+
+    @property
+    def channel_id(self):
+        return self.fake_channel_id
+
+    @property
+    def command(self):
+        return self._command
+
+    @property
+    def response(self):
+        return self._fake_response
+
+    @property
+    def followup(self):
+        return self._fake_followup
+
+    async def original_response(self) -> FakeMessage:
+        if self._original is None:
+            self._original = FakeMessage(self.driver, self.driver.next_id(), self.channel_id)
+        return self._original
+
+    async def delete_original_response(self):
+        pass
+
+def percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 4)
+
+class Driver:
+    """Fires synthetic interactions at one bot and records how each one went"""
+
+    def __init__(self, bot, fight_view_cls, users: int, channels: int):
+        self.bot = bot
+        self.fight_view = fight_view_cls()
+        self._ids = itertools.count(discord.utils.time_snowflake(discord.utils.utcnow()))
+        self.channels = [self.next_id() for _ in range(channels)]
+
+        roles = [FakeRole(self.next_id(), name) for name in ROLE_SHARES]
+        members = []
+        for index in range(users):
+            member_roles = [role for role in roles if random.random() < ROLE_SHARES[role.name]]
+            members.append(FakeMember(self.next_id(), f"user{index}", member_roles))
+        self.guild = FakeGuild(GUILD_ID, members, roles)
+        self.robbers = {
+            name: [member for member in members if any(role.name == name for role in member.roles)] or members
+            for name in ('Woozie', 'Glock')
+        }
+
+        self.open_fights: Dict[int, Dict] = {}  # challenge message ID -> message and fighters
+        self.latencies = defaultdict(list)
+        self.acks = defaultdict(list)
+        self.outcomes = defaultdict(Counter)  # action -> ok / error / skipped / unacked
+        self.messages = Counter()
+        self.tasks = set()
+
+        # Notices sent outside an interaction (refunds, expiry) land on fake channels
+        bot.get_partial_messageable = lambda channel_id, **kwargs: FakeChannel(self, channel_id)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def interaction(self, interaction_type, user, channel_id, command=None, message=None) -> FakeInteraction:
+        return FakeInteraction(self, interaction_type, user, channel_id, command, message)
+
+    async def do_fight(self) -> Optional[FakeInteraction]:
+        challenger, target = random.sample(self.guild.members, 2)
+        interaction = self.interaction(
+            discord.InteractionType.application_command, challenger, random.choice(self.channels), self.bot.tree.get_command('fight')
+        )
+        await interaction.command.callback(interaction, target)
+        message = await interaction.original_response()
+        self.open_fights[message.id] = {'message': message, 'challenger': challenger, 'target': target}
+        return interaction
+
+    async def do_bet(self) -> Optional[FakeInteraction]:
+        if not self.open_fights:
+            return None
+        fight = random.choice(list(self.open_fights.values()))
+        user = random.choice(self.guild.members)
+        button = random.choice((self.fight_view.bet_challenger, self.fight_view.bet_target))
+
+        click = self.interaction(discord.InteractionType.component, user, fight['message'].channel_id, message=fight['message'])
+        await button.callback(click)
+        if click.modal is None:
+            return click  # Fight ended before the modal opened
+
+        click.modal.amount._value = str(random.randint(100, 5000))
+        submit = self.interaction(discord.InteractionType.modal_submit, user, fight['message'].channel_id, message=fight['message'])
+        await click.modal.on_submit(submit)
+        return submit
+
+    async def do_accept(self) -> Optional[FakeInteraction]:
+        if not self.open_fights:
+            return None
+        fight = self.open_fights.pop(random.choice(list(self.open_fights)))
+        interaction = self.interaction(discord.InteractionType.component, fight['target'], fight['message'].channel_id, message=fight['message'])
+        await self.fight_view.accept.callback(interaction)
+        return interaction
+
+    async def _rob(self, command_name: str, role_name: str) -> FakeInteraction:
+        robber = random.choice(self.robbers[role_name])
+        interaction = self.interaction(
+            discord.InteractionType.application_command, robber, random.choice(self.channels), self.bot.tree.get_command(command_name)
+        )
+        await interaction.command.callback(interaction)
+        return interaction
+
+    async def do_woozie(self) -> FakeInteraction:
+        return await self._rob('woozie', 'Woozie')
+
+    async def do_plock(self) -> FakeInteraction:
+        return await self._rob('plock', 'Glock')
+
+    async def run_action(self, action: str):
+        started = time.perf_counter()
+        try:
+            interaction = await getattr(self, f"do_{action}")()
+        except Exception as e:
+            self.outcomes[action]['error'] += 1
+            logger.error(f"{action} failed: {str(e)}", exc_info=True)
+            return
+
+        if interaction is None:
+            self.outcomes[action]['skipped'] += 1  # Nothing to act on yet
+            return
+        if interaction.acked_at is None:
+            self.outcomes[action]['unacked'] += 1  # Discord would show "This interaction failed"
+            return
+        self.outcomes[action]['ok'] += 1
+        self.latencies[action].append(time.perf_counter() - started)
+        self.acks[action].append(interaction.acked_at - interaction.created)
+
+    async def fire(self, action: str, rate: float, deadline: float):
+        """Open-loop Poisson arrivals at the given rate until the deadline"""
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            task = asyncio.create_task(self.run_action(action))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            next_at += random.expovariate(rate)
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+    def report(self, elapsed: float) -> Dict:
+        actions = {}
+        for action, outcomes in self.outcomes.items():
+            actions[action] = {
+                **{outcome: outcomes[outcome] for outcome in ('ok', 'error', 'skipped', 'unacked')},
+                'throughput': round(outcomes['ok'] / elapsed, 3),
+                'latency_p50': percentile(self.latencies[action], 0.5),
+                'latency_p99': percentile(self.latencies[action], 0.99),
+                'ack_p50': percentile(self.acks[action], 0.5),
+                'ack_p99': percentile(self.acks[action], 0.99),
+            }
+        return {'actions': actions, 'messages': dict(self.messages)}
+
+async def run_scenario(name: str, rates: Dict[str, float], fake: FakeUnbelievaBoat, args) -> Dict:
+    import fist_fight
+    from bot_automation import AutomationBot, register_commands
+    from config import load_config
+
+    bot = AutomationBot(load_config())
+    register_commands(bot)
+    await fist_fight.setup_fight_commands(bot)
+    driver = Driver(bot, fist_fight.FightView, args.users, args.channels)
+    fake.calls.clear()
+    # Local economy guilds start every user with --starting-cash, like the fake API
+    fist_fight.local_economy.enable(str(driver.guild.id), args.local_economy)
+    if args.prefetch and not args.local_economy:
+        # One leaderboard scan instead of a balance GET per robbery target and bettor
+        fake.seed(str(driver.guild.id), [str(member.id) for member in driver.guild.members])
+        await fist_fight.balance_prefetcher.prefetch(str(driver.guild.id))
+
+    logger.warning(f"Scenario {name}: {rates} for {args.duration:.0f}s")
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(driver.fire(action, rate, deadline) for action, rate in rates.items() if rate > 0))
+
+    unfinished = 0
+    if driver.tasks:
+        done, pending = await asyncio.wait(set(driver.tasks), timeout=args.drain_timeout)
+        unfinished = len(pending)
+        for task in pending:
+            task.cancel()
+    elapsed = time.perf_counter() - started
+
+    report = driver.report(elapsed)
+    report.update({
+        'scenario': name,
+        'rates': rates,
+        'elapsed': round(elapsed, 3),
+        'unfinished': unfinished,
+        'api_calls': dict(fake.calls),
+        'fight_scheduler': bot.fight_scheduler.snapshot(),
+        'open_fights': len(fist_fight.active_fights),
+        'credit_outbox': bot.credit_outbox.snapshot(),
+        'outbound': bot.outbound.snapshot(),
+        'balance_table': fist_fight.balance_table.snapshot(),
+        'local_economy': fist_fight.local_economy.snapshot(),
+    })
+
+    # Leave nothing behind for the next scenario
+    await bot.expiry_scheduler.stop()
+    await bot.credit_outbox.stop()
+    for message_id in list(fist_fight.active_fights):
+        fist_fight.fight_store.delete_fight(message_id)
+    fist_fight.active_fights.clear()
+    fist_fight.active_bets.clear()
+    return report
+
+async def run(args) -> List[Dict]:
+    fake = FakeUnbelievaBoat(args.starting_cash, args.api_latency, args.api_jitter, args.api_rate_limit)
+    runner, base_url = await fake.start()
+
+    # The bot modules read these at import time
+    os.environ['UNBELIEVABOAT_API_URL'] = base_url
+    os.environ['UNBELIEVABOAT_API_TOKEN'] = 'loadtest'
+    os.environ['DISCORD_TOKEN'] = 'loadtest'
+    os.environ['FIGHT_DB_PATH'] = os.path.join(args.workdir, 'loadtest_fights.db')
+    os.environ['LOCAL_ECONOMY_STARTING_CASH'] = str(args.starting_cash)
+
+    import fist_fight
+    import tracing
+    logging.getLogger('BotAutomation').setLevel(args.log_level)
+    tracing.asyncio = _ScaledAsyncio(args.sleep_scale)  # Scripted pauses go through tracer.sleep
+
+    try:
+        reports = []
+        for name in args.scenario:
+            rates = dict(SCENARIOS[name])
+            for override in args.rate:
+                action, _, rate = override.partition('=')
+                rates[action] = float(rate)
+            reports.append(await run_scenario(name, rates, fake, args))
+        return reports
+    finally:
+        await fist_fight.api_client.close()
+        await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the bot's handlers against a fake UnbelievaBoat API")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Scenario to run (repeatable, default: all)")
+    parser.add_argument('--rate', action='append', default=[], metavar='ACTION=PER_SECOND', help="Override an action's arrival rate, e.g. bet=20")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of arrivals per scenario")
+    parser.add_argument('--drain-timeout', type=float, default=120.0, help="Seconds to wait for outstanding handlers after arrivals stop")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=10)
+    parser.add_argument('--sleep-scale', type=float, default=0.0, help="Multiplier for fight/narration sleeps (1 = real time)")
+    parser.add_argument('--starting-cash', type=int, default=1_000_000)
+    parser.add_argument('--api-latency', type=float, default=0.05)
+    parser.add_argument('--api-jitter', type=float, default=0.02)
+    parser.add_argument('--api-rate-limit', type=float, default=0.0, help="Fake API requests per second before 429s (0 = unlimited)")
+    parser.add_argument('--prefetch', action='store_true', help="Load every balance from the leaderboard before each scenario")
+    parser.add_argument('--local-economy', action='store_true', help="Run the guild on the bot's local economy instead of the fake API")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this file")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+    args.scenario = args.scenario or list(SCENARIOS)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        reports = asyncio.run(run(args))
+
+    output = json.dumps(reports, indent=2)
+    print(output)
+    if args.json_path:
+        with open(args.json_path, 'w') as results:
+            results.write(output)
+
+    failed = sum(report['unfinished'] + sum(action['error'] + action['unacked'] for action in report['actions'].values()) for report in reports)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from tracing import tracer
+
+logger = logging.getLogger('BotAutomation.LocalEconomy')
+
+class LocalEconomy:
+    """
+    Economy kept by the bot itself, for guilds that opt out of UnbelievaBoat.
+
+    Balances live in the fight store's SQLite database with the most recently
+    used ones held in memory, so reads cost a dict lookup and every write is
+    one local transaction. Offers the same calls as UnbelievaBoatAPI, with the
+    same semantics (a debit may take a balance below zero), plus transfer()
+    for robberies. Fight payouts skip this class: FightStore.delete_fight adds
+    them to the stored balances in the transaction that closes the fight.
+    """
+
+    def __init__(self, store, hot_size: int = 50_000):
+        """
+        Args:
+            store: FightStore holding the balances
+            hot_size (int): Balances kept in memory
+        """
+        self.store = store
+        self.hot_size = hot_size
+        self._hot: 'OrderedDict[Tuple[str, str], List[int]]' = OrderedDict()  # (guild, user) -> [cash, bank]
+        self.guilds = set(store.economy_guilds())
+
+    def __len__(self):
+        return len(self._hot)
+
+    def _balance(self, guild_id: str, user_id: str) -> List[int]:
+        key = (guild_id, user_id)
+        balance = self._hot.get(key)
+        if balance is not None:
+            self._hot.move_to_end(key)
+            return balance
+
+        stored = self.store.get_balance(guild_id, user_id)
+        balance = list(stored) if stored else [self.store.starting_cash, 0]
+        self._hot[key] = balance
+        if len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+        return balance
+
+    def _body(self, guild_id: str, user_id: str, balance: List[int]) -> Dict[str, Any]:
+        cash, bank = balance
+        return {'user_id': user_id, 'guild_id': guild_id, 'cash': cash, 'bank': bank, 'total': cash + bank}
+
+    def _apply(self, guild_id: str, changes: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
+        """Add amounts to several users' cash in one transaction; returns each user's new balance"""
+        with tracer.span('local economy write', 'economy', users=len(changes)):
+            balances = {user_id: self._balance(guild_id, user_id) for user_id in changes}
+            self.store.write_balances(
+                (guild_id, user_id, balance[0] + changes[user_id], balance[1]) for user_id, balance in balances.items()
+            )
+        for user_id, balance in balances.items():  # Only after the commit, so a failed write leaves memory untouched
+            balance[0] += changes[user_id]
+        return {user_id: self._body(guild_id, user_id, balance) for user_id, balance in balances.items()}
+
+    def forget(self, guild_id: str, user_ids: Iterable[str]):
+        """Drop in-memory balances changed directly in the store (see FightStore.delete_fight)"""
+        for user_id in user_ids:
+            self._hot.pop((guild_id, user_id), None)
+
+    def enable(self, guild_id: str, local: bool):
+        self.store.set_economy_guild(guild_id, local)
+        if local:
+            self.guilds.add(guild_id)
+        else:
+            self.guilds.discard(guild_id)
+            for key in [key for key in self._hot if key[0] == guild_id]:
+                del self._hot[key]
+
+    def cash(self, guild_id: str, user_id: str) -> int:
+        return self._balance(guild_id, user_id)[0]
+
+    async def get_balance(self, guild_id: str, user_id: str, timeout: Optional[float] = None) -> Optional[int]:
+        return self.cash(guild_id, user_id)
+
+    async def remove_money(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return self._apply(guild_id, {user_id: -abs(amount)})[user_id]
+
+    async def debit(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], Optional[bool]]:
+        return self._apply(guild_id, {user_id: -abs(amount)})[user_id], False
+
+    async def add_money(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return self._apply(guild_id, {user_id: abs(amount)})[user_id]
+
+    async def credit(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], Optional[bool]]:
+        return self._apply(guild_id, {user_id: abs(amount)})[user_id], False
+
+    async def transfer(self, guild_id: str, from_user_id: str, to_user_id: str, amount: int) -> Tuple[int, Dict[str, Any], Dict[str, Any]]:
+        """
+        Move up to amount from one user's cash to another's in one transaction
+
+        Returns:
+            Tuple[int, Dict[str, Any], Dict[str, Any]]: Amount moved (capped at the payer's cash), then both new balances
+        """
+        moved = max(0, min(amount, self._balance(guild_id, from_user_id)[0]))
+        bodies = self._apply(guild_id, {from_user_id: -moved, to_user_id: moved})
+        return moved, bodies[from_user_id], bodies[to_user_id]
+
+    async def get_leaderboard_page(self, guild_id: str, page: int, limit: int = 1000) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        rows, total = self.store.leaderboard(guild_id, (page - 1) * limit, limit)
+        users = [self._body(guild_id, row['user_id'], [row['cash'], row['bank']]) for row in rows]
+        return users, max(1, -(-total // limit))
+
+    def snapshot(self):
+        return {'guilds': len(self.guilds), 'hot_balances': len(self._hot)}
+
+class EconomyRouter:
+    """
+    The bot's economy: sends each call to the local economy for guilds that
+    opted in and to UnbelievaBoat for everyone else, behind UnbelievaBoatAPI's
+    interface.
+    """
+
+    def __init__(self, remote, local: LocalEconomy):
+        self.remote = remote
+        self.local = local
+        self.breaker = remote.breaker  # Retry timing for the outbox; local calls never open it
+
+    def is_local(self, guild_id) -> bool:
+        return str(guild_id) in self.local.guilds
+
+    def backend(self, guild_id):
+        return self.local if self.is_local(guild_id) else self.remote
+
+    def available_for(self, guild_id) -> bool:
+        """Whether economy commands can run in a guild (local guilds don't depend on UnbelievaBoat)"""
+        return self.is_local(guild_id) or self.remote.available
+
+    async def get_balance(self, guild_id: str, user_id: str, timeout: Optional[float] = None) -> Optional[int]:
+        return await self.backend(guild_id).get_balance(guild_id, user_id, timeout)
+
+    async def remove_money(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return await self.backend(guild_id).remove_money(guild_id, user_id, amount, timeout)
+
+    async def debit(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], Optional[bool]]:
+        return await self.backend(guild_id).debit(guild_id, user_id, amount, timeout)
+
+    async def add_money(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return await self.backend(guild_id).add_money(guild_id, user_id, amount, timeout)
+
+    async def credit(self, guild_id: str, user_id: str, amount: int, timeout: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], Optional[bool]]:
+        return await self.backend(guild_id).credit(guild_id, user_id, amount, timeout)
+
+    async def get_leaderboard_page(self, guild_id: str, page: int, limit: int = 1000) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        return await self.backend(guild_id).get_leaderboard_page(guild_id, page, limit)
+
+    async def close(self):
+        await self.remote.close()
@@ -0,0 +1,187 @@
+import time
+import heapq
+import asyncio
+import logging
+from collections import Counter, deque
+from typing import Any, Dict, List
+from tracing import tracer
+
+logger = logging.getLogger('BotAutomation.Outbound')
+
+# Priority classes, most important first
+SETTLEMENT = 0  # Payouts and refunds: money already moved, users must hear about it
+CONFIRMATION = 1  # Results of a user's own action (robbery outcome, fight result)
+NARRATION = 2  # Fight rounds and robbery flavour text; may be merged or dropped under pressure
+
+PRIORITY_NAMES = {SETTLEMENT: 'settlement', CONFIRMATION: 'confirmation', NARRATION: 'narration'}
+
+MESSAGE_LIMIT = 2000  # Discord's maximum message length
+
+class _Outgoing:
+    __slots__ = ('priority', 'seq', 'target', 'content', 'kwargs', 'merge_key', 'queued_at', 'futures', 'trace')
+
+    def __init__(self, priority: int, seq: int, target, content: str, kwargs: Dict, merge_key: Any, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.target = target
+        self.content = content
+        self.kwargs = kwargs
+        self.merge_key = merge_key
+        self.queued_at = time.perf_counter()
+        self.futures = [future]
+        self.trace = tracer.current()  # The sender task runs outside the caller's trace context
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class OutboundScheduler:
+    """
+    Per-channel outbound message queue with priority classes.
+
+    Each channel with pending messages has one sender task, so messages for a
+    channel go out one at a time and a backlog is served settlement first,
+    then confirmations, then narration. Narration is merged into an earlier
+    queued message with the same merge key (same fight or robbery) while it
+    waits, dropped once it is older than narration_ttl, and evicted first when
+    a channel's queue is full. Callers await send() and get True once the
+    message went out, False if it was dropped.
+    """
+
+    def __init__(self, max_depth: int = 20, narration_ttl: float = 15.0):
+        """
+        Args:
+            max_depth (int): Queued messages per channel before narration is evicted
+            narration_ttl (float): Seconds queued narration stays worth sending
+        """
+        self.max_depth = max_depth
+        self.narration_ttl = narration_ttl
+        self._queues: Dict[int, List[_Outgoing]] = {}  # channel_id -> heap
+        self._senders: Dict[int, asyncio.Task] = {}
+        self._seq = 0
+        self.sent = Counter()  # priority name -> messages sent
+        self.merged = Counter()
+        self.dropped = Counter()
+        self._waits: Dict[str, deque] = {}  # priority name -> recent seconds spent queued
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def send(self, channel_id: int, target, content: str, priority: int = CONFIRMATION,
+                   merge_key: Any = None, **kwargs) -> bool:
+        """
+        Queue a message and wait until it is sent or dropped
+
+        Args:
+            channel_id (int): Channel the message ends up in (the queue it joins)
+            target: Anything with an async send(content, **kwargs), e.g. interaction.followup or a channel
+            content (str): Message text
+            priority (int): SETTLEMENT, CONFIRMATION or NARRATION
+            merge_key: Narration with the same key may be combined into one message
+            **kwargs: Passed on to target.send
+
+        Returns:
+            bool: True if the message was sent, False if it was dropped
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.setdefault(channel_id, [])
+
+        if priority == NARRATION and merge_key is not None and self._merge(queue, content, merge_key, kwargs, future):
+            return await future
+
+        # A full queue makes room by dropping narration; settlement and confirmations are never dropped
+        if len(queue) >= self.max_depth and not self._evict(queue) and priority == NARRATION:
+            self._finish_dropped(future, priority)
+            return await future
+
+        self._seq += 1
+        heapq.heappush(queue, _Outgoing(priority, self._seq, target, content, kwargs, merge_key, future))
+        if channel_id not in self._senders:
+            self._senders[channel_id] = asyncio.ensure_future(self._drain(channel_id))
+        return await future
+
+    def _merge(self, queue: List[_Outgoing], content: str, merge_key: Any, kwargs: Dict, future: asyncio.Future) -> bool:
+        for item in queue:
+            if (item.priority == NARRATION and item.merge_key == merge_key and item.kwargs == kwargs
+                    and len(item.content) + len(content) + 1 <= MESSAGE_LIMIT):
+                item.content = f"{item.content}\n{content}"
+                item.futures.append(future)
+                self.merged[PRIORITY_NAMES[NARRATION]] += 1
+                return True
+        return False
+
+    def _evict(self, queue: List[_Outgoing]) -> bool:
+        """Make room by dropping the oldest queued narration; False if there is none to drop"""
+        narration = [item for item in queue if item.priority == NARRATION]
+        if not narration:
+            return False
+        oldest = min(narration, key=lambda item: item.seq)
+        queue.remove(oldest)
+        heapq.heapify(queue)
+        for future in oldest.futures:
+            self._finish_dropped(future, NARRATION)
+        return True
+
+    def _finish_dropped(self, future: asyncio.Future, priority: int):
+        self.dropped[PRIORITY_NAMES[priority]] += 1
+        if not future.done():
+            future.set_result(False)
+
+    async def _drain(self, channel_id: int):
+        queue = self._queues[channel_id]
+        try:
+            while queue:
+                item = heapq.heappop(queue)
+                name = PRIORITY_NAMES[item.priority]
+                dequeued = time.perf_counter()
+                waited = dequeued - item.queued_at
+                if item.priority == NARRATION and waited > self.narration_ttl:
+                    for future in item.futures:
+                        self._finish_dropped(future, item.priority)
+                    continue
+
+                waits = self._waits.get(name)
+                if waits is None:
+                    waits = self._waits[name] = deque(maxlen=500)
+                waits.append(waited)
+                tracer.record(item.trace, 'outbound queue', 'discord', item.queued_at, dequeued, priority=name)
+                try:
+                    await item.target.send(item.content, **item.kwargs)
+                    tracer.record(item.trace, 'discord send', 'discord', dequeued, time.perf_counter(), priority=name)
+                except Exception as e:
+                    logger.warning(f"Failed to send a {name} message to channel {channel_id}: {str(e)}")
+                    for future in item.futures:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                self.sent[name] += 1
+                for future in item.futures:
+                    if not future.done():
+                        future.set_result(True)
+        finally:
+            del self._senders[channel_id]
+            if not queue:
+                del self._queues[channel_id]
+
+    def snapshot(self):
+        waits = {}
+        for name, samples in self._waits.items():
+            ordered = sorted(samples)
+            waits[name] = {
+                'p50': round(ordered[len(ordered) // 2], 4),
+                'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+                'max': round(ordered[-1], 4),
+            }
+        return {
+            'queued': len(self),
+            'busy_channels': len(self._senders),
+            'max_channel_depth': max((len(queue) for queue in self._queues.values()), default=0),
+            'sent': dict(self.sent),
+            'merged': dict(self.merged),
+            'dropped': dict(self.dropped),
+            'wait': waits,
+        }
+
+async def followup(interaction, content: str, priority: int = CONFIRMATION, **kwargs) -> bool:
+    """Send an interaction followup through the bot's outbound scheduler; narration merges per interaction"""
+    merge_key = interaction.id if priority == NARRATION else None
+    return await interaction.client.outbound.send(interaction.channel_id, interaction.followup, content, priority, merge_key, **kwargs)
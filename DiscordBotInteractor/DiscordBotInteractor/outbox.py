@@ -0,0 +1,137 @@
+import time
+import random
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger('BotAutomation.Outbox')
+
+class CreditOutbox:
+    """
+    Delivers payouts and refunds from the fight store's on-disk outbox.
+
+    Credits are written to the store before anything is sent, then a single
+    worker sends due credits in batches (merging credits for the same user
+    into one call), retries transient failures with jittered exponential
+    backoff and checkpoints each batch's outcome. A credit that fails stays
+    queued across restarts until it is delivered.
+    """
+
+    def __init__(self, store, api, batch_size: int = 25, base_delay: float = 5.0, max_delay: float = 600.0,
+                 on_delivered: Optional[Callable[[str, str, Dict], None]] = None):
+        """
+        Args:
+            store: FightStore holding the outbox table
+            api: UnbelievaBoatAPI used to deliver credits
+            batch_size (int): Maximum credits read per batch
+            base_delay (float): Seconds before the first retry of a failed credit
+            max_delay (float): Cap for the doubling retry delay
+            on_delivered: Called with (guild_id, user_id, API response) after each delivered credit
+        """
+        self.store = store
+        self.api = api
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_delivered = on_delivered
+        self.delivered = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def enqueue(self, guild_id: str, user_id: str, amount: int, reason: str):
+        """Queue one credit and wake the worker"""
+        self.store.add_credits([(guild_id, user_id, amount, reason)])
+        self.wake()
+
+    def hold(self, guild_id: str, user_id: str, amount: int, reason: str, error: str):
+        """Record a credit that may be owed (e.g. a debit with an unknown outcome) for manual review"""
+        logger.error(f"Holding ${amount:,} credit to user {user_id} for review: {reason} ({error})")
+        self.store.hold_credits([(guild_id, user_id, amount, reason)], error)
+
+    def wake(self):
+        """Call after credits were written to the store (e.g. with FightStore.delete_fight)"""
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Let the batch being delivered finish, then stop; undelivered credits stay on disk"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempts) * random.uniform(0.8, 1.2)
+        return max(delay, self.api.breaker.retry_in())  # No point retrying before the circuit lets calls through
+
+    async def _deliver(self, batch: Iterable) -> Tuple[int, int, int]:
+        groups = defaultdict(list)  # (guild_id, user_id) -> rows
+        for row in batch:
+            groups[(row['guild_id'], row['user_id'])].append(row)
+
+        keys = list(groups)
+        results = await asyncio.gather(
+            *(self.api.credit(guild_id, user_id, sum(row['amount'] for row in groups[(guild_id, user_id)])) for guild_id, user_id in keys),
+            return_exceptions=True
+        )
+
+        now = time.time()
+        delivered, retries, failed = [], [], []
+        for key, result in zip(keys, results):
+            rows = groups[key]
+            if isinstance(result, Exception):
+                data, transient, error = None, True, str(result)
+            else:
+                data, transient = result
+                error = None if data is not None else {True: 'unavailable', False: 'rejected by the API', None: 'outcome unknown'}[transient]
+
+            if data is not None:
+                delivered.extend(row['id'] for row in rows)
+                if self.on_delivered:
+                    self.on_delivered(key[0], key[1], data)
+            elif transient:
+                next_at = now + self._retry_delay(max(row['attempts'] for row in rows))
+                retries.extend((next_at, error, row['id']) for row in rows)
+            elif transient is None:
+                # May already have been paid; retrying could pay twice, so it waits for a manual check
+                logger.error(f"Credit of ${sum(row['amount'] for row in rows):,} to user {key[1]} timed out after sending, keeping it as failed")
+                failed.extend((error, row['id']) for row in rows)
+            else:
+                logger.error(f"Credit of ${sum(row['amount'] for row in rows):,} to user {key[1]} was rejected, keeping it as failed")
+                failed.extend((error, row['id']) for row in rows)
+
+        self.store.checkpoint_credits(delivered, retries, failed)
+        self.delivered += len(delivered)
+        return len(delivered), len(retries), len(failed)
+
+    async def _run(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            batch = self.store.due_credits(time.time(), self.batch_size)
+            if batch:
+                try:
+                    delivered, retried, failed = await self._deliver(batch)
+                    if retried or failed:
+                        logger.warning(f"Outbox batch: {delivered} delivered, {retried} to retry, {failed} failed")
+                except Exception as e:
+                    logger.error(f"Error delivering outbox batch: {str(e)}", exc_info=True)
+                    await asyncio.sleep(self.base_delay)
+                continue
+
+            next_at = self.store.next_credit_at()
+            timeout = None if next_at is None else max(0.0, next_at - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def snapshot(self):
+        return {**self.store.outbox_counts(), 'delivered': self.delivered}
@@ -0,0 +1,131 @@
+import io
+import os
+import sys
+import time
+import pstats
+import asyncio
+import cProfile
+import logging
+import threading
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger('BotAutomation.Profiler')
+
+class Profiler:
+    """
+    On-demand profiling of the live event loop, for /profile and the
+    /debug/profile endpoint.
+
+    'cprofile' runs the deterministic profiler on the loop thread for the
+    whole window: exact call counts, but every call pays for it. 'sample'
+    reads the loop thread's stack from a helper thread every few
+    milliseconds instead, which costs next to nothing and is the one to use
+    during a busy event. Both return the top functions by cumulative time as
+    a text report. Only one profile runs at a time.
+    """
+    MODES = ('sample', 'cprofile')
+    MAX_SECONDS = 120
+    MAX_LIMIT = 500
+    SAMPLE_INTERVAL = 0.005
+
+    def __init__(self):
+        self.running = False
+        self.runs = 0
+
+    async def profile(self, seconds: float, mode: str = 'sample', limit: int = 40) -> Optional[str]:
+        """
+        Profile the event loop for a while
+
+        Args:
+            seconds (float): Length of the window, capped at MAX_SECONDS
+            mode (str): 'sample' or 'cprofile'
+            limit (int): Functions listed in the report, 1 to MAX_LIMIT
+
+        Returns:
+            Optional[str]: The report, or None if another profile is already running
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {', '.join(self.MODES)}")
+        if not 1 <= limit <= self.MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {self.MAX_LIMIT}")
+        if self.running:
+            return None
+
+        seconds = max(1.0, min(float(seconds), self.MAX_SECONDS))
+        self.running = True
+        logger.warning(f"Profiling the event loop for {seconds:.0f}s ({mode})")
+        try:
+            if mode == 'cprofile':
+                body = await self._cprofile(seconds, limit)
+            else:
+                body = await self._sample(seconds, limit)
+        finally:
+            self.running = False
+        self.runs += 1
+        header = f"{mode} profile of PID {os.getpid()}, {seconds:.0f}s from {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+        return header + body
+
+    async def _cprofile(self, seconds: float, limit: int) -> str:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()  # Hooks the current thread, which is the event loop's
+        except ValueError as e:
+            return f"cProfile could not start: {str(e)}\n"
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+
+        out = io.StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    async def _sample(self, seconds: float, limit: int) -> str:
+        loop_thread = threading.get_ident()
+        # The sampler needs the GIL to read the stack; with the default 5ms switch interval it mostly
+        # gets it while the loop waits in select(), which hides short busy callbacks
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(self.SAMPLE_INTERVAL / 10)
+        try:
+            cumulative, own, samples = await asyncio.to_thread(self._collect, loop_thread, seconds)
+        finally:
+            sys.setswitchinterval(switch_interval)
+        if not samples:
+            return "No samples taken\n"
+
+        lines = [f"{samples} samples every {self.SAMPLE_INTERVAL * 1000:.0f}ms; share of samples a function was on the stack (cum) or running (self)\n",
+                 f"{'cum%':>7} {'self%':>7}  function"]
+        for function, count in cumulative.most_common(limit):
+            lines.append(f"{100 * count / samples:6.1f}% {100 * own[function] / samples:6.1f}%  {function}")
+        return '\n'.join(lines) + '\n'
+
+    def _collect(self, thread_id: int, seconds: float):
+        """Runs on a helper thread: count the functions on the loop thread's stack until the window ends"""
+        cumulative, own = Counter(), Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                samples += 1
+                seen = set()
+                top = True
+                while frame is not None:
+                    code = frame.f_code
+                    function = f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                    if top:
+                        own[function] += 1
+                        top = False
+                    if function not in seen:  # Recursive functions count once per sample
+                        seen.add(function)
+                        cumulative[function] += 1
+                    frame = frame.f_back
+            time.sleep(self.SAMPLE_INTERVAL)
+        return cumulative, own, samples
+
+    def snapshot(self):
+        return {'running': self.running, 'runs': self.runs}
+
+profiler = Profiler()
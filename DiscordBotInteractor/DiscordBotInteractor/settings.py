@@ -0,0 +1,140 @@
+import os
+import json
+import logging
+from typing import Any, Callable, Dict, List, Tuple
+from dotenv import dotenv_values
+
+logger = logging.getLogger('BotAutomation.Settings')
+
+def _parse_range(value) -> Tuple[int, int]:
+    """'min-max' (environment) or [min, max] (settings file)"""
+    if isinstance(value, str):
+        low, _, high = value.partition('-')
+        value = (low, high)
+    low, high = (int(part) for part in value)
+    return low, high
+
+# Settings that can change while the bot runs: name -> (parser, default, minimum, maximum).
+# Ranges are (low, high) pairs and the bounds apply to both ends.
+SETTINGS = {
+    # Pacing
+    'ROUND_DELAY': (float, 3.0, 0.0, 30.0),  # Seconds between fight rounds
+    'NARRATION_DELAY': (float, 1.5, 0.0, 30.0),  # Seconds between robbery narration lines
+    'CHALLENGE_TIMEOUT': (float, 180.0, 10.0, 3600.0),  # Seconds the challenged player has to accept
+
+    # Concurrency: fights running at once per channel / per guild (0 = unlimited), extra accepted fights queue
+    'MAX_FIGHTS_PER_CHANNEL': (int, 0, 0, 100),
+    'MAX_FIGHTS_PER_GUILD': (int, 0, 0, 1000),
+    # Outbound messages queued per channel before narration is dropped, and seconds narration stays worth sending
+    'OUTBOUND_MAX_DEPTH': (int, 20, 1, 1000),
+    'NARRATION_TTL': (float, 15.0, 0.0, 600.0),
+
+    # Robbery amounts and penalties
+    'WOOZIE_AMOUNT': (_parse_range, (25000, 50000), 0, 10**9),
+    'WOOZIE_GUNFIGHT_PENALTY': (_parse_range, (5000, 15000), 0, 10**9),  # Each side, when the target also has Woozie
+    'WOOZIE_SHOTGUN_PENALTY': (_parse_range, (10000, 15000), 0, 10**9),
+    'PLOCK_AMOUNT': (_parse_range, (500, 10000), 0, 10**9),
+    'PLOCK_UZI_PENALTY': (_parse_range, (5000, 10000), 0, 10**9),
+    'PLOCK_STANDOFF_PENALTY': (_parse_range, (1000, 5000), 0, 10**9),  # Each side, when the target also has Glock
+
+    # CommandExecutor
+    'COMMAND_TIMEOUT': (int, 30, 1, 600),
+    'DEFAULT_DELAY': (float, 2.0, 0.0, 60.0),
+}
+
+class RuntimeSettings:
+    """
+    Tunables that can be changed without a restart.
+
+    Values come from the defaults above, then .env (re-read on every load),
+    then the process environment, then the JSON settings file, which wins.
+    .env is never copied into the environment for these names (see
+    config.load_config), so removing a line from it and reloading brings the
+    default back. reload() validates
+    everything before applying anything, so a bad value leaves the running
+    settings untouched. Code reads settings at the point of use; subsystems
+    that cache a value (fight scheduler limits, outbound queue) register
+    with on_change. Reloads come from SIGHUP or the /settings command.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): JSON settings file, e.g. {"ROUND_DELAY": 1.5, "PLOCK_AMOUNT": [500, 5000]} (may not exist)
+        """
+        self.path = path
+        self._values: Dict[str, Any] = self.load()
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.reloads = 0
+
+    def __getitem__(self, name: str):
+        return self._values[name]
+
+    def on_change(self, listener: Callable[[Dict[str, Any]], None]):
+        """Call listener(changed) with the changed settings after every reload that changes something"""
+        self._listeners.append(listener)
+
+    def load(self) -> Dict[str, Any]:
+        """Read and validate every setting; raises ValueError listing all problems"""
+        raw = {name: value for name, value in dotenv_values().items() if name in SETTINGS and value is not None}
+        raw.update((name, os.environ[name]) for name in SETTINGS if name in os.environ)
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as settings_file:
+                    from_file = json.load(settings_file)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"Could not read {self.path}: {str(e)}")
+            if not isinstance(from_file, dict):
+                raise ValueError(f"{self.path} must contain a JSON object")
+            raw.update(from_file)
+
+        values = {name: spec[1] for name, spec in SETTINGS.items()}
+        problems = []
+        for name, value in raw.items():
+            if name not in SETTINGS:
+                problems.append(f"{name} is not a runtime setting")
+                continue
+            parse, _, minimum, maximum = SETTINGS[name]
+            try:
+                parsed = parse(value)
+            except (TypeError, ValueError):
+                problems.append(f"{name}: can't read {value!r}")
+                continue
+            bounds = parsed if isinstance(parsed, tuple) else (parsed,)
+            if any(not minimum <= bound <= maximum for bound in bounds):
+                problems.append(f"{name} must be between {minimum} and {maximum}")
+            elif isinstance(parsed, tuple) and parsed[0] > parsed[1]:
+                problems.append(f"{name}: the low end is above the high end")
+            else:
+                values[name] = parsed
+        if problems:
+            raise ValueError('; '.join(problems))
+        return values
+
+    def reload(self) -> Dict[str, Any]:
+        """
+        Re-read the settings and apply them
+
+        Returns:
+            Dict[str, Any]: The settings that changed, with their new values
+
+        Raises:
+            ValueError: If any value is invalid; nothing is applied then
+        """
+        values = self.load()
+        changed = {name: value for name, value in values.items() if self._values[name] != value}
+        self._values = values
+        self.reloads += 1
+        if changed:
+            logger.warning(f"Settings changed: {changed}")
+            for listener in self._listeners:
+                try:
+                    listener(changed)
+                except Exception as e:
+                    logger.error(f"Failed to apply settings {list(changed)}: {str(e)}")
+        return changed
+
+    def snapshot(self):
+        return {'path': self.path, 'reloads': self.reloads, 'values': dict(self._values)}
+
+settings = RuntimeSettings(os.getenv('SETTINGS_PATH') or dotenv_values().get('SETTINGS_PATH') or 'settings.json')
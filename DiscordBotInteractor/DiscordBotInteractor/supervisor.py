@@ -0,0 +1,165 @@
+"""
+Restart supervisor for the bot.
+
+Runs the bot (bot_automation.py, or cluster.py with --cluster) as a child
+process and restarts it when it crashes, waiting with jittered exponential
+backoff between attempts. Each crash is appended to CRASH_LOG_PATH as a JSON
+line with the exit status, uptime and the last lines the bot printed. A
+clean exit (e.g. /sleep) ends the supervisor, and so does a child that found
+another instance holding its lock. The supervisor takes a lock of its own,
+so a second launch is refused.
+
+Usage: python3 supervisor.py [--cluster]
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import logging
+import argparse
+import subprocess
+import threading
+from collections import deque
+from config import load_config
+from instance_lock import InstanceLock, EXIT_DUPLICATE
+
+logger = logging.getLogger('BotAutomation.Supervisor')
+
+OUTPUT_TAIL_LINES = 30
+
+class Supervisor:
+    def __init__(self, command, crash_log_path, base_delay=5.0, max_delay=300.0, stable_after=600.0):
+        """
+        Args:
+            command (list): Child process command line
+            crash_log_path (str): JSON lines file that crash records are appended to
+            base_delay (float): Seconds before the first restart
+            max_delay (float): Cap for the doubling restart delay
+            stable_after (float): Seconds of uptime after which a crash starts the backoff over
+        """
+        self.command = command
+        self.crash_log_path = crash_log_path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stable_after = stable_after
+        self.child = None
+        self.stopping = False
+        self.restarts = 0
+
+    def _pump_output(self, child, tail):
+        """Echo the child's output and keep its last lines for the crash record"""
+        for line in child.stdout:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            tail.append(line.rstrip('\n'))
+
+    def run_once(self):
+        """Run the child to completion; returns (exit code, uptime, last output lines)"""
+        tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        started = time.monotonic()
+        self.child = subprocess.Popen(
+            self.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, encoding='utf-8', errors='replace', bufsize=1
+        )
+        logger.info(f"Started bot (PID: {self.child.pid})")
+        pump = threading.Thread(target=self._pump_output, args=(self.child, tail), daemon=True)
+        pump.start()
+        exit_code = self.child.wait()
+        pump.join(5)
+        return exit_code, time.monotonic() - started, list(tail)
+
+    def record_crash(self, exit_code, uptime, tail):
+        if exit_code < 0:
+            reason = f"killed by {signal.Signals(-exit_code).name}"
+        else:
+            reason = f"exit code {exit_code}"
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'reason': reason,
+            'exit_code': exit_code,
+            'uptime': round(uptime, 1),
+            'restarts': self.restarts,
+            'output': tail,
+        }
+        try:
+            with open(self.crash_log_path, 'a', encoding='utf-8') as crash_log:
+                crash_log.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logger.error(f"Could not write crash record: {str(e)}")
+        return reason
+
+    def run(self):
+        failures = 0
+        while not self.stopping:
+            exit_code, uptime, tail = self.run_once()
+            if self.stopping or exit_code == 0:
+                logger.info(f"Bot exited cleanly after {uptime:.0f}s, supervisor stopping")
+                return 0
+            if exit_code == EXIT_DUPLICATE:
+                logger.critical("Another bot instance is running, not restarting")
+                return exit_code
+
+            failures = 1 if uptime >= self.stable_after else failures + 1
+            reason = self.record_crash(exit_code, uptime, tail)
+            delay = min(self.max_delay, self.base_delay * 2 ** (failures - 1)) * random.uniform(0.8, 1.2)
+            logger.error(f"Bot crashed ({reason}) after {uptime:.0f}s, restarting in {delay:.0f}s")
+            if self._sleep(delay):
+                return 0
+            self.restarts += 1
+        return 0
+
+    def _sleep(self, seconds):
+        """Wait before a restart; True if a stop signal arrived meanwhile"""
+        deadline = time.monotonic() + seconds
+        while not self.stopping and time.monotonic() < deadline:
+            time.sleep(min(0.5, deadline - time.monotonic()))
+        return self.stopping
+
+    def forward(self, signum, frame):
+        """Pass a signal such as SIGHUP (reload settings) on to the bot"""
+        if self.child and self.child.poll() is None:
+            self.child.send_signal(signum)
+
+    def stop(self, signum, frame):
+        """Forward the stop signal so the bot drains, then don't restart it"""
+        logger.warning(f"Received signal {signum}, stopping bot")
+        self.stopping = True
+        if self.child and self.child.poll() is None:
+            self.child.send_signal(signal.SIGTERM)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot and restart it when it crashes")
+    parser.add_argument('--cluster', action='store_true', help="Supervise cluster.py instead of a single bot process")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    config = load_config()
+
+    lock = InstanceLock(config['SUPERVISOR_LOCK_PATH'])
+    if not lock.acquire():
+        logger.critical(f"Another supervisor (PID: {lock.holder()}) holds {config['SUPERVISOR_LOCK_PATH']}, refusing to start")
+        sys.exit(EXIT_DUPLICATE)
+
+    script = 'cluster.py' if args.cluster else 'bot_automation.py'
+    supervisor = Supervisor(
+        [sys.executable, '-u', os.path.join(os.path.dirname(os.path.abspath(__file__)), script)],
+        config['CRASH_LOG_PATH'],
+        config['RESTART_BACKOFF_BASE'],
+        config['RESTART_BACKOFF_MAX'],
+    )
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, supervisor.forward)
+    try:
+        sys.exit(supervisor.run())
+    finally:
+        lock.release()
+
+if __name__ == "__main__":
+    main()
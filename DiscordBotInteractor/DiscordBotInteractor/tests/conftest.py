@@ -0,0 +1,14 @@
+import os
+import sys
+import pytest
+
+# The bot's modules live flat next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fight_store import FightStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = FightStore(str(tmp_path / 'fights.db'), starting_cash=100)
+    yield store
+    store.close()
@@ -0,0 +1,51 @@
+import pytest
+from bet_book import BetBook
+
+A, B = 1, 2
+
+def book(*bets):
+    book = BetBook(A, B)
+    for user_id, fighter_id, amount in bets:
+        book.add(user_id, fighter_id, amount)
+    return book
+
+def test_totals_aggregate_per_fighter_and_user():
+    bets = book((10, A, 100), (10, A, 50), (10, B, 25), (11, B, 75))
+    assert len(bets) == 4
+    assert bets.pot == 250
+    assert bets.total_on(A) == 150 and bets.total_on(B) == 100
+    assert bets.stakes_on(A) == {10: 150}
+    assert dict(bets.users()) == {10: 175, 11: 75}
+
+def test_winners_split_the_losing_pool_after_the_rake():
+    bets = book((10, A, 300), (11, A, 100), (20, B, 1000))
+    payouts, house = bets.parimutuel_payouts(A, 0.05)
+    # 1000 losing, 50 raked: 950 split 3:1
+    assert payouts == {10: 300 + 712, 11: 100 + 237}
+    assert house == 50 + 1  # The rake plus the rounding remainder
+    assert sum(payouts.values()) + house == bets.pot
+
+@pytest.mark.parametrize('rake', [0.0, 0.05, 0.1, 0.333])
+def test_rounding_never_pays_out_more_than_the_pot(rake):
+    bets = book(*((user_id, A, 7 + user_id) for user_id in range(10, 23)), (30, B, 1001), (31, B, 13))
+    payouts, house = bets.parimutuel_payouts(A, rake)
+    assert sum(payouts.values()) + house == bets.pot
+    assert house >= int(bets.total_on(B) * rake)
+    assert house - int(bets.total_on(B) * rake) < len(payouts)  # At most one unit of rounding per winner
+    assert all(payouts[user_id] >= stake for user_id, stake in bets.stakes_on(A).items())
+
+def test_without_rake_everything_is_paid_out_when_shares_divide_evenly():
+    bets = book((10, B, 50), (11, B, 150), (20, A, 400))
+    payouts, house = bets.parimutuel_payouts(B, 0.0)
+    assert payouts == {10: 150, 11: 450}
+    assert house == 0
+
+def test_losing_stakes_are_returned_when_nobody_backed_the_winner():
+    bets = book((20, B, 400), (21, B, 100))
+    assert bets.parimutuel_payouts(A, 0.05) == ({20: 400, 21: 100}, 0)
+
+def test_odds_include_the_rake():
+    bets = book((10, A, 100), (20, B, 300))
+    assert bets.odds(A) == 4.0
+    assert bets.odds(A, 0.1) == pytest.approx(1 + 300 * 0.9 / 100)
+    assert BetBook(A, B).odds(A) is None
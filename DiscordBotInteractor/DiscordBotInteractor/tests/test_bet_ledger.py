@@ -0,0 +1,106 @@
+import asyncio
+from balances import BalanceTable
+from bet_ledger import BetLedger
+
+class FakeEconomy:
+    """debit() answers with a scripted balance or failure; set release to hold debits in flight"""
+
+    def __init__(self, cash=None, transient=True):
+        self.cash = cash
+        self.transient = transient  # Failure kind reported when cash is None
+        self.debits = []
+        self.release = None
+
+    def is_local(self, guild_id):
+        return False
+
+    async def debit(self, guild_id, user_id, amount, timeout=None):
+        self.debits.append((user_id, amount))
+        if self.release is not None:
+            await self.release.wait()
+        if self.cash is None:
+            return None, self.transient
+        self.cash -= amount
+        return {'cash': self.cash}, False
+
+class FakeOutbox:
+    def __init__(self):
+        self.credits = []
+
+        self.held = []
+
+    def enqueue(self, guild_id, user_id, amount, reason):
+        self.credits.append((user_id, amount, reason))
+
+    def hold(self, guild_id, user_id, amount, reason, error):
+        self.held.append((user_id, amount, reason))
+
+def ledger(cash=None, cached=None):
+    table = BalanceTable()
+    if cached is not None:
+        table.observe('1', 'u', cached)
+    return BetLedger(FakeEconomy(cash), FakeOutbox(), table)
+
+def test_bet_is_taken_and_balance_recorded():
+    bets = ledger(cash=500, cached=500)
+    assert asyncio.run(bets.withdraw('1', 'u', 200)) == (True, 300)
+    assert bets.balances.get('1', 'u', 30) == 300
+    assert len(bets) == 0
+
+def test_bet_over_cached_balance_is_refused_without_a_debit():
+    bets = ledger(cash=500, cached=100)
+    assert asyncio.run(bets.withdraw('1', 'u', 200)) == (False, 100)
+    assert bets.api.debits == []
+
+def test_overdrawn_debit_is_rolled_back_through_the_outbox():
+    bets = ledger(cash=150)  # Nothing cached, so the debit goes out and comes back negative
+    assert asyncio.run(bets.withdraw('1', 'u', 200)) == (False, 150)
+    assert bets.outbox.credits == [('u', 200, 'bet rollback')]
+    assert bets.balances.get('1', 'u', 30) == 150  # The balance once the rollback lands
+    assert len(bets) == 0
+
+def test_failed_debit_releases_the_reservation():
+    bets = ledger(cash=None, cached=500)
+    assert asyncio.run(bets.withdraw('1', 'u', 200)) == (False, None)
+    assert bets.outbox.credits == []
+    assert bets.available('1', 'u') == 500
+
+def test_debit_with_unknown_outcome_is_held_for_review():
+    bets = ledger(cash=None, cached=500)
+    bets.api.transient = None  # Sent, but the answer never came back
+    assert asyncio.run(bets.withdraw('1', 'u', 200)) == (None, None)
+    assert bets.outbox.held == [('u', 200, 'bet debit outcome unknown')]
+    assert bets.outbox.credits == []  # Not refunded blindly: the debit may never have landed
+    assert len(bets) == 0
+
+def test_concurrent_bets_cannot_spend_the_same_cash():
+    bets = ledger(cash=300, cached=300)
+
+    async def run():
+        bets.api.release = asyncio.Event()
+        first = asyncio.ensure_future(bets.withdraw('1', 'u', 200))
+        await asyncio.sleep(0)
+        assert bets.available('1', 'u') == 100  # The first stake is reserved while its debit is in flight
+        second = await bets.withdraw('1', 'u', 200)
+        bets.api.release.set()
+        return await first, second
+
+    first, second = asyncio.run(run())
+    assert first == (True, 100)
+    assert second == (False, 100)
+    assert bets.api.debits == [('u', 200)]
+    assert len(bets) == 0
+
+def test_cancelled_debit_releases_the_reservation():
+    bets = ledger(cash=300, cached=300)
+
+    async def run():
+        bets.api.release = asyncio.Event()
+        task = asyncio.ensure_future(bets.withdraw('1', 'u', 200))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert bets.available('1', 'u') == 300
+    assert len(bets) == 0
@@ -0,0 +1,98 @@
+import circuit_breaker
+from circuit_breaker import CircuitBreaker
+
+class FakeClock:
+    """Stands in for the time module so the window and probe delays can be stepped through"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def make_breaker(monkeypatch, **kwargs):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker, 'time', clock)
+    options = dict(window=60, min_calls=4, failure_rate=0.5, open_for=10, max_open_for=40, jitter=0)
+    options.update(kwargs)
+    return CircuitBreaker('test', **options), clock
+
+def fail(breaker, times):
+    for _ in range(times):
+        assert breaker.allow()
+        breaker.record(True)
+
+def test_stays_closed_until_min_calls(monkeypatch):
+    breaker, _ = make_breaker(monkeypatch)
+    fail(breaker, 3)
+    assert breaker.state == CircuitBreaker.CLOSED
+    fail(breaker, 1)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.is_open
+
+def test_stays_closed_below_failure_rate(monkeypatch):
+    breaker, _ = make_breaker(monkeypatch)
+    for failed in (True, False, False, False, True, False):
+        assert breaker.allow()
+        breaker.record(failed)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failure_rate == 2 / 6
+
+def test_old_outcomes_leave_the_window(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    fail(breaker, 3)
+    clock.now += 61
+    fail(breaker, 1)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()['calls_in_window'] == 1
+
+def test_open_circuit_refuses_calls_until_the_probe(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    fail(breaker, 4)
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+    assert breaker.retry_in() == 10
+
+    clock.now += 10
+    assert not breaker.is_open
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # Only one probe at a time
+
+def test_successful_probe_closes_the_circuit(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    fail(breaker, 4)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failure_rate == 0
+    assert breaker.retry_in() == 0
+
+def test_failed_probe_reopens_with_a_doubled_delay(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    fail(breaker, 4)
+    for delay in (10, 20, 40, 40):
+        assert breaker.retry_in() == delay
+        clock.now += delay
+        assert breaker.allow()
+        breaker.record(True)
+        assert breaker.state == CircuitBreaker.OPEN
+
+def test_abandoned_probe_lets_another_through(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    fail(breaker, 4)
+    clock.now += 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.abandon()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+def test_late_results_while_open_are_ignored(monkeypatch):
+    breaker, _ = make_breaker(monkeypatch)
+    fail(breaker, 4)
+    breaker.record(False)
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()['calls_in_window'] == 4
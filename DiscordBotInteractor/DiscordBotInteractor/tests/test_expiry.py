@@ -0,0 +1,145 @@
+import time
+import asyncio
+from expiry import ExpiryScheduler
+
+async def collect(scheduler_kwargs, schedule, wait=0.3):
+    """Run a scheduler over the given (key, seconds from now) entries and return the batches it fired"""
+    batches = []
+
+    async def handler(keys):
+        batches.append(list(keys))
+
+    scheduler = ExpiryScheduler(handler, **scheduler_kwargs)
+    now = time.time()
+    for key, delay in schedule:
+        scheduler.schedule(key, now + delay)
+    scheduler.start()
+    await asyncio.sleep(wait)
+    await scheduler.stop()
+    return batches, scheduler
+
+def test_due_keys_fire_in_deadline_order():
+    batches, scheduler = asyncio.run(collect({}, [('c', 0.15), ('a', 0.05), ('b', 0.1)]))
+    assert [key for batch in batches for key in batch] == ['a', 'b', 'c']
+    assert len(scheduler) == 0
+
+def test_overdue_keys_fire_in_batches():
+    batches, _ = asyncio.run(collect({'batch_size': 2}, [(n, -1 + n / 10) for n in range(5)], wait=0.1))
+    assert batches == [[0, 1], [2, 3], [4]]
+
+def test_cancelled_keys_never_fire():
+    async def scenario():
+        fired = []
+
+        async def handler(keys):
+            fired.extend(keys)
+
+        scheduler = ExpiryScheduler(handler)
+        scheduler.schedule('kept', time.time() + 0.05)
+        scheduler.schedule('dropped', time.time() + 0.05)
+        scheduler.cancel('dropped')
+        scheduler.start()
+        await asyncio.sleep(0.15)
+        await scheduler.stop()
+        return fired
+
+    assert asyncio.run(scenario()) == ['kept']
+
+def test_rescheduling_replaces_the_old_deadline():
+    async def scenario():
+        fired = []
+
+        async def handler(keys):
+            fired.append((keys[0], time.time()))
+
+        scheduler = ExpiryScheduler(handler)
+        start = time.time()
+        scheduler.schedule('a', start + 0.05)
+        scheduler.start()
+        scheduler.schedule('a', start + 0.2)
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+        return start, fired
+
+    start, fired = asyncio.run(scenario())
+    assert len(fired) == 1
+    assert fired[0][1] - start >= 0.2
+
+def test_earlier_deadline_wakes_a_sleeping_scheduler():
+    async def scenario():
+        fired = []
+
+        async def handler(keys):
+            fired.extend(keys)
+
+        scheduler = ExpiryScheduler(handler)
+        scheduler.schedule('late', time.time() + 60)
+        scheduler.start()
+        await asyncio.sleep(0.02)
+        scheduler.schedule('soon', time.time() + 0.05)
+        await asyncio.sleep(0.15)
+        await scheduler.stop()
+        return fired, scheduler.next_deadline()
+
+    fired, next_deadline = asyncio.run(scenario())
+    assert fired == ['soon']
+    assert next_deadline is not None
+
+def test_handler_errors_do_not_stop_the_loop():
+    async def scenario():
+        fired = []
+
+        async def handler(keys):
+            fired.extend(keys)
+            if keys == ['bad']:
+                raise RuntimeError('boom')
+
+        scheduler = ExpiryScheduler(handler)
+        scheduler.schedule('bad', time.time())
+        scheduler.schedule('good', time.time() + 0.05)
+        scheduler.start()
+        await asyncio.sleep(0.15)
+        await scheduler.stop()
+        return fired
+
+    assert asyncio.run(scenario()) == ['bad', 'good']
+
+def test_stop_lets_the_running_batch_finish():
+    async def scenario():
+        finished = []
+
+        async def handler(keys):
+            await asyncio.sleep(0.1)
+            finished.extend(keys)
+
+        scheduler = ExpiryScheduler(handler)
+        scheduler.schedule('a', time.time())
+        scheduler.schedule('b', time.time() + 60)
+        scheduler.start()
+        await asyncio.sleep(0.02)
+        await scheduler.stop()
+        return finished, len(scheduler)
+
+    # The batch in flight completes; the later deadline is kept for the next start
+    assert asyncio.run(scenario()) == (['a'], 1)
+
+def test_stop_cancels_a_batch_that_overruns_the_timeout():
+    async def scenario():
+        cancelled = asyncio.Event()
+
+        async def handler(keys):
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        scheduler = ExpiryScheduler(handler)
+        scheduler.schedule('a', time.time())
+        scheduler.start()
+        await asyncio.sleep(0.02)
+        await scheduler.stop(timeout=0.05)
+        await asyncio.sleep(0)
+        return cancelled.is_set()
+
+    assert asyncio.run(scenario())
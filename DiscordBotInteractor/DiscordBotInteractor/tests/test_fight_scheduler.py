@@ -0,0 +1,129 @@
+import asyncio
+from fight_scheduler import FightScheduler
+
+class Fight:
+    """One fight holding a scheduler slot until finish() is called, recording when it started"""
+
+    def __init__(self, scheduler, name, guild_id, channel_id, started, positions):
+        self.done = asyncio.Event()
+        self.task = asyncio.create_task(self._run(scheduler, name, guild_id, channel_id, started, positions))
+
+    async def _run(self, scheduler, name, guild_id, channel_id, started, positions):
+        async def on_queued(position):
+            positions[name] = position
+
+        async with scheduler.slot(guild_id, channel_id, on_queued):
+            started.append(name)
+            await self.done.wait()
+
+    async def finish(self):
+        self.done.set()
+        await self.task
+
+async def start_fights(scheduler, specs):
+    started, positions = [], {}
+    fights = {name: Fight(scheduler, name, guild_id, channel_id, started, positions) for name, guild_id, channel_id in specs}
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    return fights, started, positions
+
+def test_unlimited_by_default():
+    async def scenario():
+        scheduler = FightScheduler()
+        fights, started, _ = await start_fights(scheduler, [(n, 1, 1) for n in 'abc'])
+        snapshot = scheduler.snapshot()
+        for fight in fights.values():
+            await fight.finish()
+        return started, snapshot, scheduler.snapshot()
+
+    started, busy, idle = asyncio.run(scenario())
+    assert started == ['a', 'b', 'c']
+    assert busy == {'running': 3, 'busy_channels': 1, 'queued': 0}
+    assert idle == {'running': 0, 'busy_channels': 0, 'queued': 0}
+
+def test_channel_limit_queues_in_fifo_order():
+    async def scenario():
+        scheduler = FightScheduler(max_per_channel=1)
+        fights, started, positions = await start_fights(scheduler, [(n, 1, 1) for n in 'abc'])
+        order = [list(started)]
+        for name in 'abc':
+            await fights[name].finish()
+            await asyncio.sleep(0)
+            order.append(list(started))
+        return order, positions
+
+    order, positions = asyncio.run(scenario())
+    assert order == [['a'], ['a', 'b'], ['a', 'b', 'c'], ['a', 'b', 'c']]
+    assert positions == {'b': 1, 'c': 2}
+
+def test_other_channels_are_not_blocked_by_a_full_one():
+    async def scenario():
+        scheduler = FightScheduler(max_per_channel=1)
+        fights, started, positions = await start_fights(scheduler, [('a', 1, 1), ('b', 1, 1), ('c', 1, 2)])
+        for fight in fights.values():
+            fight.done.set()
+        await asyncio.gather(*(fight.task for fight in fights.values()))
+        return started, positions
+
+    started, positions = asyncio.run(scenario())
+    assert started[:2] == ['a', 'c']
+    assert positions == {'b': 1}
+
+def test_guild_limit_and_positions_per_guild():
+    async def scenario():
+        scheduler = FightScheduler(max_per_guild=1)
+        fights, started, positions = await start_fights(scheduler, [('a', 1, 1), ('b', 2, 5), ('c', 1, 2), ('d', 2, 6), ('e', 1, 3)])
+        queued = scheduler.snapshot()['queued']
+        for fight in fights.values():
+            fight.done.set()
+        await asyncio.gather(*(fight.task for fight in fights.values()))
+        return started, positions, queued
+
+    started, positions, queued = asyncio.run(scenario())
+    assert started[:2] == ['a', 'b']
+    assert queued == 3
+    # Positions count only the fights queued in the same guild
+    assert positions == {'c': 1, 'd': 1, 'e': 2}
+
+def test_raising_the_limits_starts_queued_fights():
+    async def scenario():
+        scheduler = FightScheduler(max_per_channel=1)
+        fights, started, _ = await start_fights(scheduler, [(n, 1, 1) for n in 'abc'])
+        before = list(started)
+        scheduler.set_limits(0, 0)
+        await asyncio.sleep(0)
+        after = list(started)
+        for fight in fights.values():
+            await fight.finish()
+        return before, after
+
+    assert asyncio.run(scenario()) == (['a'], ['a', 'b', 'c'])
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = FightScheduler(max_per_channel=1)
+        fights, started, _ = await start_fights(scheduler, [(n, 1, 1) for n in 'abc'])
+        fights['b'].task.cancel()
+        await asyncio.gather(fights['b'].task, return_exceptions=True)
+        queued = scheduler.snapshot()['queued']
+        await fights['a'].finish()
+        await asyncio.sleep(0)
+        await fights['c'].finish()
+        return started, queued, scheduler.snapshot()
+
+    started, queued, snapshot = asyncio.run(scenario())
+    assert queued == 1
+    assert started == ['a', 'c']
+    assert snapshot == {'running': 0, 'busy_channels': 0, 'queued': 0}
+
+def test_slot_is_released_when_the_fight_raises():
+    async def scenario():
+        scheduler = FightScheduler(max_per_channel=1)
+        try:
+            async with scheduler.slot(1, 1):
+                raise RuntimeError('fight crashed')
+        except RuntimeError:
+            pass
+        return scheduler.snapshot()
+
+    assert asyncio.run(scenario()) == {'running': 0, 'busy_channels': 0, 'queued': 0}
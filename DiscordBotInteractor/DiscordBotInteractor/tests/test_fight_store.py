@@ -0,0 +1,51 @@
+import time
+import pytest
+
+def fight(**overrides):
+    fight = {
+        'guild_id': 1, 'channel_id': 2, 'challenger_id': 10, 'challenger_name': 'A',
+        'target_id': 20, 'target_name': 'B', 'accepted': True, 'expires_at': time.time() + 180,
+        'payout_mode': 'multiplier', 'rake': 0.0,
+    }
+    fight.update(overrides)
+    return fight
+
+def open_fight(store, message_id=1000):
+    store.save_fight(message_id, fight())
+    store.add_bet(message_id, 30, 10, 100)
+    store.add_bet(message_id, 31, 20, 50)
+    return message_id
+
+def outbox(store):
+    return [(row['user_id'], row['amount'], row['reason']) for row in store.conn.execute("SELECT * FROM credit_outbox ORDER BY id")]
+
+def test_delete_fight_queues_credits_and_settlement_with_the_close(store):
+    message_id = open_fight(store)
+    store.delete_fight(message_id, [('1', '30', 200, 'payout')],
+                       {'guild_id': 1, 'payout_mode': 'multiplier', 'pot': 150, 'paid_out': 200})
+
+    assert store.load() == ({}, {})
+    assert outbox(store) == [('30', 200, 'payout')]
+    assert store.house_totals(1) == {'multiplier': {'fights': 1, 'pot': 150, 'paid_out': 200, 'house_net': -50}}
+
+def test_delete_fight_is_all_or_nothing(store):
+    message_id = open_fight(store)
+    with pytest.raises(KeyError):
+        # The settlement is written after the credits; its failure must take the credits with it
+        store.delete_fight(message_id, [('1', '30', 200, 'payout')], {'guild_id': 1})
+
+    fights, books = store.load()
+    assert list(fights) == [message_id]
+    assert books[message_id].pot == 150
+    assert outbox(store) == []
+    assert store.house_totals(1) == {}
+
+def test_delete_fight_applies_local_credits_instead_of_queueing(store):
+    message_id = open_fight(store)
+    store.write_balances([('1', '30', 500, 7)])
+    store.delete_fight(message_id, [('1', '30', 200, 'payout'), ('1', '31', 50, 'refund')], local_credits=True)
+
+    assert store.get_balance('1', '30') == (700, 7)
+    assert store.get_balance('1', '31') == (150, 0)  # Starting cash plus the credit
+    assert outbox(store) == []
+    assert store.load() == ({}, {})
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from collections import deque
+from api_client import UnbelievaBoatAPI
+
+class ScriptedRequests:
+    """Replaces _request: the n-th call sleeps delays[n] and returns results[n], recording timeouts and cancellations"""
+
+    def __init__(self, *calls):
+        self.calls = calls
+        self.timeouts = []
+        self.cancelled = []
+
+    async def __call__(self, method, path, action, timeout=None):
+        index = len(self.timeouts)
+        self.timeouts.append(timeout)
+        delay, result = self.calls[index]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(index)
+            raise
+        return result
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv('UNBELIEVABOAT_API_TOKEN', 'test')
+    api = UnbelievaBoatAPI()
+    api._latency['get_balance'] = deque([0.05] * api.HEDGE_MIN_SAMPLES, maxlen=200)  # p95 of 50ms
+    return api
+
+def read(api, requests, timeout=1.0):
+    api._request = requests
+
+    async def scenario():
+        result = await api._hedged_read('guilds/1/users/2', 'get_balance', timeout)
+        await asyncio.sleep(0)  # Let a cancelled loser record its cancellation
+        return result
+
+    return asyncio.run(scenario())
+
+OK_FIRST, OK_SECOND = ({'cash': 1}, False), ({'cash': 2}, False)
+
+def test_fast_read_is_not_hedged(api):
+    requests = ScriptedRequests((0.01, OK_FIRST))
+    assert read(api, requests) == OK_FIRST
+    assert len(requests.timeouts) == 1
+    assert api.hedged == {}
+
+def test_no_hedge_until_enough_samples(api):
+    api._latency['get_balance'] = deque([0.05] * (api.HEDGE_MIN_SAMPLES - 1))
+    requests = ScriptedRequests((0.1, OK_FIRST))
+    assert read(api, requests) == OK_FIRST
+    assert len(requests.timeouts) == 1
+
+def test_no_hedge_when_p95_exceeds_the_budget(api):
+    requests = ScriptedRequests((0.1, OK_FIRST))
+    assert read(api, requests, timeout=0.04) == OK_FIRST
+    assert len(requests.timeouts) == 1
+
+def test_no_hedge_while_the_circuit_is_not_closed(api):
+    api.breaker.state = api.breaker.HALF_OPEN
+    requests = ScriptedRequests((0.1, OK_FIRST))
+    assert read(api, requests) == OK_FIRST
+    assert len(requests.timeouts) == 1
+
+def test_slow_read_is_hedged_and_the_duplicate_wins(api):
+    requests = ScriptedRequests((1.0, OK_FIRST), (0.01, OK_SECOND))
+    assert read(api, requests) == OK_SECOND
+    assert requests.cancelled == [0]
+    assert requests.timeouts == [1.0, pytest.approx(0.95)]  # The duplicate only gets what is left of the budget
+    assert api.hedged == {'sent': 1, 'won': 1}
+
+def test_original_can_still_win_after_hedging(api):
+    requests = ScriptedRequests((0.07, OK_FIRST), (1.0, OK_SECOND))
+    assert read(api, requests) == OK_FIRST
+    assert requests.cancelled == [1]
+    assert api.hedged == {'sent': 1}
+
+def test_failed_duplicate_waits_for_the_original(api):
+    requests = ScriptedRequests((0.1, OK_FIRST), (0.01, (None, True)))
+    assert read(api, requests) == OK_FIRST
+    assert requests.cancelled == []
+    assert api.hedged == {'sent': 1}
+
+def test_both_failing_returns_the_last_failure(api):
+    requests = ScriptedRequests((0.1, (None, False)), (0.01, (None, True)))
+    assert read(api, requests) == (None, False)
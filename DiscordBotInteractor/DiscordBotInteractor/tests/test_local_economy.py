@@ -0,0 +1,78 @@
+import asyncio
+import sqlite3
+import pytest
+from balances import BalanceTable
+from bet_ledger import BetLedger
+from local_economy import LocalEconomy, EconomyRouter
+
+class FakeRemote:
+    breaker = None
+    available = False
+
+    def __init__(self):
+        self.calls = []
+
+    async def get_balance(self, guild_id, user_id, timeout=None):
+        self.calls.append(('get_balance', guild_id, user_id))
+        return 0
+
+@pytest.fixture
+def economy(store):
+    economy = LocalEconomy(store)
+    economy.enable('1', True)
+    return economy
+
+def test_transfer_moves_cash_and_persists_it(store, economy):
+    store.write_balances([('1', 'victim', 500, 0)])
+    moved, victim, robber = asyncio.run(economy.transfer('1', 'victim', 'robber', 200))
+
+    assert moved == 200
+    assert victim['cash'] == 300 and robber['cash'] == 100 + 200  # The robber starts with the starting cash
+    assert store.get_balance('1', 'victim') == (300, 0)
+    assert store.get_balance('1', 'robber') == (300, 0)
+
+def test_transfer_is_capped_at_the_payers_cash(store, economy):
+    store.write_balances([('1', 'victim', 50, 1000)])
+    moved, victim, robber = asyncio.run(economy.transfer('1', 'victim', 'robber', 200))
+
+    assert moved == 50
+    assert (victim['cash'], victim['bank']) == (0, 1000)  # The bank is never robbed
+    assert robber['cash'] == 150
+
+def test_failed_write_leaves_balances_untouched(store, economy, monkeypatch):
+    store.write_balances([('1', 'victim', 500, 0)])
+    assert asyncio.run(economy.get_balance('1', 'victim')) == 500
+
+    def fail(balances):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(store, 'write_balances', fail)
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(economy.transfer('1', 'victim', 'robber', 200))
+
+    assert economy.cash('1', 'victim') == 500
+    assert economy.cash('1', 'robber') == 100
+    assert store.get_balance('1', 'robber') is None
+
+def test_balances_survive_a_restart(store, economy):
+    asyncio.run(economy.add_money('1', 'u', 25))
+    assert LocalEconomy(store).cash('1', 'u') == 125
+    assert LocalEconomy(store).guilds == {'1'}
+
+def test_router_keeps_local_guilds_off_the_remote_api(economy):
+    remote = FakeRemote()
+    router = EconomyRouter(remote, economy)
+
+    assert asyncio.run(router.get_balance('1', 'u')) == 100
+    assert asyncio.run(router.get_balance('2', 'u')) == 0
+    assert remote.calls == [('get_balance', '2', 'u')]
+    assert router.available_for('1') and not router.available_for('2')
+
+def test_bet_admission_reads_the_local_balance_not_the_cache(store, economy):
+    table = BalanceTable()
+    table.observe('1', 'u', 100)
+    ledger = BetLedger(EconomyRouter(FakeRemote(), economy), None, table)
+
+    store.add_to_balances([('1', 'u', 400)])  # e.g. a fight payout applied in FightStore.delete_fight
+    economy.forget('1', ['u'])
+    assert ledger.available('1', 'u') == 500
+    assert asyncio.run(ledger.withdraw('1', 'u', 450)) == (True, 50)
@@ -0,0 +1,148 @@
+import asyncio
+import outbound
+from outbound import OutboundScheduler, SETTLEMENT, CONFIRMATION, NARRATION
+
+class Channel:
+    """Records sent messages; sending 'first' blocks until release() so later messages pile up in the queue"""
+
+    def __init__(self, fail_on=None):
+        self.sent = []
+        self.fail_on = fail_on
+        self.gate = asyncio.Event()
+
+    async def send(self, content, **kwargs):
+        if content == 'first':
+            await self.gate.wait()
+        if content == self.fail_on:
+            raise RuntimeError('send failed')
+        self.sent.append(content)
+
+    def release(self):
+        self.gate.set()
+
+async def backlog(scheduler, channel, messages):
+    """Block the channel on a first message, queue the given (content, priority, merge_key), then let it drain"""
+    first = asyncio.create_task(scheduler.send(1, channel, 'first'))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(scheduler.send(1, channel, content, priority, merge_key)) for content, priority, merge_key in messages]
+    await asyncio.sleep(0)
+    channel.release()
+    results = await asyncio.gather(first, *tasks, return_exceptions=True)
+    return results[1:]
+
+def test_backlog_goes_out_by_priority_then_arrival():
+    async def scenario():
+        scheduler = OutboundScheduler()
+        channel = Channel()
+        results = await backlog(scheduler, channel, [
+            ('round 1', NARRATION, None),
+            ('result', CONFIRMATION, None),
+            ('payout', SETTLEMENT, None),
+            ('round 2', NARRATION, None),
+            ('refund', SETTLEMENT, None),
+        ])
+        return channel.sent, results, scheduler.snapshot()
+
+    sent, results, snapshot = asyncio.run(scenario())
+    assert sent == ['first', 'payout', 'refund', 'result', 'round 1', 'round 2']
+    assert results == [True] * 5
+    assert snapshot['queued'] == 0
+    assert snapshot['sent'] == {'confirmation': 2, 'settlement': 2, 'narration': 2}
+
+def test_narration_with_the_same_key_is_merged():
+    async def scenario():
+        scheduler = OutboundScheduler()
+        channel = Channel()
+        results = await backlog(scheduler, channel, [
+            ('fight A round 1', NARRATION, 'A'),
+            ('fight B round 1', NARRATION, 'B'),
+            ('fight A round 2', NARRATION, 'A'),
+        ])
+        return channel.sent, results, scheduler.snapshot()['merged']
+
+    sent, results, merged = asyncio.run(scenario())
+    assert sent == ['first', 'fight A round 1\nfight A round 2', 'fight B round 1']
+    assert results == [True, True, True]
+    assert merged == {'narration': 1}
+
+def test_merge_respects_the_message_limit(monkeypatch):
+    monkeypatch.setattr(outbound, 'MESSAGE_LIMIT', 10)
+
+    async def scenario():
+        channel = Channel()
+        await backlog(OutboundScheduler(), channel, [('12345', NARRATION, 'A'), ('67890', NARRATION, 'A')])
+        return channel.sent
+
+    assert asyncio.run(scenario()) == ['first', '12345', '67890']
+
+def test_full_queue_evicts_the_oldest_narration():
+    async def scenario():
+        scheduler = OutboundScheduler(max_depth=2)
+        channel = Channel()
+        results = await backlog(scheduler, channel, [
+            ('round 1', NARRATION, None),
+            ('round 2', NARRATION, None),
+            ('payout', SETTLEMENT, None),
+        ])
+        return channel.sent, results, scheduler.snapshot()['dropped']
+
+    sent, results, dropped = asyncio.run(scenario())
+    assert sent == ['first', 'payout', 'round 2']
+    assert results == [False, True, True]
+    assert dropped == {'narration': 1}
+
+def test_full_queue_never_drops_settlement():
+    async def scenario():
+        scheduler = OutboundScheduler(max_depth=1)
+        channel = Channel()
+        results = await backlog(scheduler, channel, [
+            ('payout', SETTLEMENT, None),
+            ('refund', SETTLEMENT, None),
+            ('round 1', NARRATION, None),
+        ])
+        return channel.sent, results
+
+    sent, results = asyncio.run(scenario())
+    assert sent == ['first', 'payout', 'refund']
+    assert results == [True, True, False]
+
+def test_stale_narration_is_dropped_when_it_surfaces():
+    async def scenario():
+        scheduler = OutboundScheduler(narration_ttl=0.05)
+        channel = Channel()
+        first = asyncio.create_task(scheduler.send(1, channel, 'first'))
+        await asyncio.sleep(0)
+        narration = asyncio.create_task(scheduler.send(1, channel, 'round 1', NARRATION))
+        result = asyncio.create_task(scheduler.send(1, channel, 'result', CONFIRMATION))
+        await asyncio.sleep(0.1)
+        channel.release()
+        return channel.sent, await asyncio.gather(first, narration, result)
+
+    sent, results = asyncio.run(scenario())
+    assert sent == ['first', 'result']
+    assert results == [True, False, True]
+
+def test_channels_are_queued_independently():
+    async def scenario():
+        scheduler = OutboundScheduler()
+        blocked, free = Channel(), Channel()
+        first = asyncio.create_task(scheduler.send(1, blocked, 'first'))
+        await asyncio.sleep(0)
+        other = await scheduler.send(2, free, 'elsewhere')
+        blocked.release()
+        await first
+        return other, free.sent, scheduler.snapshot()['busy_channels']
+
+    assert asyncio.run(scenario()) == (True, ['elsewhere'], 0)
+
+def test_send_errors_reach_the_caller_and_the_queue_moves_on():
+    async def scenario():
+        scheduler = OutboundScheduler()
+        channel = Channel(fail_on='bad')
+        results = await backlog(scheduler, channel, [('bad', CONFIRMATION, None), ('good', CONFIRMATION, None)])
+        return channel.sent, results
+
+    sent, results = asyncio.run(scenario())
+    assert sent == ['first', 'good']
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] is True
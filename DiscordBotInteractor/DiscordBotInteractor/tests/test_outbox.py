@@ -0,0 +1,104 @@
+import time
+import asyncio
+from circuit_breaker import CircuitBreaker
+from outbox import CreditOutbox
+
+class FakeAPI:
+    """Answers credit() with a scripted (data, transient) per user, recording every call"""
+
+    def __init__(self, outcomes=None):
+        self.breaker = CircuitBreaker('test')
+        self.outcomes = outcomes or {}
+        self.calls = []
+
+    async def credit(self, guild_id, user_id, amount, timeout=None):
+        self.calls.append((guild_id, user_id, amount))
+        outcome = self.outcomes.get(user_id, 'ok')
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome == 'ok':
+            return {'cash': amount}, False
+        return None, outcome
+
+def rows(store):
+    return {row['user_id']: row for row in store.conn.execute("SELECT * FROM credit_outbox")}
+
+def deliver(outbox, store):
+    return asyncio.run(outbox._deliver(store.due_credits(time.time(), outbox.batch_size)))
+
+def test_credits_for_one_user_are_merged_into_one_call(store):
+    api = FakeAPI()
+    delivered = []
+    outbox = CreditOutbox(store, api, on_delivered=lambda guild_id, user_id, data: delivered.append((user_id, data['cash'])))
+    store.add_credits([('1', 'a', 100, 'payout'), ('1', 'a', 50, 'refund'), ('1', 'b', 10, 'payout')])
+
+    assert deliver(outbox, store) == (3, 0, 0)
+    assert sorted(api.calls) == [('1', 'a', 150), ('1', 'b', 10)]
+    assert sorted(delivered) == [('a', 150), ('b', 10)]
+    assert rows(store) == {}
+    assert outbox.delivered == 3
+
+def test_transient_failure_is_retried_later_with_backoff(store):
+    api = FakeAPI({'a': True})
+    outbox = CreditOutbox(store, api, base_delay=5.0)
+    store.add_credits([('1', 'a', 100, 'payout'), ('1', 'a', 20, 'payout')])
+
+    before = time.time()
+    assert deliver(outbox, store) == (0, 2, 0)
+    pending = rows(store)['a']
+    assert pending['attempts'] == 1 and not pending['failed']
+    assert pending['last_error'] == 'unavailable'
+    assert pending['next_attempt_at'] >= before + 4.0  # base_delay less the jitter
+    assert store.due_credits(time.time(), 10) == []
+
+    # Once due again and the API is back, both rows go out as one credit
+    store.conn.execute("UPDATE credit_outbox SET next_attempt_at = 0")
+    api.outcomes = {}
+    assert deliver(outbox, store) == (2, 0, 0)
+    assert api.calls[-1] == ('1', 'a', 120)
+    assert rows(store) == {}
+
+def test_exception_counts_as_transient(store):
+    outbox = CreditOutbox(store, FakeAPI({'a': RuntimeError('boom')}))
+    store.add_credits([('1', 'a', 100, 'payout')])
+
+    assert deliver(outbox, store) == (0, 1, 0)
+    assert rows(store)['a']['last_error'] == 'boom'
+
+def test_rejected_and_ambiguous_credits_are_kept_as_failed(store):
+    outbox = CreditOutbox(store, FakeAPI({'a': False, 'b': None}))
+    store.add_credits([('1', 'a', 100, 'payout'), ('1', 'b', 50, 'payout'), ('1', 'c', 5, 'payout')])
+
+    assert deliver(outbox, store) == (1, 0, 2)
+    left = rows(store)
+    assert set(left) == {'a', 'b'}
+    assert left['a']['failed'] and left['a']['last_error'] == 'rejected by the API'
+    assert left['b']['failed'] and left['b']['last_error'] == 'outcome unknown'
+    assert store.due_credits(time.time(), 10) == []  # Never retried on their own
+    assert store.outbox_counts() == {'pending': 0, 'retrying': 0, 'failed': 2}
+
+def test_worker_delivers_queued_credits_and_stops(store):
+    api = FakeAPI()
+    outbox = CreditOutbox(store, api)
+
+    async def run():
+        outbox.start()
+        outbox.enqueue('1', 'a', 100, 'payout')
+        for _ in range(100):
+            if outbox.delivered:
+                break
+            await asyncio.sleep(0.01)
+        await outbox.stop()
+
+    asyncio.run(run())
+    assert api.calls == [('1', 'a', 100)]
+    assert rows(store) == {}
+
+def test_held_credits_wait_for_review(store):
+    api = FakeAPI()
+    outbox = CreditOutbox(store, api)
+    outbox.hold('1', 'a', 100, 'bet debit outcome unknown', 'outcome unknown')
+
+    assert store.due_credits(time.time(), 10) == []
+    assert store.outbox_counts() == {'pending': 0, 'retrying': 0, 'failed': 1}
+    assert rows(store)['a']['last_error'] == 'outcome unknown'
@@ -0,0 +1,104 @@
+import json
+import pytest
+import settings
+from settings import RuntimeSettings, SETTINGS
+
+@pytest.fixture
+def env(monkeypatch):
+    """Clear the runtime settings from the environment and serve .env from a dict the test controls"""
+    dotenv = {}
+    for name in SETTINGS:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(settings, 'dotenv_values', lambda: dict(dotenv))
+    return dotenv
+
+def write(path, values):
+    path.write_text(json.dumps(values), encoding='utf-8')
+    return str(path)
+
+def test_defaults_without_any_source(env, tmp_path):
+    runtime = RuntimeSettings(str(tmp_path / 'missing.json'))
+    assert runtime['ROUND_DELAY'] == 3.0
+    assert runtime['PLOCK_AMOUNT'] == (500, 10000)
+
+def test_environment_beats_dotenv_and_the_file_beats_both(env, tmp_path, monkeypatch):
+    env.update({'ROUND_DELAY': '1', 'NARRATION_DELAY': '2', 'COMMAND_TIMEOUT': '40'})
+    monkeypatch.setenv('ROUND_DELAY', '4')
+    monkeypatch.setenv('NARRATION_DELAY', '5')
+    runtime = RuntimeSettings(write(tmp_path / 'settings.json', {'NARRATION_DELAY': 6}))
+    assert runtime['COMMAND_TIMEOUT'] == 40
+    assert runtime['ROUND_DELAY'] == 4.0
+    assert runtime['NARRATION_DELAY'] == 6.0
+
+def test_ranges_parse_from_strings_and_lists(env, tmp_path):
+    env['PLOCK_AMOUNT'] = '100-200'
+    runtime = RuntimeSettings(write(tmp_path / 'settings.json', {'WOOZIE_AMOUNT': [10, 20]}))
+    assert runtime['PLOCK_AMOUNT'] == (100, 200)
+    assert runtime['WOOZIE_AMOUNT'] == (10, 20)
+
+@pytest.mark.parametrize('values, problem', [
+    ({'ROUND_DELAY': 31}, 'ROUND_DELAY must be between'),
+    ({'MAX_FIGHTS_PER_CHANNEL': -1}, 'MAX_FIGHTS_PER_CHANNEL must be between'),
+    ({'COMMAND_TIMEOUT': 'soon'}, "COMMAND_TIMEOUT: can't read"),
+    ({'PLOCK_AMOUNT': [200, 100]}, 'PLOCK_AMOUNT: the low end is above the high end'),
+    ({'NOT_A_SETTING': 1}, 'NOT_A_SETTING is not a runtime setting'),
+])
+def test_invalid_values_are_rejected(env, tmp_path, values, problem):
+    with pytest.raises(ValueError, match=problem):
+        RuntimeSettings(write(tmp_path / 'settings.json', values))
+
+def test_every_problem_is_reported_at_once(env, tmp_path):
+    with pytest.raises(ValueError) as error:
+        RuntimeSettings(write(tmp_path / 'settings.json', {'ROUND_DELAY': -1, 'COMMAND_TIMEOUT': 0}))
+    assert 'ROUND_DELAY' in str(error.value) and 'COMMAND_TIMEOUT' in str(error.value)
+
+def test_reload_applies_changes_and_notifies_listeners(env, tmp_path):
+    path = tmp_path / 'settings.json'
+    runtime = RuntimeSettings(write(path, {'ROUND_DELAY': 1}))
+    notified = []
+    runtime.on_change(notified.append)
+
+    write(path, {'ROUND_DELAY': 2, 'MAX_FIGHTS_PER_CHANNEL': 3})
+    assert runtime.reload() == {'ROUND_DELAY': 2.0, 'MAX_FIGHTS_PER_CHANNEL': 3}
+    assert runtime['ROUND_DELAY'] == 2.0
+    assert notified == [{'ROUND_DELAY': 2.0, 'MAX_FIGHTS_PER_CHANNEL': 3}]
+
+    assert runtime.reload() == {}
+    assert len(notified) == 1
+    assert runtime.snapshot()['reloads'] == 2
+
+def test_removed_dotenv_line_falls_back_to_the_default(env, tmp_path):
+    env['ROUND_DELAY'] = '1'
+    runtime = RuntimeSettings(str(tmp_path / 'missing.json'))
+    assert runtime['ROUND_DELAY'] == 1.0
+    env.clear()
+    assert runtime.reload() == {'ROUND_DELAY': 3.0}
+
+@pytest.mark.parametrize('contents', ['{"ROUND_DELAY": 99}', '{not json', '[1, 2]'])
+def test_bad_reload_leaves_the_running_values(env, tmp_path, contents):
+    path = tmp_path / 'settings.json'
+    runtime = RuntimeSettings(write(path, {'ROUND_DELAY': 1}))
+    notified = []
+    runtime.on_change(notified.append)
+
+    path.write_text(contents, encoding='utf-8')
+    with pytest.raises(ValueError):
+        runtime.reload()
+    assert runtime['ROUND_DELAY'] == 1.0
+    assert notified == []
+    assert runtime.snapshot()['reloads'] == 0
+
+def test_a_failing_listener_does_not_block_the_others(env, tmp_path):
+    path = tmp_path / 'settings.json'
+    runtime = RuntimeSettings(write(path, {}))
+    notified = []
+
+    def broken(changed):
+        raise RuntimeError('boom')
+
+    runtime.on_change(broken)
+    runtime.on_change(notified.append)
+    write(path, {'NARRATION_TTL': 5})
+    runtime.reload()
+    assert runtime['NARRATION_TTL'] == 5.0
+    assert notified == [{'NARRATION_TTL': 5.0}]
@@ -0,0 +1,114 @@
+import os
+import asyncio
+import importlib
+import pytest
+
+@pytest.fixture(scope='module')
+def bot_automation(tmp_path_factory):
+    """Import the bot module against throwaway credentials, with its logs and fight database in a temp dir"""
+    workdir = tmp_path_factory.mktemp('bot')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('DISCORD_TOKEN', 'test')
+        patch.setenv('UNBELIEVABOAT_API_TOKEN', 'test')
+        patch.setenv('FIGHT_DB_PATH', str(workdir / 'fights.db'))
+        patch.chdir(workdir)
+        module = importlib.import_module('bot_automation')
+        yield module
+
+class FakeResponse:
+    def __init__(self, replies):
+        self.replies = replies
+
+    async def send_message(self, content, **kwargs):
+        self.replies.append(content)
+
+@pytest.fixture
+def gate(bot_automation, monkeypatch):
+    """Run an interaction payload through the gate; returns (parsed payloads, notices sent back)"""
+    parsed, replies = [], []
+
+    class FakeInteraction:
+        def __init__(self, data, state):
+            self.response = FakeResponse(replies)
+
+    monkeypatch.setattr(bot_automation.discord, 'Interaction', FakeInteraction)
+
+    async def make_bot():
+        bot = bot_automation.AutomationBot(bot_automation.load_config())
+        bot._parse_interaction_create = parsed.append
+        return bot
+
+    def run(configure, payloads):
+        async def scenario():
+            bot = await make_bot()
+            configure(bot)
+            for data in payloads:
+                bot._gate_interaction_create(data)
+            await asyncio.gather(*bot._gate_tasks)
+            return bot
+
+        bot = asyncio.run(scenario())
+        return [data['id'] for data in parsed], replies, bot._gate_rejected
+
+    return run
+
+def command(id, name, guild_id='1'):
+    return {'id': id, 'type': 2, 'guild_id': guild_id, 'data': {'name': name}}
+
+def button(id, guild_id='1'):
+    return {'id': id, 'type': 3, 'guild_id': guild_id, 'data': {'custom_id': 'accept'}}
+
+def autocomplete(id, guild_id='1'):
+    return {'id': id, 'type': 4, 'guild_id': guild_id, 'data': {'name': 'fight'}}
+
+def test_awake_bot_parses_everything(gate):
+    parsed, replies, rejected = gate(lambda bot: None, [command('a', 'fight'), button('b'), autocomplete('c')])
+    assert parsed == ['a', 'b', 'c']
+    assert replies == []
+    assert rejected == 0
+
+def test_sleeping_bot_only_runs_exempt_commands(gate, bot_automation):
+    exempt = [command(name, name) for name in sorted(bot_automation.GATE_EXEMPT_COMMANDS)]
+    parsed, replies, rejected = gate(lambda bot: bot.set_sleep(True),
+                                     [command('fight', 'fight'), button('button'), autocomplete('autocomplete')] + exempt)
+    assert parsed == sorted(bot_automation.GATE_EXEMPT_COMMANDS)
+    assert len(replies) == 2 and all(reply.startswith('💤') for reply in replies)
+    assert rejected == 3  # Autocomplete is refused without a reply
+
+def test_exemption_is_by_command_not_by_component(gate):
+    # A button whose custom_id happens to match an exempt command is still refused
+    data = {'id': 'x', 'type': 3, 'guild_id': '1', 'data': {'custom_id': 'settings', 'name': 'settings'}}
+    parsed, replies, _ = gate(lambda bot: bot.set_sleep(True), [data])
+    assert parsed == []
+    assert len(replies) == 1
+
+def test_sleeping_guild_leaves_other_guilds_running(gate):
+    parsed, replies, rejected = gate(lambda bot: bot.set_sleep(True, 1), [
+        command('asleep', 'fight', '1'),
+        command('awake', 'fight', '2'),
+        command('exempt', 'active', '1'),
+        button('dm', None),
+    ])
+    assert parsed == ['awake', 'exempt', 'dm']
+    assert rejected == 1
+
+def test_waking_reopens_the_gate(gate):
+    def configure(bot):
+        bot.set_sleep(True)
+        bot.set_sleep(True, 1)
+        bot.set_sleep(False)
+        bot.set_sleep(False, 1)
+
+    parsed, replies, _ = gate(configure, [command('a', 'fight'), button('b')])
+    assert parsed == ['a', 'b']
+    assert replies == []
+
+def test_draining_refuses_even_exempt_commands(gate):
+    def configure(bot):
+        bot.draining = True
+        bot._update_gate()
+
+    parsed, replies, rejected = gate(configure, [command('a', 'settings'), command('b', 'fight')])
+    assert parsed == []
+    assert len(replies) == 2 and all(reply.startswith('🔄') for reply in replies)
+    assert rejected == 2
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import contextlib
+import contextvars
+import itertools
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger('BotAutomation.Tracing')
+
+# Offset that turns perf_counter() readings into Unix time, so Discord's interaction timestamps share the timeline
+_EPOCH = time.time() - time.perf_counter()
+
+class _Trace:
+    __slots__ = ('trace_id', 'name', 'sampled', 'events')
+
+    def __init__(self, trace_id: int, name: str, sampled: bool):
+        self.trace_id = trace_id
+        self.name = name
+        self.sampled = sampled
+        self.events: List[Dict[str, Any]] = []
+
+_current: contextvars.ContextVar[Optional[_Trace]] = contextvars.ContextVar('trace', default=None)
+
+class Tracer:
+    """
+    Per-interaction tracing written as a Chrome trace file.
+
+    Each traced interaction gets a root span with child spans for the
+    UnbelievaBoat calls, Discord sends and scripted sleeps made on its behalf
+    (the current trace follows the handler through asyncio context). Spans
+    are buffered until the interaction finishes; a sampled interaction, or
+    one slower than slow_threshold, is then appended to the trace file as
+    complete ("X") events with one row per interaction. The file is in
+    Chrome's JSON array format and opens in Perfetto or chrome://tracing.
+    """
+
+    def __init__(self, path: str = 'traces.json', sample_rate: float = 0.0, slow_threshold: float = 0.0):
+        """
+        Args:
+            path (str): Trace file that events are appended to
+            sample_rate (float): Share of interactions written (0 disables tracing unless slow_threshold is set)
+            slow_threshold (float): Seconds after which an unsampled interaction is written anyway (0 = never)
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self._ids = itertools.count(1)
+        self._file = None
+        self.written = Counter()  # root span name -> traces written
+
+    def configure(self, path: str, sample_rate: float, slow_threshold: float):
+        """Apply the TRACE_* settings; the shared tracer starts out disabled"""
+        self.close()
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_threshold > 0
+
+    @contextlib.asynccontextmanager
+    async def interaction(self, name: str, interaction=None):
+        """Trace a handler as the root span; the time Discord took to deliver the interaction is its first child"""
+        if not self.enabled or _current.get() is not None:
+            yield
+            return
+
+        trace = _Trace(next(self._ids), name, random.random() < self.sample_rate)
+        token = _current.set(trace)
+        started = time.perf_counter()
+        if interaction is not None:
+            created = interaction.created_at.timestamp() - _EPOCH
+            self._event(trace, 'discord delivery', 'discord', min(created, started), started, {})
+        try:
+            yield
+        finally:
+            _current.reset(token)
+            ended = time.perf_counter()
+            args = {'interaction_id': str(interaction.id)} if interaction is not None else {}
+            self._event(trace, name, 'interaction', started, ended, args)
+            if trace.sampled or (self.slow_threshold and ended - started >= self.slow_threshold):
+                self._write(trace)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args):
+        """
+        Time a block as a child span of the current interaction; does nothing outside a traced one.
+        Yields the span's args so the block can add what it learns (e.g. a response status).
+        """
+        trace = _current.get()
+        if trace is None:
+            yield args
+            return
+        started = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self._event(trace, name, category, started, time.perf_counter(), args)
+
+    def record(self, trace: Optional[_Trace], name: str, category: str, started: float, ended: float, **args):
+        """Add a span timed elsewhere (e.g. a message sent by a queue worker) to a trace taken with current()"""
+        if trace is not None:
+            self._event(trace, name, category, started, ended, args)
+
+    def current(self) -> Optional[_Trace]:
+        return _current.get()
+
+    def _event(self, trace: _Trace, name: str, category: str, started: float, ended: float, args: Dict):
+        trace.events.append({
+            'name': name, 'cat': category, 'ph': 'X',
+            'ts': round((started + _EPOCH) * 1e6), 'dur': round((ended - started) * 1e6),
+            'pid': os.getpid(), 'tid': trace.trace_id, 'args': args,
+        })
+
+    def _write(self, trace: _Trace):
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+                if self._file.tell() == 0:
+                    self._file.write('[\n')  # The closing bracket is optional in the JSON array format
+            # Label the interaction's row, then its spans, in one write
+            lines = [json.dumps({
+                'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': trace.trace_id,
+                'args': {'name': f"{trace.name} #{trace.trace_id}"},
+            })]
+            lines.extend(json.dumps(event) for event in trace.events)
+            self._file.write(',\n'.join(lines) + ',\n')
+            self._file.flush()
+            self.written[trace.name] += 1
+        except OSError as e:
+            logger.error(f"Could not write trace to {self.path}: {str(e)}")
+
+    async def sleep(self, delay: float, result=None):
+        """asyncio.sleep for scripted pauses (fight rounds, robbery narration), traced as a span"""
+        with self.span('sleep', 'sleep', seconds=delay):
+            return await asyncio.sleep(delay, result)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def snapshot(self):
+        return {'enabled': self.enabled, 'sample_rate': self.sample_rate, 'written': dict(self.written)}
+
+tracer = Tracer()
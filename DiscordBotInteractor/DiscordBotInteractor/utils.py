@@ -3,10 +3,13 @@ import asyncio
 import random
 from datetime import datetime
 import discord
-from discord import app_commands
 import sys
 import traceback
 import os
+import functools
+from collections import Counter, deque
+from tracing import tracer
+from settings import settings
 
 def setup_logging():
     """Setup logging configuration"""
@@ -52,15 +55,195 @@ def setup_logging():
     
     return logger
 
+class LatencyBudget:
+    """
+    Tracks how close each handler comes to Discord's 3-second interaction
+    deadline, measured when the handler first acknowledges the interaction.
+    """
+    DEADLINE = 3.0
+    NEAR_MISS = 2.0
+    ACK_MARGIN = 0.5  # Kept back from the deadline for the acknowledgement itself
+    RESPONSE_BUDGET = 10.0  # Seconds a deferred command may spend on remote calls before giving up
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._samples = {}  # handler -> deque of seconds from interaction creation to acknowledgement
+        self._near_misses = Counter()
+        self._missed = Counter()
+
+    def record(self, handler: str, interaction: discord.Interaction) -> float:
+        elapsed = max(0.0, (discord.utils.utcnow() - interaction.created_at).total_seconds())
+        samples = self._samples.get(handler)
+        if samples is None:
+            samples = self._samples[handler] = deque(maxlen=self.window)
+        samples.append(elapsed)
+
+        if elapsed >= self.DEADLINE:
+            self._missed[handler] += 1
+            logging.getLogger('BotAutomation.LatencyBudget').warning(f"{handler} acknowledged after {elapsed:.2f}s, past the {self.DEADLINE:.0f}s deadline")
+        elif elapsed >= self.NEAR_MISS:
+            self._near_misses[handler] += 1
+        return elapsed
+
+    def remaining(self, interaction: discord.Interaction) -> float:
+        """
+        Seconds left for remote calls made on behalf of an interaction: what's left of
+        the 3-second window while it is unacknowledged, else of RESPONSE_BUDGET
+        """
+        elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        if not interaction.response.is_done():
+            return self.DEADLINE - self.ACK_MARGIN - elapsed
+        return self.RESPONSE_BUDGET - elapsed
+
+    def snapshot(self):
+        """Per-handler percentiles and remaining headroom, for the metrics endpoint"""
+        report = {}
+        for handler, samples in self._samples.items():
+            ordered = sorted(samples)
+            report[handler] = {
+                'count': len(ordered),
+                'p50': round(ordered[len(ordered) // 2], 3),
+                'p99': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+                'max': round(ordered[-1], 3),
+                'min_headroom': round(self.DEADLINE - ordered[-1], 3),
+                'near_misses': self._near_misses[handler],
+                'missed': self._missed[handler],
+            }
+        return report
+
+latency_budget = LatencyBudget()
+
+async def defer_interaction(interaction: discord.Interaction, handler: str, ephemeral: bool = False):
+    """
+    Acknowledge an interaction before doing slow economy work, then finish with respond().
+
+    Slash commands show a "thinking" message that the first respond() replaces;
+    component and modal interactions are acknowledged silently.
+    """
+    latency_budget.record(handler, interaction)
+    with tracer.span('discord defer', 'discord'):
+        if interaction.type == discord.InteractionType.application_command:
+            await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+            interaction.extras['deferred_thinking'] = not ephemeral
+        else:
+            await interaction.response.defer()
+
+async def respond(interaction: discord.Interaction, content: str, ephemeral: bool = False):
+    """Reply to an interaction whether or not it was deferred with defer_interaction"""
+    with tracer.span('discord respond', 'discord'):
+        await _respond(interaction, content, ephemeral)
+
+async def _respond(interaction: discord.Interaction, content: str, ephemeral: bool):
+    if not interaction.response.is_done():
+        latency_budget.record(interaction.command.name if interaction.command else 'component', interaction)
+        await interaction.response.send_message(content, ephemeral=ephemeral)
+    elif ephemeral and interaction.extras.pop('deferred_thinking', False):
+        # A public "thinking" message can't become ephemeral; drop it and reply privately
+        await interaction.delete_original_response()
+        await interaction.followup.send(content, ephemeral=True)
+    else:
+        interaction.extras.pop('deferred_thinking', None)
+        await interaction.followup.send(content, ephemeral=ephemeral)
+
+def inflight(name):
+    """
+    Mark a command or component callback as in-flight work that a graceful
+    drain must wait for (see AutomationBot.drain_and_shutdown), traced as an
+    interaction when sampled.
+
+    Must be the innermost decorator so app_commands still sees the original signature.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = next(arg for arg in args if isinstance(arg, discord.Interaction))
+            async with interaction.client.track_inflight(name), tracer.interaction(name, interaction):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def get_rss_bytes():
+    """Current resident set size of this process, or peak RSS where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def estimate_guild_memory(guild):
+    """Approximate the cache footprint of a guild (shallow sizes of its cached objects)"""
+    members = list(guild._members.values())
+    member_bytes = sum(sys.getsizeof(member) + sys.getsizeof(member._roles) for member in members)
+    role_bytes = sum(sys.getsizeof(role) for role in guild.roles)
+    channel_bytes = sum(sys.getsizeof(channel) for channel in guild.channels)
+    return {
+        'guild_id': str(guild.id),
+        'name': guild.name,
+        'member_count': guild.member_count,
+        'cached_members': len(members),
+        'chunked': guild.chunked,
+        'roles': len(guild.roles),
+        'channels': len(guild.channels),
+        'approx_bytes': member_bytes + role_bytes + channel_bytes,
+    }
+
+class ResponseWaiters:
+    """
+    Pending waits for a message from one author in one channel.
+
+    Waiters are indexed by (channel ID, author ID), so each incoming message
+    costs one dict lookup instead of running every pending wait_for check.
+    Concurrent waits on the same key are answered in the order they started.
+    """
+
+    def __init__(self, bot):
+        self._waiters = {}  # (channel_id, author_id) -> deque of futures
+        bot.add_listener(self.on_message, 'on_message')
+
+    def __len__(self):
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def on_message(self, message):
+        waiters = self._waiters.get((message.channel.id, message.author.id))
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(message)
+                break
+        if waiters is not None and not waiters:
+            del self._waiters[(message.channel.id, message.author.id)]
+
+    async def wait(self, channel_id, author_id, timeout):
+        """The next message from author_id in channel_id; raises asyncio.TimeoutError"""
+        key = (channel_id, author_id)
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.get(key)
+        if waiters is None:
+            waiters = self._waiters[key] = deque()
+        waiters.append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[key]
+
 class CommandExecutor:
     def __init__(self, bot):
         self.bot = bot
         self.logger = logging.getLogger('BotAutomation.CommandExecutor')
+        # One registry per bot, shared by every executor
+        self.waiters = getattr(bot, 'response_waiters', None)
+        if self.waiters is None:
+            self.waiters = bot.response_waiters = ResponseWaiters(bot)
 
     async def execute_slash_command(self, channel, command, options=None, delay=None):
         """Execute a command using Discord's slash command system"""
         if delay is None:
-            delay = float(self.bot.config['DEFAULT_DELAY'])
+            delay = settings['DEFAULT_DELAY']
 
         try:
             self.logger.info(f"Starting command execution in channel: {channel.name} ({channel.id})")
@@ -79,8 +262,8 @@ class CommandExecutor:
 
                     # Get the command tree for the target bot
                     try:
-                        # Create a slash command interaction
-                        command = await app_commands.CommandTree(self.bot).get_command("remove-money")
+                        # Look the command up in the bot's own tree (a client can only have one)
+                        command = self.bot.tree.get_command("remove-money")
                         if command:
                             self.logger.info(f"Found remove-money command: {command}")
 
@@ -129,21 +312,10 @@ class CommandExecutor:
     async def wait_for_response(self, channel, timeout=None):
         """Wait for a response from the target bot"""
         if timeout is None:
-            timeout = int(self.bot.config['COMMAND_TIMEOUT'])
+            timeout = settings['COMMAND_TIMEOUT']
 
         try:
-            def check(message):
-                return (
-                    message.channel.id == channel.id and
-                    message.author.id == int(self.bot.config['TARGET_BOT_ID'])
-                )
-
-            response = await self.bot.wait_for(
-                'message',
-                check=check,
-                timeout=timeout
-            )
-            return response
+            return await self.waiters.wait(channel.id, int(self.bot.config['TARGET_BOT_ID']), timeout)
 
         except asyncio.TimeoutError:
             self.logger.warning(f"Timeout waiting for response in channel {channel.id}")
@@ -0,0 +1,147 @@
+import time
+import asyncio
+import inspect
+import logging
+import tracemalloc
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Union
+from utils import get_rss_bytes
+
+logger = logging.getLogger('BotAutomation.Watchdog')
+
+class StateWatchdog:
+    """
+    Keeps an eye on the bot's long-lived state.
+
+    Every interval it records the size of each tracked structure (active
+    fights, bet books, balance table, queues...) next to the process RSS,
+    and runs the registered sweeps that clear out entries which outlived
+    their purpose, e.g. fights stuck past their maximum age. The history
+    shows which structure grows along with RSS. For leaks outside the
+    tracked state, tracemalloc can be started and diffed on demand.
+    """
+    HISTORY = 48  # Checks kept for the growth report
+
+    def __init__(self, interval: float = 300.0):
+        """
+        Args:
+            interval (float): Seconds between checks (0 = only when asked)
+        """
+        self.interval = interval
+        self._sizes: Dict[str, Callable[[], int]] = {}
+        self._sweeps: Dict[str, Callable[[], Union[int, Awaitable[int]]]] = {}
+        self.swept: Dict[str, int] = {}  # sweep name -> entries removed since startup
+        self.history = deque(maxlen=self.HISTORY)  # (time, rss bytes, sizes)
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def track(self, name: str, size: Callable[[], int]):
+        """Report size() under name on every check"""
+        self._sizes[name] = size
+
+    def add_sweep(self, name: str, sweep: Callable[[], Union[int, Awaitable[int]]]):
+        """Run sweep() on every check; it returns how many entries it removed"""
+        self._sweeps[name] = sweep
+        self.swept.setdefault(name, 0)
+
+    def sizes(self) -> Dict[str, int]:
+        sizes = {}
+        for name, size in self._sizes.items():
+            try:
+                sizes[name] = size()
+            except Exception as e:
+                logger.warning(f"Could not measure {name}: {str(e)}")
+        return sizes
+
+    async def check(self) -> Dict[str, int]:
+        """Run the sweeps, then record sizes and RSS; returns what each sweep removed"""
+        removed = {}
+        for name, sweep in self._sweeps.items():
+            try:
+                count = sweep()
+                if inspect.isawaitable(count):
+                    count = await count
+            except Exception as e:
+                logger.error(f"Sweep {name} failed: {str(e)}")
+                continue
+            removed[name] = count
+            self.swept[name] += count
+            if count:
+                logger.info(f"Sweep {name} removed {count} stale entries")
+
+        rss = get_rss_bytes()
+        self.history.append((time.time(), rss, self.sizes()))
+        logger.info(f"Watchdog: RSS {rss / 2**20:.1f} MiB, {self.history[-1][2]}")
+        return removed
+
+    def start(self):
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Watchdog check failed: {str(e)}")
+
+    def start_tracemalloc(self, frames: int = 10) -> bool:
+        """Start tracing allocations and take the baseline; False if already tracing"""
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(frames)
+        self._baseline = self._take_snapshot()
+        logger.warning(f"tracemalloc started with {frames} frames per allocation")
+        return True
+
+    def tracemalloc_diff(self, limit: int = 25) -> Optional[str]:
+        """
+        Compare allocations now with the previous snapshot, which this one then replaces
+
+        Returns:
+            Optional[str]: The largest changes by source line, or None when not tracing
+        """
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = self._take_snapshot()
+        stats = snapshot.compare_to(self._baseline, 'lineno') if self._baseline else snapshot.statistics('lineno')
+        self._baseline = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory {current / 2**20:.1f} MiB (peak {peak / 2**20:.1f} MiB); top {limit} changes since the last snapshot:"]
+        lines.extend(str(stat) for stat in stats[:limit])
+        return '\n'.join(lines) + '\n'
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    def stop_tracemalloc(self) -> bool:
+        if not tracemalloc.is_tracing():
+            return False
+        tracemalloc.stop()
+        self._baseline = None
+        return True
+
+    def snapshot(self):
+        report = {
+            'sizes': self.sizes(),
+            'swept': dict(self.swept),
+            'tracemalloc': tracemalloc.is_tracing(),
+        }
+        if len(self.history) >= 2:
+            (first_at, first_rss, first_sizes), (last_at, last_rss, last_sizes) = self.history[0], self.history[-1]
+            report['growth'] = {
+                'hours': round((last_at - first_at) / 3600, 2),
+                'rss_bytes': last_rss - first_rss,
+                'sizes': {name: size - first_sizes.get(name, 0) for name, size in last_sizes.items()},
+            }
+        return report